@@ -1,6 +1,6 @@
 import streamlit as st
 import requests
-import time
+import json
 import os
 
 # Configuration
@@ -25,38 +25,35 @@ with st.sidebar:
                     job_id = response.json()["job_id"]
                     st.success(f"Job Started! ID: {job_id}")
                     
-                    # 2. The Polling Loop (The 'Loading Bar' Logic)
+                    # 2. The Progress Stream (Server-Sent Events, no polling)
                     progress_bar = st.progress(0)
                     status_area = st.empty()
-                    
-                    while True:
-                        time.sleep(0.5) # Poll every 500ms
-                        
-                        status_res = requests.get(f"{API_URL}/status/{job_id}")
-                        if status_res.status_code != 200:
-                            st.error("Lost connection to server.")
-                            break
-                            
-                        job_data = status_res.json()
-                        state = job_data["status"]
-                        logs = job_data.get("log", [])
-                        current_log = logs[-1] if logs else "Starting..."
-                        
-                        # Update UI
-                        status_area.code(f"Status: {state.upper()}\nLatest: {current_log}")
-                        
-                        # Progress bar logic (Simple estimation or real count)
-                        # Since we track chunks, let's just show activity
-                        # or map 0-100 if we knew the total.
-                        
-                        if state == "completed":
-                            progress_bar.progress(100)
-                            st.balloons()
-                            st.success("Indexing Complete!")
-                            break
-                        elif state == "failed":
-                            st.error(f"Job Failed: {job_data.get('error')}")
-                            break
+
+                    job_data = None
+                    with requests.get(f"{API_URL}/status/{job_id}/events", stream=True, timeout=(5, None)) as stream:
+                        event_type = None
+                        for line in stream.iter_lines(decode_unicode=True):
+                            if line.startswith("event:"):
+                                event_type = line[len("event:"):].strip()
+                            elif line.startswith("data:"):
+                                data = json.loads(line[len("data:"):])
+                                if event_type == "end":
+                                    job_data = data
+                                    break
+                                # Only new events arrive, each carrying a real page-based percent
+                                if data.get("stage") == "INDEXING" and data.get("percent") is not None:
+                                    progress_bar.progress(int(data["percent"]))
+                                status_area.code(f"Status: PROCESSING\nLatest: {data['message']}")
+
+                    if job_data is None:
+                        st.error("Lost connection to server.")
+                    elif job_data["status"] == "completed":
+                        progress_bar.progress(100)
+                        status_area.code(f"Status: COMPLETED\nLatest: {job_data.get('latest')}")
+                        st.balloons()
+                        st.success("Indexing Complete!")
+                    else:
+                        st.error(f"Job Failed: {job_data.get('error')}")
                             
                 else:
                     st.error(f"Upload failed: {response.text}")
@@ -80,18 +77,31 @@ if prompt := st.chat_input("Ask about the report..."):
     with st.chat_message("user"):
         st.write(prompt)
 
-    # Call API
+    # Call API (streamed: tokens are rendered as they arrive)
     with st.chat_message("assistant"):
-        with st.spinner("Waiting for Server..."):
-            try:
-                payload = {"question": prompt}
-                res = requests.post(f"{API_URL}/chat", json=payload)
-                
+        try:
+            payload = {"question": prompt}
+            sources = []
+
+            def token_stream(res):
+                for line in res.iter_lines(decode_unicode=True):
+                    if not line:
+                        continue
+                    event = json.loads(line)
+                    if event["type"] == "sources":
+                        sources.extend(event["sources"])
+                    elif event["type"] == "token":
+                        yield event["text"]
+                    elif event["type"] == "error":
+                        st.error(f"API Error: {event['error']}")
+
+            with requests.post(f"{API_URL}/chat/stream", json=payload, stream=True, timeout=(5, None)) as res:
                 if res.status_code == 200:
-                    answer = res.json()["answer"]
-                    st.write(answer)
+                    answer = st.write_stream(token_stream(res))
+                    if sources:
+                        st.caption("Sources: " + ", ".join(f"[{s['n']}] {s['source']} p.{s['page']}" for s in sources))
                     st.session_state.messages.append({"role": "assistant", "content": answer})
                 else:
                     st.error(f"API Error: {res.text}")
-            except Exception as e:
-                st.error(f"Connection Error: {e}")
\ No newline at end of file
+        except Exception as e:
+            st.error(f"Connection Error: {e}")
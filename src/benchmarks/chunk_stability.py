@@ -0,0 +1,54 @@
+"""
+How much a re-ingest re-embeds after a small edit. Chunks the synthetic 10-K, adds one
+sentence to --edit-page and chunks it again; every chunk id not in the first run
+is a chunk the re-ingest embeds again. Runs once per --anchor-pages value
+(0 = greedy packing across the whole document).
+
+    python -m benchmarks.chunk_stability --pages 300 --edit-page 3 --anchor-pages 0 2 4 8
+"""
+import argparse
+import json
+from benchmarks.synthetic_pdf import page_texts
+from data_pipeline.chunking import Chunker, load_tokenizer
+from config import EMBED_BATCH_SIZE
+
+EDIT = "Management does not expect this change to have a material effect on the consolidated results."
+
+def pages_of(texts: list[str]) -> list[dict]:
+    return [{"source": "synthetic-10k.pdf", "page_number": n + 1, "content": text} for n, text in enumerate(texts)]
+
+def run(texts: list[str], edited: list[str], anchor_pages: int) -> dict:
+    chunker = Chunker(anchor_pages=anchor_pages)
+    before = [c["chunk_id"] for c in chunker.process(iter(pages_of(texts)), "bench")]
+    after = [c["chunk_id"] for c in chunker.process(iter(pages_of(edited)), "bench")]
+    reembedded = len(set(after) - set(before))
+    return {
+        "chunks": len(before),
+        "embed_calls": -(-len(before) // EMBED_BATCH_SIZE),
+        "reembedded_chunks": reembedded,
+        "reembedded_share": round(reembedded / len(after), 4),
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--edit-page", type=int, default=3)
+    parser.add_argument("--anchor-pages", type=int, nargs="+", default=[0, 2, 4, 8])
+    args = parser.parse_args()
+
+    tokenizer = "tiktoken" if load_tokenizer() else "~4 chars/token"
+    texts = page_texts(args.pages)
+    edited = list(texts)
+    # Mid-page, after the first paragraph: shifts everything packed after it
+    head, sep, tail = edited[args.edit_page - 1].partition("\n\n")
+    edited[args.edit_page - 1] = head + sep + EDIT + " " + tail
+
+    print(f"✂️  {args.pages} pages, one sentence added to page {args.edit_page}, tokens: {tokenizer}")
+    report = {}
+    for anchor_pages in args.anchor_pages:
+        report[f"anchor_pages={anchor_pages}"] = result = run(texts, edited, anchor_pages)
+        print(f"  anchor_pages={anchor_pages:<3} " + "  ".join(f"{key}={value}" for key, value in result.items()))
+    print(json.dumps(report))
+
+if __name__ == "__main__":
+    main()
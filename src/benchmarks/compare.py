@@ -0,0 +1,39 @@
+"""
+Side-by-side diff of two benchmark result files (e.g. before/after a commit).
+
+    python -m benchmarks.compare benchmarks/results/OLD.json benchmarks/results/NEW.json
+"""
+import json
+import sys
+
+def flatten(value, prefix: str = "") -> dict:
+    """Numeric leaves only, keyed by path: {"chat.p95_ms": 412.0, "ingest.1.pages_per_sec": ...}."""
+    if isinstance(value, dict):
+        items = value.items()
+    elif isinstance(value, list):
+        items = enumerate(value)
+    else:
+        is_number = isinstance(value, (int, float)) and not isinstance(value, bool)
+        return {prefix: value} if is_number else {}
+    flat = {}
+    for key, item in items:
+        flat.update(flatten(item, f"{prefix}.{key}" if prefix else str(key)))
+    return flat
+
+def compare(old: dict, new: dict) -> list[tuple[str, float, float, float | None]]:
+    a, b = flatten({k: v for k, v in old.items() if k != "meta"}), flatten({k: v for k, v in new.items() if k != "meta"})
+    return [
+        (name, a[name], b[name], (b[name] - a[name]) / a[name] * 100 if a[name] else None)
+        for name in a if name in b
+    ]
+
+if __name__ == "__main__":
+    old_path, new_path = sys.argv[1:3]
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    print(f"{old['meta']['commit']} -> {new['meta']['commit']}")
+    for name, before, after, change in compare(old, new):
+        delta = f"{change:+.1f}%" if change is not None else "n/a"
+        print(f"  {name:<45} {before:>12} {after:>12} {delta:>9}")
@@ -0,0 +1,68 @@
+"""
+Recall@k and query latency per stored dimension, with and without re-ranking
+by the full-precision side store. Ground truth is exact search over the full
+vectors. Runs offline: synthetic Matryoshka-like vectors (variance decaying
+along the dimensions, as in trained embeddings), or --from-store for the
+full vectors already indexed.
+
+    python -m benchmarks.dimensions --vectors 20000 --dims 256 512 768 1536
+"""
+import argparse
+import json
+import tempfile
+from pathlib import Path
+import numpy as np
+from benchmarks.vector_store import synthetic_vectors, stored_vectors, exact_top_k, measure, load
+from data_pipeline.mmap_store import MmapVectorStore
+from data_pipeline.reduced_store import FullVectorStore, ReducedVectorStore, reduce_dim
+
+def matryoshka_vectors(n: int, dim: int, seed: int = 0) -> np.ndarray:
+    """Clustered vectors whose leading dimensions carry most of the signal."""
+    decay = 1.0 / np.sqrt(1.0 + np.arange(dim) / 64.0)
+    return (synthetic_vectors(n, dim, seed=seed) * decay).astype(np.float32)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=10_000)
+    parser.add_argument("--full-dim", type=int, default=3072)
+    parser.add_argument("--dims", type=int, nargs="+", default=[256, 512, 768, 1536])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--candidates", type=int, nargs="+", default=[50], help="re-rank depths to try")
+    parser.add_argument("--from-store", action="store_true", help="use the full embeddings already indexed")
+    args = parser.parse_args()
+
+    vectors = stored_vectors() if args.from_store else matryoshka_vectors(args.vectors, args.full_dim)
+    full_dim = vectors.shape[1]
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(len(vectors), size=args.queries)] + rng.normal(scale=0.3, size=(args.queries, full_dim))
+    queries = reduce_dim(queries, full_dim)
+    truth = exact_top_k(vectors, queries, args.k)
+    print(f"📐 {len(vectors)} vectors x {full_dim} dims, {args.queries} queries, k={args.k}")
+
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        full = FullVectorStore(Path(tmp) / "full.sqlite")
+        ids = [f"v{j}" for j in range(len(vectors))]
+        for i in range(0, len(vectors), 5000):
+            full.put(ids[i:i + 5000], vectors[i:i + 5000])
+
+        baseline = MmapVectorStore(Path(tmp) / "full", dtype="float16")
+        load(baseline, vectors)
+        report[f"d{full_dim}"] = {"bytes_per_vector": full_dim * 2, **measure(baseline, queries, truth, args.k)}
+
+        for dim in sorted(d for d in args.dims if d < full_dim):
+            inner = MmapVectorStore(Path(tmp) / f"d{dim}", dtype="float16")
+            load(inner, reduce_dim(vectors, dim))
+            row = {"bytes_per_vector": dim * 2}
+            report[f"d{dim}"] = {**row, **measure(ReducedVectorStore(inner, dim), queries, truth, args.k)}
+            for candidates in args.candidates:
+                store = ReducedVectorStore(inner, dim, full, candidates=candidates)
+                report[f"d{dim}_rerank{candidates}"] = {**row, **measure(store, queries, truth, args.k)}
+
+    for name, row in report.items():
+        print(f"  {name:<18} " + "  ".join(f"{key}={value}" for key, value in row.items()))
+    print(json.dumps(report))
+
+if __name__ == "__main__":
+    main()
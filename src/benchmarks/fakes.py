@@ -0,0 +1,138 @@
+import asyncio
+import hashlib
+import re
+import threading
+import time
+import zlib
+from collections import Counter, deque
+from types import SimpleNamespace
+import numpy as np
+
+WORD_RE = re.compile(r"\w+")
+
+def fake_vector(text: str, dim: int = 768) -> list[float]:
+    """
+    Deterministic hashed bag-of-words embedding: texts sharing words get similar
+    vectors, so retrieval over fake embeddings still behaves like retrieval.
+    """
+    vector = np.zeros(dim, dtype=np.float32)
+    for word in WORD_RE.findall(text.lower()):
+        h = zlib.crc32(word.encode("utf-8"))
+        vector[h % dim] += 1.0 if h & 0x80000000 else -1.0
+    norm = np.linalg.norm(vector)
+    if not norm:  # no words: still a stable, non-zero vector
+        vector[int(hashlib.sha256(text.encode("utf-8")).hexdigest(), 16) % dim] = 1.0
+        norm = 1.0
+    return (vector / norm).tolist()
+
+class FakeRateLimitError(Exception):
+    """What the fake raises over its quota; looks like Gemini's 429 to is_rate_limited."""
+    code = 429
+
+class FakeGenAIClient:
+    """
+    Stands in for `genai.Client` offline: embed_content, generate_content and
+    generate_content_stream (sync and `.aio`), with fixed simulated latencies.
+    Same input -> same output, so runs are comparable.
+    With `quota_rpm`, calls beyond that many per minute (counted over the last
+    second, per process) fail with a 429 like an exhausted quota.
+    """
+    def __init__(
+        self,
+        dim: int = 768,
+        embed_latency: float = 0.05,     # per embed_content call
+        generate_latency: float = 0.3,   # until the first token
+        token_latency: float = 0.005,    # between streamed fragments
+        answer_words: int = 40,
+        quota_rpm: int = 0,
+    ):
+        self.dim = dim
+        self.embed_latency = embed_latency
+        self.generate_latency = generate_latency
+        self.token_latency = token_latency
+        self.answer_words = answer_words
+        self.quota_rpm = quota_rpm
+        self.recent = deque()
+        self.calls = Counter()
+        self.lock = threading.Lock()
+        self.models = _Models(self)
+        self.aio = SimpleNamespace(models=_AsyncModels(self))
+
+    def count(self, name: str, n: int = 1):
+        with self.lock:
+            self.calls[name] += n
+
+    def admit(self):
+        if not self.quota_rpm:
+            return
+        with self.lock:
+            now = time.monotonic()
+            while self.recent and self.recent[0] <= now - 1.0:
+                self.recent.popleft()
+            if len(self.recent) >= self.quota_rpm / 60:
+                self.calls["rate_limited"] += 1
+                raise FakeRateLimitError("429 RESOURCE_EXHAUSTED (fake quota)")
+            self.recent.append(now)
+
+    def embeddings(self, contents) -> SimpleNamespace:
+        texts = [contents] if isinstance(contents, str) else list(contents)
+        self.count("embed_calls")
+        self.count("embedded_texts", len(texts))
+        return SimpleNamespace(embeddings=[SimpleNamespace(values=fake_vector(t, self.dim)) for t in texts])
+
+    def answer(self, contents) -> str:
+        self.count("generate_calls")
+        words = WORD_RE.findall(str(contents))[-self.answer_words:]
+        return "Based on the report, " + " ".join(words) + "."
+
+class _Models:
+    def __init__(self, fake: FakeGenAIClient):
+        self.fake = fake
+
+    def embed_content(self, model, contents, **_):
+        self.fake.admit()
+        time.sleep(self.fake.embed_latency)
+        return self.fake.embeddings(contents)
+
+    def generate_content(self, model, contents, **_):
+        self.fake.admit()
+        time.sleep(self.fake.generate_latency)
+        return SimpleNamespace(text=self.fake.answer(contents))
+
+class _AsyncModels:
+    def __init__(self, fake: FakeGenAIClient):
+        self.fake = fake
+
+    async def embed_content(self, model, contents, **_):
+        self.fake.admit()
+        await asyncio.sleep(self.fake.embed_latency)
+        return self.fake.embeddings(contents)
+
+    async def generate_content(self, model, contents, **_):
+        self.fake.admit()
+        await asyncio.sleep(self.fake.generate_latency)
+        return SimpleNamespace(text=self.fake.answer(contents))
+
+    async def generate_content_stream(self, model, contents, **_):
+        self.fake.admit()
+        answer = self.fake.answer(contents)
+
+        async def stream():
+            await asyncio.sleep(self.fake.generate_latency)
+            for word in answer.split(" "):
+                yield SimpleNamespace(text=word + " ")
+                await asyncio.sleep(self.fake.token_latency)
+        return stream()
+
+def install_fake_client(fake: FakeGenAIClient, limits: dict[str, int] | None = None):
+    """
+    Makes the fake the shared client; the engine and batcher pick it up when (re)created.
+    The fake has no quota, so the scheduler only limits what `limits` (model -> rpm) names.
+    """
+    from config import set_client
+    from data_pipeline import embedding, query_batcher, scheduler
+
+    set_client(fake)
+    scheduler._default_scheduler = scheduler.GeminiScheduler(limits=limits or {}, default_rpm=0)
+    embedding._default_engine = None
+    query_batcher._default_batcher = None
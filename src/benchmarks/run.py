@@ -0,0 +1,194 @@
+"""
+Offline performance benchmarks: no Gemini calls, no Chroma, nothing outside a temp dir.
+
+    python -m benchmarks.run                      # default sizes
+    python -m benchmarks.run --pages 500 --chat-requests 500 --concurrency 32
+    python -m benchmarks.compare benchmarks/results/A.json benchmarks/results/B.json
+
+Measures module import time and warmup (the startup budget), PDFIngestor pages/sec, Chunker chunks/sec, DocumentProcessor.run
+end to end (pipelined and sequential) and /chat latency percentiles under
+concurrent load, then writes one JSON file per run to benchmarks/results/.
+"""
+import argparse
+import os
+import tempfile
+
+# State, vectors and caches go to a throwaway dir. Must happen before `config` is imported.
+WORKDIR = tempfile.mkdtemp(prefix="bench_")
+os.environ["STATE_DIR"] = os.path.join(WORKDIR, "state")
+os.environ.setdefault("VECTOR_BACKEND", "mmap")
+os.environ["START_JOB_WORKERS"] = "0"
+
+import asyncio
+import json
+import platform
+import shutil
+import subprocess
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+import numpy as np
+
+from benchmarks.fakes import FakeGenAIClient, install_fake_client
+from benchmarks.synthetic_pdf import make_pdf
+from benchmarks.startup import measure_startup, measure_warmup
+from data_pipeline.ingest import PDFIngestor
+from data_pipeline.chunking import Chunker
+from data_pipeline.embedding_cache import get_embedding_cache
+from data_pipeline.answer_cache import get_answer_cache
+from processor import DocumentProcessor
+from config import EMBED_BATCH_SIZE
+
+RESULTS_DIR = Path(__file__).parent / "results"  # git-ignored: a run must not make the next one "dirty"
+
+class RecordingObserver:
+    def __init__(self):
+        self.stats = None
+    def on_start(self, filename): pass
+    def on_progress(self, stage, count, msg, percent=None): pass
+    def on_finish(self, filename, stats): self.stats = stats
+    def on_error(self, error): raise RuntimeError(error)
+
+# --- Benchmarks ---
+def bench_ingest(pdf_path: str, workers: int) -> dict:
+    start = time.perf_counter()
+    pages = sum(1 for _ in PDFIngestor(workers=workers).extract("bench", pdf_path))
+    seconds = time.perf_counter() - start
+    return {"workers": workers, "pages": pages, "seconds": round(seconds, 3), "pages_per_sec": round(pages / seconds, 1)}
+
+def bench_chunking(pdf_path: str) -> dict:
+    pages = list(PDFIngestor(workers=0).extract("bench", pdf_path))  # extraction not timed here
+    start = time.perf_counter()
+    chunks = list(Chunker().process(iter(pages), "bench"))
+    seconds = time.perf_counter() - start
+    tokens = [c["tokens"] for c in chunks]
+    return {
+        "chunks": len(chunks),
+        "seconds": round(seconds, 3),
+        "chunks_per_sec": round(len(chunks) / seconds, 1),
+        "tokens_mean": round(sum(tokens) / len(tokens), 1),
+        "tokens_min": min(tokens),
+        "cross_page_chunks": sum(c["start_page"] != c["end_page"] for c in chunks),
+        "embed_calls": -(-len(chunks) // EMBED_BATCH_SIZE),
+        # The previous splitter: 1000 characters / 200 overlap, each page on its own
+        "per_page_baseline": _per_page_chunk_count(pages),
+    }
+
+def _per_page_chunk_count(pages: list[dict]) -> dict:
+    from langchain_text_splitters import RecursiveCharacterTextSplitter
+    splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200, separators=["\n\n", "\n", ".", " ", ""])
+    chunks = sum(len(splitter.split_text(page["content"])) for page in pages)
+    return {"chunks": chunks, "embed_calls": -(-chunks // EMBED_BATCH_SIZE)}
+
+def bench_end_to_end(pdf_path: str, pipelined: bool, fake: FakeGenAIClient) -> dict:
+    get_embedding_cache().clear()  # every run pays for its embeddings
+    embed_calls = fake.calls["embed_calls"]
+    observer = RecordingObserver()
+    start = time.perf_counter()
+    # A fresh source name, so the manifest never skips the file as unchanged
+    DocumentProcessor(pipelined=pipelined).run(pdf_path, observer, source=f"bench-{time.time_ns()}.pdf")
+    seconds = time.perf_counter() - start
+    return {
+        "pipelined": pipelined,
+        "seconds": round(seconds, 3),
+        "chunks": observer.stats["chunks"],
+        "chunks_per_sec": round(observer.stats["chunks"] / seconds, 1),
+        "embed_calls": fake.calls["embed_calls"] - embed_calls,
+        "stages": observer.stats.get("stages"),
+    }
+
+async def _chat_load(questions: list[str], concurrency: int) -> tuple[list[float], int]:
+    import httpx
+    from server import app
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, errors = [], 0
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as http:
+        async def ask(question):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                response = await http.post("/chat", json={"question": question})
+                latencies.append((time.perf_counter() - start) * 1000)
+                errors += response.status_code != 200
+        await asyncio.gather(*(ask(q) for q in questions))
+    return latencies, errors
+
+def bench_chat(requests: int, concurrency: int, distinct: int) -> dict:
+    get_answer_cache().clear()
+    # `distinct` different questions, repeated: exercises the answer cache like real traffic
+    questions = [f"What drove the change in {topic}?" for topic in _topics(distinct, requests)]
+    start = time.perf_counter()
+    latencies, errors = asyncio.run(_chat_load(questions, concurrency))
+    seconds = time.perf_counter() - start
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "requests_per_sec": round(requests / seconds, 1),
+        **{f"p{p}_ms": round(float(np.percentile(latencies, p)), 1) for p in (50, 95, 99)},
+        "answer_cache": get_answer_cache().stats(),
+    }
+
+def _topics(distinct: int, requests: int) -> list[str]:
+    from benchmarks.synthetic_pdf import SUBJECTS
+    base = [f"{SUBJECTS[i % len(SUBJECTS)].lower()} ({i})" for i in range(distinct)]
+    return [base[i % distinct] for i in range(requests)]
+
+# --- Results ---
+def git_revision() -> dict:
+    def git(*args):
+        return subprocess.run(["git", *args], capture_output=True, text=True).stdout.strip()
+    return {"commit": git("rev-parse", "--short", "HEAD") or "unknown", "dirty": bool(git("status", "--porcelain"))}
+
+def write_results(report: dict, out_dir: Path = RESULTS_DIR) -> Path:
+    out_dir.mkdir(parents=True, exist_ok=True)
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    path = out_dir / f"{stamp}_{report['meta']['commit']}.json"
+    path.write_text(json.dumps(report, indent=2))
+    return path
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--pages", type=int, default=300)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="parallel PDFIngestor workers")
+    parser.add_argument("--embed-latency", type=float, default=0.05, help="seconds per fake embed call")
+    parser.add_argument("--generate-latency", type=float, default=0.3, help="seconds per fake generation")
+    parser.add_argument("--chat-requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--distinct-questions", type=int, default=50)
+    parser.add_argument("--out", type=Path, default=RESULTS_DIR)
+    args = parser.parse_args()
+
+    fake = FakeGenAIClient(embed_latency=args.embed_latency, generate_latency=args.generate_latency)
+    install_fake_client(fake)
+    try:
+        pdf_path = make_pdf(os.path.join(WORKDIR, "synthetic.pdf"), pages=args.pages)
+        print(f"📄 Synthetic PDF: {args.pages} pages ({WORKDIR})")
+
+        report = {
+            "meta": {
+                **git_revision(),
+                "timestamp": datetime.now(timezone.utc).isoformat(),
+                "python": platform.python_version(),
+                "cpus": os.cpu_count(),
+                "vector_backend": os.environ["VECTOR_BACKEND"],
+                "params": {k: str(v) if isinstance(v, Path) else v for k, v in vars(args).items()},
+            },
+            "startup": {"import": measure_startup(), "warmup": measure_warmup()},
+            "ingest": [bench_ingest(pdf_path, 0), bench_ingest(pdf_path, args.workers)],
+            "chunking": bench_chunking(pdf_path),
+            "end_to_end": [bench_end_to_end(pdf_path, False, fake), bench_end_to_end(pdf_path, True, fake)],
+            "chat": bench_chat(args.chat_requests, args.concurrency, args.distinct_questions),
+        }
+        report["fake_client_calls"] = dict(fake.calls)
+    finally:
+        shutil.rmtree(WORKDIR, ignore_errors=True)
+
+    for name in ("startup", "ingest", "chunking", "end_to_end", "chat"):
+        print(f"⏱️  {name}: {json.dumps(report[name])}")
+    print(f"💾 Results: {write_results(report, args.out)}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""
+Interactive latency while a bulk ingest floods the same quota. Bulk threads embed
+batches through the EmbeddingEngine ("bulk" class); one question at a time is
+embedded through the QueryBatcher ("interactive"). The fake API answers 429 above
+--quota-rpm. Runs once without limits (everyone retries on 429) and once with the
+scheduler holding the model to the quota.
+
+    python -m benchmarks.scheduler --quota-rpm 1200 --seconds 10
+"""
+import argparse
+import asyncio
+import json
+import tempfile
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+import numpy as np
+from benchmarks.fakes import FakeGenAIClient
+from config import EMBEDDING_MODEL
+from data_pipeline.embedding import EmbeddingEngine
+from data_pipeline.query_batcher import QueryBatcher
+from data_pipeline.scheduler import GeminiScheduler, SharedBuckets
+
+def run(limited: bool, args, state_dir: Path) -> dict:
+    fake = FakeGenAIClient(embed_latency=args.latency, quota_rpm=args.quota_rpm)
+    limits = {EMBEDDING_MODEL: args.quota_rpm} if limited else {}
+    # The fake counts its quota over one second, so the bucket may not burst beyond that
+    buckets = SharedBuckets(state_dir / f"scheduler_{limited}.sqlite", burst_seconds=0.5)
+    scheduler = GeminiScheduler(buckets, limits=limits, default_rpm=0)
+    engine = EmbeddingEngine(client=fake, concurrency=1, backoff_base=0.25, backoff_max=2.0, scheduler=scheduler)
+    batcher = QueryBatcher(client=fake, scheduler=scheduler)
+    counts, stop = Counter(), threading.Event()
+
+    def bulk(worker: int):
+        n = 0
+        while not stop.is_set():
+            texts = [f"bulk {worker} {n} {i}" for i in range(args.batch)]
+            try:
+                engine.embed(texts)
+                counts["bulk_texts"] += len(texts)
+            except Exception:
+                counts["bulk_failed_batches"] += 1
+            n += 1
+
+    async def interactive() -> list[float]:
+        latencies, i = [], 0
+        deadline = time.monotonic() + args.seconds
+        while time.monotonic() < deadline:
+            started = time.perf_counter()
+            try:
+                await batcher.embed(f"question {i}")
+                latencies.append(time.perf_counter() - started)
+            except Exception:
+                counts["interactive_failed"] += 1
+            i += 1
+            await asyncio.sleep(args.interval)
+        return latencies
+
+    threads = [threading.Thread(target=bulk, args=(w,), daemon=True) for w in range(args.bulk_threads)]
+    for thread in threads:
+        thread.start()
+    started = time.perf_counter()
+    latencies = np.array(asyncio.run(interactive())) * 1000
+    stop.set()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return {
+        "interactive_p50_ms": round(float(np.percentile(latencies, 50)), 1) if len(latencies) else None,
+        "interactive_p95_ms": round(float(np.percentile(latencies, 95)), 1) if len(latencies) else None,
+        "interactive_max_ms": round(float(latencies.max()), 1) if len(latencies) else None,
+        "interactive_answered": len(latencies),
+        "interactive_failed": counts["interactive_failed"],
+        "bulk_texts_per_sec": round(counts["bulk_texts"] / elapsed, 1),
+        "bulk_failed_batches": counts["bulk_failed_batches"],
+        "rate_limited_calls": fake.calls["rate_limited"],
+    }
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--quota-rpm", type=int, default=1200)
+    parser.add_argument("--seconds", type=float, default=10)
+    parser.add_argument("--bulk-threads", type=int, default=8)
+    parser.add_argument("--batch", type=int, default=20, help="texts per bulk embed call")
+    parser.add_argument("--latency", type=float, default=0.02, help="simulated seconds per API call")
+    parser.add_argument("--interval", type=float, default=0.2, help="seconds between questions")
+    args = parser.parse_args()
+
+    print(f"🚦 quota {args.quota_rpm} rpm, {args.bulk_threads} bulk threads, a question every {args.interval}s")
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for limited in (False, True):
+            name = "scheduler" if limited else "no_limits"
+            report[name] = run(limited, args, Path(tmp))
+            print(f"  {name:<10} " + "  ".join(f"{key}={value}" for key, value in report[name].items()))
+    print(json.dumps(report))
+
+if __name__ == "__main__":
+    main()
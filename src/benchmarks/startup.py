@@ -0,0 +1,52 @@
+"""
+Startup budget: wall time to import the API/worker modules in a fresh interpreter,
+and time for warmup() to get ready. Exits non-zero when the median import time
+exceeds --budget, so it can gate a change.
+
+    python -m benchmarks.startup --budget 2.0
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+MODULES = ("config", "processor", "server")
+
+def measure_import(module: str, repeats: int = 5) -> dict:
+    """Median/max seconds for `python -c 'import <module>'` (interpreter start subtracted)."""
+    def run(code):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", code], check=True, capture_output=True, env=os.environ.copy())
+        return time.perf_counter() - start
+
+    baseline = statistics.median(run("pass") for _ in range(repeats))
+    samples = [max(0.0, run(f"import {module}") - baseline) for _ in range(repeats)]
+    return {"median_s": round(statistics.median(samples), 3), "max_s": round(max(samples), 3)}
+
+def measure_startup(repeats: int = 5) -> dict:
+    return {module: measure_import(module, repeats) for module in MODULES}
+
+def measure_warmup() -> dict:
+    """In-process warmup with whatever client is installed (the fake, under benchmarks.run)."""
+    from warmup import warmup
+    start = time.perf_counter()
+    steps = warmup(embed=False)
+    return {"seconds": round(time.perf_counter() - start, 3), "steps": steps}
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--budget", type=float, default=None, help="max median seconds to import `server`")
+    args = parser.parse_args()
+
+    results = measure_startup(args.repeats)
+    for module, row in results.items():
+        print(f"⏱️  import {module:<10} median={row['median_s']}s max={row['max_s']}s")
+    if args.budget is not None and results["server"]["median_s"] > args.budget:
+        print(f"❌ Importing server takes {results['server']['median_s']}s, budget is {args.budget}s")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
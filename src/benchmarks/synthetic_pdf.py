@@ -0,0 +1,61 @@
+import random
+import fitz  # PyMuPDF
+
+SECTIONS = [
+    "Risk Factors", "Management's Discussion and Analysis", "Liquidity and Capital Resources",
+    "Results of Operations", "Legal Proceedings", "Quantitative and Qualitative Disclosures About Market Risk",
+]
+SUBJECTS = [
+    "Total revenues", "Automotive sales", "Energy generation and storage revenue", "Gross margin",
+    "Operating expenses", "Research and development expense", "Free cash flow", "Capital expenditures",
+    "Net income attributable to common stockholders", "Services and other revenue",
+]
+VERBS = ["increased", "decreased", "remained flat", "grew", "declined"]
+REASONS = [
+    "primarily due to higher vehicle deliveries", "as a result of lower average selling prices",
+    "driven by growth in energy storage deployments", "reflecting increased investment in AI infrastructure",
+    "partially offset by foreign currency headwinds", "due to changes in regulatory credit sales",
+]
+RISKS = [
+    "We may be unable to meet our growth and production targets.",
+    "Our business may be adversely affected by supply chain disruptions.",
+    "We are subject to legal proceedings, including securities and product liability claims.",
+    "Changes in tariffs and trade policy could increase our costs.",
+    "Cybersecurity incidents could disrupt our operations and harm our reputation.",
+]
+
+def paragraph(rng: random.Random) -> str:
+    sentences = []
+    for _ in range(rng.randint(3, 6)):
+        if rng.random() < 0.25:
+            sentences.append(rng.choice(RISKS))
+        else:
+            sentences.append(
+                f"{rng.choice(SUBJECTS)} {rng.choice(VERBS)} {rng.randint(1, 60)}% to "
+                f"${rng.randint(100, 99_000):,} million in fiscal {rng.randint(2019, 2024)}, {rng.choice(REASONS)}."
+            )
+    return " ".join(sentences)
+
+def page_texts(pages: int = 300, seed: int = 0, chars_per_page: int = 3000) -> list[str]:
+    """The text of each page of the synthetic 10-K, deterministic for a seed."""
+    rng = random.Random(seed)
+    texts = []
+    for number in range(pages):
+        text = f"{SECTIONS[number * len(SECTIONS) // pages]} (page {number + 1})\n\n"
+        while len(text) < chars_per_page:
+            text += paragraph(rng) + "\n\n"
+        texts.append(text)
+    return texts
+
+def make_pdf(path: str, pages: int = 300, seed: int = 0, chars_per_page: int = 3000) -> str:
+    """Writes a deterministic 10-K-like PDF: `pages` pages of ~`chars_per_page` characters."""
+    doc = fitz.open()
+    for text in page_texts(pages, seed, chars_per_page):
+        page = doc.new_page()  # A4
+        page.insert_textbox(fitz.Rect(40, 40, page.rect.width - 40, page.rect.height - 40), text, fontsize=7)
+    doc.save(path)
+    doc.close()
+    return path
+
+if __name__ == "__main__":
+    print(f"📄 Wrote {make_pdf('data/pdf/synthetic-10k.pdf')}")
@@ -0,0 +1,104 @@
+"""
+Recall@k and query latency of the vector store backends on the same vectors.
+Ground truth is exact float32 cosine search. Runs offline (synthetic vectors,
+or --from-store to copy the embeddings already indexed).
+
+    python -m benchmarks.vector_store --vectors 50000 --dim 768 --queries 200
+"""
+import argparse
+import json
+import tempfile
+import time
+from pathlib import Path
+import numpy as np
+from data_pipeline.mmap_store import MmapVectorStore
+
+def synthetic_vectors(n: int, dim: int, clusters: int = 100, seed: int = 0) -> np.ndarray:
+    """Clustered like real embeddings (topics), not uniform noise."""
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    return (centers[rng.integers(clusters, size=n)] + rng.normal(scale=0.6, size=(n, dim))).astype(np.float32)
+
+def stored_vectors(page_size: int = 1000) -> np.ndarray:
+    from data_pipeline.vector_store import get_vector_store
+    store, vectors, offset = get_vector_store(), [], 0
+    while True:
+        batch = store.get(limit=page_size, offset=offset, include=["embeddings"])
+        if not len(batch["ids"]):
+            return np.asarray(vectors, dtype=np.float32)
+        vectors.extend(batch["embeddings"])
+        offset += len(batch["ids"])
+
+def exact_top_k(vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    unit = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.argsort(-(queries @ unit.T), axis=1)[:, :k]
+
+def measure(store, queries: np.ndarray, truth: np.ndarray, k: int) -> dict:
+    latencies, hits = [], 0
+    for query, expected in zip(queries, truth):
+        start = time.perf_counter()
+        result = store.query([query.tolist()], n_results=k)
+        latencies.append((time.perf_counter() - start) * 1000)
+        hits += len({int(i[1:]) for i in result["ids"][0]} & set(expected.tolist()))
+    return {
+        "recall_at_k": round(hits / truth.size, 4),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+    }
+
+def load(store, vectors: np.ndarray, batch_size: int = 5000) -> float:
+    start = time.perf_counter()
+    for i in range(0, len(vectors), batch_size):
+        part = range(i, min(i + batch_size, len(vectors)))
+        store.upsert(
+            ids=[f"v{j}" for j in part],
+            embeddings=vectors[i:i + batch_size].tolist(),
+            documents=[""] * len(part),
+            metadatas=[{"source": "bench", "page": j % 100} for j in part],
+        )
+    return round(time.perf_counter() - start, 3)
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--vectors", type=int, default=50_000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument("--nlist", type=int, default=256)
+    parser.add_argument("--from-store", action="store_true", help="use the embeddings already indexed")
+    parser.add_argument("--skip-chroma", action="store_true")
+    args = parser.parse_args()
+
+    vectors = stored_vectors() if args.from_store else synthetic_vectors(args.vectors, args.dim)
+    rng = np.random.default_rng(1)
+    queries = vectors[rng.integers(len(vectors), size=args.queries)] + rng.normal(scale=0.3, size=(args.queries, vectors.shape[1]))
+    queries = (queries / np.linalg.norm(queries, axis=1, keepdims=True)).astype(np.float32)
+    truth = exact_top_k(vectors, queries, args.k)
+    print(f"📐 {len(vectors)} vectors x {vectors.shape[1]} dims, {args.queries} queries, k={args.k}")
+
+    report = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for dtype in ("float16", "int8"):
+            store = MmapVectorStore(Path(tmp) / dtype, dtype=dtype, ivf_auto_rows=0)  # brute force first
+            load_s = load(store, vectors)
+            report[f"mmap_{dtype}"] = {"load_s": load_s, **measure(store, queries, truth, args.k)}
+            if len(vectors) >= args.nlist:
+                store.train_ivf(nlist=args.nlist)
+                report[f"mmap_{dtype}_ivf"] = measure(store, queries, truth, args.k)
+
+        if not args.skip_chroma:
+            import chromadb
+            from data_pipeline.vector_store import ChromaStore
+            chroma = ChromaStore.__new__(ChromaStore)  # temp collection, not the real one
+            chroma.client = chromadb.PersistentClient(path=str(Path(tmp) / "chroma"))
+            chroma.collection = chroma.client.create_collection("bench", metadata={"hnsw:space": "cosine"})
+            chroma.l2 = False
+            load_s = load(chroma, vectors)
+            report["chroma"] = {"load_s": load_s, **measure(chroma, queries, truth, args.k)}
+
+    for name, row in report.items():
+        print(f"  {name:<18} " + "  ".join(f"{key}={value}" for key, value in row.items()))
+    print(json.dumps(report))
+
+if __name__ == "__main__":
+    main()
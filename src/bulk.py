@@ -0,0 +1,157 @@
+import argparse
+import hashlib
+import os
+import time
+import uuid
+import zipfile
+from contextlib import contextmanager, nullcontext
+from functools import partial
+from pathlib import Path
+from typing import BinaryIO, Callable, ContextManager, Iterator
+from config import BASE_PDF_PATH, JOB_MAX_CONCURRENT, BULK_MAX_FILES
+from jobs import JobStore, get_job_store
+from data_pipeline.catalog import document_key
+
+# --- Bulk Ingestion ---
+# Many PDFs (a folder, a zip, a multi-file upload) become one batch of ordinary jobs:
+# the same job store, dedupe by file hash, and worker pool as /ingest.
+# Parallelism is the worker pool's global cap (JOB_MAX_CONCURRENT, or --parallel here).
+
+class BulkLimitExceeded(ValueError):
+    pass
+
+# A document of a batch: its name and how to open it (read once, when it is saved)
+Document = tuple[str, Callable[[], ContextManager[BinaryIO]]]
+
+def upload_path(job_id: str) -> str:
+    """Where an upload waits for its worker (removed once its job finishes)."""
+    return f"data_pipeline/temp_{job_id}.pdf"
+
+def save_hashed(src: BinaryIO, dst: str, block_size: int = 1024 * 1024) -> str:
+    """Copies `src` to `dst` in blocks, hashing on the way: the file is read exactly once."""
+    digest = hashlib.sha256()
+    with open(dst, "wb") as out:
+        while block := src.read(block_size):
+            digest.update(block)
+            out.write(block)
+    return digest.hexdigest()
+
+@contextmanager
+def _zip_member(archive_file: str | BinaryIO, member: str) -> Iterator[BinaryIO]:
+    with zipfile.ZipFile(archive_file) as archive, archive.open(member) as stream:
+        yield stream  # decompressed as it is read
+
+def zip_documents(archive_file: str | BinaryIO, prefix: str = "") -> list[Document]:
+    """Every PDF in the archive (a path or a seekable file). Only the directory is read here."""
+    with zipfile.ZipFile(archive_file) as archive:
+        members = [info.filename for info in archive.infolist()
+                   if not info.is_dir() and info.filename.lower().endswith(".pdf")]
+    return [(prefix + member, partial(_zip_member, archive_file, member)) for member in members]
+
+def upload_documents(uploads: list[tuple[str, BinaryIO]]) -> list[Document]:
+    """The PDFs among uploaded files, zips expanded; other files are ignored."""
+    documents = []
+    for name, fileobj in uploads:
+        if name.lower().endswith(".zip"):
+            documents += zip_documents(fileobj, prefix=f"{name}/")
+        elif name.lower().endswith(".pdf"):
+            documents.append((name, partial(nullcontext, fileobj)))
+    return documents
+
+def directory_documents(root: Path) -> list[Document]:
+    """(relative path, opener) for every PDF under `root`, including PDFs inside zips."""
+    documents = []
+    for path in sorted(root.rglob("*")):
+        name = str(path.relative_to(root))
+        if path.suffix.lower() == ".pdf":
+            documents.append((name, partial(open, path, "rb")))
+        elif path.suffix.lower() == ".zip":
+            documents += zip_documents(str(path), prefix=f"{name}/")
+    return documents
+
+def enqueue_all(
+    store: JobStore, batch_id: str, documents: list[Document], label: str | None = None,
+    max_files: int = BULK_MAX_FILES, key_by_path: bool = False,
+) -> list[dict]:
+    """
+    Saves and queues every document under one batch, all or nothing: the count is
+    checked and every file saved before the first job is queued.
+    A document is indexed under the same key as a single /ingest upload of its file
+    (catalog.document_key on the bare file name), whatever folder or zip it came from.
+    With `key_by_path` its path in the batch is the document id instead, so a new version
+    at the same path (any content, any name pattern) updates that document incrementally.
+    A file whose hash is already queued, running or indexed is not queued again;
+    the batch points at the existing job instead.
+    """
+    if len(documents) > max_files:
+        raise BulkLimitExceeded(f"{len(documents)} PDFs in one batch; the limit is {max_files}")
+    saved, path = [], None
+    try:
+        for name, open_document in documents:
+            job_id = str(uuid.uuid4())
+            path = upload_path(job_id)
+            with open_document() as stream:
+                digest = save_hashed(stream, path)
+            saved.append((name, job_id, path, digest))
+    except BaseException:
+        for leftover in [saved_path for _, _, saved_path, _ in saved] + [path]:
+            if leftover and os.path.exists(leftover):
+                os.remove(leftover)
+        raise
+
+    store.create_batch(batch_id, label)
+    jobs = []
+    for name, job_id, path, digest in saved:
+        filename = os.path.basename(name)
+        source = document_key(filename, digest, name if key_by_path else None)
+        job_id, created = store.create(job_id, path, source, digest, file=filename)
+        if not created:
+            os.remove(path)
+        store.add_to_batch(batch_id, job_id, name, duplicate=not created)
+        jobs.append({"file": name, "job_id": job_id, "duplicate": not created})
+    return jobs
+
+# --- CLI: python bulk.py [folder] ---
+def _progress_line(view: dict) -> str:
+    counts = " ".join(f"{status}={n}" for status, n in sorted(view["counts"].items()))
+    return f"📦 {view['percent']:5.1f}% | {counts} | {view['chunks']} chunks"
+
+def main():
+    parser = argparse.ArgumentParser(description="Queue (and by default process) every PDF in a folder.")
+    parser.add_argument("path", nargs="?", type=Path, default=BASE_PDF_PATH)
+    parser.add_argument("--parallel", type=int, default=JOB_MAX_CONCURRENT, help="documents processed at once")
+    parser.add_argument("--no-workers", action="store_true", help="only queue; the API's worker pool processes")
+    parser.add_argument("--label", default=None)
+    parser.add_argument("--key-by-path", action="store_true",
+                        help="index each PDF under its path in the folder, so re-runs update it in place")
+    args = parser.parse_args()
+
+    store = get_job_store()
+    batch_id = str(uuid.uuid4())
+    jobs = enqueue_all(store, batch_id, directory_documents(args.path), label=args.label or str(args.path),
+                       key_by_path=args.key_by_path)
+    duplicates = sum(j["duplicate"] for j in jobs)
+    print(f"🗂️  Batch {batch_id}: {len(jobs) - duplicates} queued, {duplicates} already known")
+    if args.no_workers:
+        print(f"Follow it with GET /batches/{batch_id}")
+        return
+
+    from worker import WorkerPool
+    pool = WorkerPool(size=args.parallel, max_concurrent=args.parallel)
+    pool.start()
+    try:
+        while not (view := store.batch(batch_id))["done"]:
+            if not pool.alive():
+                raise SystemExit(f"\n❌ Every worker exited; the rest of the batch stays queued ({batch_id})")
+            print(_progress_line(view), end="\r", flush=True)
+            time.sleep(1)
+    finally:
+        pool.stop()
+
+    print(_progress_line(view))
+    print(f"✅ {view['counts'].get('completed', 0)}/{view['total']} documents in {view['elapsed_s']}s")
+    for failure in view["failed"]:
+        print(f"❌ {failure['file']}: {failure['error']}")
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,40 @@
 # File: llm_config.py
 import os
-from google import genai
+import threading
 from dotenv import load_dotenv
 from pathlib import Path
-import chromadb
 
 # 1. Load environment variables (optional, but good practice)
 load_dotenv()
 
 
-# 2. Initialize the Client ONCE
-print("🔌 Initializing Gemini Client...")
-client = genai.Client()
+# 2. The Client: created ONCE, on first use (importing config stays cheap)
+# The vector store is opened on first use too (data_pipeline/vector_store.py)
+_client = None
+_client_lock = threading.Lock()
 
-chroma_client = chromadb.PersistentClient(path="./chroma_db")
-collection = chroma_client.get_collection(name="financial_reports")
+def get_client():
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from google import genai  # heavy import, only paid by processes that call Gemini
+                print("🔌 Initializing Gemini Client...")
+                _client = genai.Client()
+    return _client
+
+def set_client(client):
+    """Replaces the shared client (offline fakes in benchmarks)."""
+    global _client
+    _client = client
+
+def _reset_client_after_fork():
+    # A forked child must not share the parent's HTTP connections
+    global _client, _client_lock
+    _client = None
+    _client_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_client_after_fork)
 
 # 3. (Optional) Define standardized model names here too
 # This makes it easy to upgrade to "gemini-3.0" later in just one place
@@ -22,4 +42,141 @@ EMBEDDING_MODEL = "gemini-embedding-001"
 REASONING_MODEL = "gemini-2.5-flash"
 BASE_PDF_PATH = Path('data/pdf')
 BASE_CORPUS_PATH = Path('data/corpus')
-BASE_CHUNKS_PATH = Path('data/chunks')
\ No newline at end of file
+BASE_CHUNKS_PATH = Path('data/chunks')
+
+# 4. Embedding throughput knobs (override via env)
+# Gemini accepts up to 100 texts per embed_content call.
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", 100))
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", 4))   # batches in flight
+EMBED_MAX_RETRIES = int(os.getenv("EMBED_MAX_RETRIES", 5))   # per batch, on 429/503
+EMBED_BACKOFF_BASE = float(os.getenv("EMBED_BACKOFF_BASE", 1.0))  # seconds
+EMBED_BACKOFF_MAX = float(os.getenv("EMBED_BACKOFF_MAX", 30.0))   # seconds
+# The Indexer flushes enough chunks to keep every embedding slot busy
+INDEX_BATCH_SIZE = EMBED_BATCH_SIZE * EMBED_CONCURRENCY
+
+# 5. Local state (caches, manifests) lives next to the data folders
+STATE_DIR = Path(os.getenv("STATE_DIR", "data/state"))
+
+# Embedding cache: in-memory LRU in front of a SQLite file, keyed by (model, text hash)
+EMBED_CACHE_PATH = STATE_DIR / "embedding_cache.sqlite"
+EMBED_CACHE_MEMORY_ITEMS = int(os.getenv("EMBED_CACHE_MEMORY_ITEMS", 10_000))
+EMBED_CACHE_MAX_ROWS = int(os.getenv("EMBED_CACHE_MAX_ROWS", 500_000))
+
+# 6. PDF extraction: 0 = single-process, N = N worker processes
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", 0))
+INGEST_PAGES_PER_TASK = int(os.getenv("INGEST_PAGES_PER_TASK", 16))
+
+# 7. Pipelined execution: extraction, chunking and indexing each get a thread,
+# connected by queues of at most PIPELINE_QUEUE_SIZE items (backpressure)
+PIPELINED = os.getenv("PIPELINED", "1") == "1"
+PIPELINE_QUEUE_SIZE = int(os.getenv("PIPELINE_QUEUE_SIZE", 64))
+
+# Per-document manifest of page/chunk fingerprints (incremental re-ingestion)
+MANIFEST_PATH = STATE_DIR / "manifest.sqlite"
+
+# 8. Ingest jobs: persistent queue + pool of worker processes
+JOBS_DB_PATH = STATE_DIR / "jobs.sqlite"
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", 2))                  # processes per pool
+JOB_MAX_CONCURRENT = int(os.getenv("JOB_MAX_CONCURRENT", 2))    # running jobs, across all pools
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", 0.5))  # seconds between claim attempts
+JOB_STALE_AFTER = float(os.getenv("JOB_STALE_AFTER", 600))      # silent "processing" jobs get requeued
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", 15))  # a running job's worker checks in this often
+# Start the pool inside the API process. Set to 0 when running `python worker.py` separately
+# (e.g. with several uvicorn workers).
+START_JOB_WORKERS = os.getenv("START_JOB_WORKERS", "1") == "1"
+# Progress streaming (/status/{job_id}/events): how often the API checks the job store
+EVENTS_POLL_INTERVAL = float(os.getenv("EVENTS_POLL_INTERVAL", 0.25))
+EVENTS_HEARTBEAT = float(os.getenv("EVENTS_HEARTBEAT", 15))  # keep-alive comment for idle streams
+
+# 9. Semantic answer cache: reuse an answer when a new question embeds this close to an old one
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95))  # cosine similarity
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", 3600))               # seconds
+ANSWER_CACHE_MAX_ITEMS = int(os.getenv("ANSWER_CACHE_MAX_ITEMS", 1000))
+# Touched on every write to the collection, so other processes can tell their caches are stale
+COLLECTION_VERSION_PATH = STATE_DIR / "collection.version"
+
+# 10. Query path: micro-batching of concurrent /chat requests
+QUERY_BATCH_WINDOW_MS = float(os.getenv("QUERY_BATCH_WINDOW_MS", 5))  # how long the first query waits for others to batch with
+QUERY_BATCH_MAX = int(os.getenv("QUERY_BATCH_MAX", 64))               # flush early at this size
+CHROMA_EXECUTOR_WORKERS = int(os.getenv("CHROMA_EXECUTOR_WORKERS", 4))  # dedicated threads for Chroma calls
+
+# 11. Hybrid retrieval: local BM25 index fused with vector search (reciprocal rank fusion)
+LEXICAL_INDEX_PATH = STATE_DIR / "lexical.sqlite"
+HYBRID_CANDIDATES = int(os.getenv("HYBRID_CANDIDATES", 20))  # per retriever, before fusion
+RRF_K = int(os.getenv("RRF_K", 60))
+
+# 12. Vector store backend: "chroma" (PersistentClient) or "mmap" (local memory-mapped matrix)
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+CHROMA_PATH = "./chroma_db"
+COLLECTION_NAME = "financial_reports"
+MMAP_STORE_PATH = STATE_DIR / "vectors"
+MMAP_DTYPE = os.getenv("MMAP_DTYPE", "float16")       # "float16" or "int8" (4x smaller than float32)
+MMAP_IVF_NPROBE = int(os.getenv("MMAP_IVF_NPROBE", 8))  # IVF lists scanned per query, once trained
+# The IVF index is trained automatically once a store holds this many vectors (0 = only by hand:
+# `python -m data_pipeline.mmap_store --train-ivf`, which also retrains after the corpus has grown)
+MMAP_IVF_AUTO_ROWS = int(os.getenv("MMAP_IVF_AUTO_ROWS", 50_000))
+MMAP_IVF_NLIST = int(os.getenv("MMAP_IVF_NLIST", 256))  # k-means lists (~sqrt of the vector count)
+
+# 13. Metrics: ingest workers dump their counters/histograms here, /metrics merges them
+METRICS_DIR = STATE_DIR / "metrics"
+
+# 14. Startup: WARMUP opens stores/clients before the API reports ready (/readyz)
+WARMUP = os.getenv("WARMUP", "1") == "1"
+WARMUP_EMBED = os.getenv("WARMUP_EMBED", "0") == "1"  # also makes one real embedding call
+
+# 15. Chunking: sized in model tokens (tiktoken if installed, else ~4 chars/token), packed across page breaks
+CHUNK_TOKENS = int(os.getenv("CHUNK_TOKENS", 400))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", 60))
+CHUNK_ANCHOR_PAGES = int(os.getenv("CHUNK_ANCHOR_PAGES", 4))  # packing restarts every N pages (0 = never)
+# tiktoken's vocabulary lives with the state, downloaded once at warmup, so ingest workers never fetch it
+TIKTOKEN_CACHE_DIR = Path(os.getenv("TIKTOKEN_CACHE_DIR", STATE_DIR / "tiktoken"))
+
+# 16. Bulk ingest (/ingest/bulk, bulk.py): most PDFs accepted in one batch
+BULK_MAX_FILES = int(os.getenv("BULK_MAX_FILES", 500))
+
+# 17. Prompt context: fused candidates are merged/deduped, then packed into a token budget
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", 12))  # chunks retrieved per question
+CONTEXT_TOKENS = int(os.getenv("CONTEXT_TOKENS", 3000))        # max context tokens per prompt
+
+# 18. Batch questions (/chat/batch): one embedding pass and vector query, then bounded concurrent generation
+CHAT_BATCH_MAX = int(os.getenv("CHAT_BATCH_MAX", 500))                 # questions per request
+CHAT_BATCH_CONCURRENCY = int(os.getenv("CHAT_BATCH_CONCURRENCY", 8))   # answers generated at once
+
+# 19. Resumable ingest: chunks that fail to index wait in a retry queue (manifest DB) with backoff
+RETRY_MAX_ATTEMPTS = int(os.getenv("RETRY_MAX_ATTEMPTS", 5))
+RETRY_BACKOFF_BASE = float(os.getenv("RETRY_BACKOFF_BASE", 30))  # seconds; doubles per attempt
+RETRY_BATCH_SIZE = int(os.getenv("RETRY_BATCH_SIZE", 200))       # queued chunks retried per pass
+RETRY_POLL_INTERVAL = float(os.getenv("RETRY_POLL_INTERVAL", 10))  # idle workers check the queue this often
+
+# 20. Stored vector size: gemini-embedding-001 is Matryoshka-trained, so the first N dims of a vector
+#     (renormalized) are a valid N-dim embedding. 0 = store full vectors. Each size gets its own
+#     collection ("<name>_d768"); fill it from the full one with `python reproject.py --dim 768`.
+EMBED_STORE_DIM = int(os.getenv("EMBED_STORE_DIM", 0))
+RERANK_FULL = os.getenv("RERANK_FULL", "0") == "1"             # re-rank with full vectors kept aside
+RERANK_CANDIDATES = int(os.getenv("RERANK_CANDIDATES", 50))    # first-stage hits re-ranked per query
+FULL_VECTORS_PATH = STATE_DIR / "full_vectors.sqlite"
+
+# 21. Sharding: one collection per shard ("<name>__<shard>"), chosen per document at first ingest.
+#     "none", "document", "issuer" or "issuer_period" (issuer/period come from EDGAR-style file names).
+SHARD_BY = os.getenv("SHARD_BY", "none")
+CATALOG_PATH = STATE_DIR / "catalog.sqlite"                        # documents -> issuer, period, shard
+SHARD_QUERY_WORKERS = int(os.getenv("SHARD_QUERY_WORKERS", 8))     # shards searched in parallel
+
+# 22. Financial tables: PyMuPDF's table finder runs next to text extraction and line items go into a
+#     fact store keyed by (document, period, line item). Numeric lookups are answered from it directly.
+EXTRACT_TABLES = os.getenv("EXTRACT_TABLES", "1") == "1"
+FACTS_PATH = STATE_DIR / "facts.sqlite"
+FACT_ANSWERS = os.getenv("FACT_ANSWERS", "1") == "1"           # unambiguous lookups skip retrieval and Gemini
+FACT_PROMPT_ROWS = int(os.getenv("FACT_PROMPT_ROWS", 20))      # otherwise, matching rows added to the prompt
+
+# 23. Gemini scheduler: every embed/generate call takes a token from its model's bucket first. Buckets are
+#     shared by the API and the ingest workers (SQLite); waiting calls go out by class:
+#     interactive (/chat) > batch (/chat/batch) > bulk (ingest). Rate-limit errors slow a model down for everyone.
+SCHEDULER_PATH = STATE_DIR / "scheduler.sqlite"
+EMBED_RPM = int(os.getenv("EMBED_RPM", 3000))       # requests per minute per model (your quota); 0 = no limit
+GENERATE_RPM = int(os.getenv("GENERATE_RPM", 1000))
+RATE_BURST_SECONDS = float(os.getenv("RATE_BURST_SECONDS", 2))  # a bucket holds this many seconds of requests
+BULK_RESERVE = float(os.getenv("BULK_RESERVE", 0.25))          # share of a bucket bulk calls never take
+THROTTLE_DECREASE = float(os.getenv("THROTTLE_DECREASE", 0.5))  # rate multiplied by this on each 429
+THROTTLE_RECOVERY = float(os.getenv("THROTTLE_RECOVERY", 0.02))  # given back per successful call
+THROTTLE_MIN = float(os.getenv("THROTTLE_MIN", 0.05))          # never below this share of the rate
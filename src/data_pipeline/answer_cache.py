@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+from collections import Counter, OrderedDict
+from dataclasses import dataclass, field
+import numpy as np
+from config import ANSWER_CACHE_THRESHOLD, ANSWER_CACHE_TTL, ANSWER_CACHE_MAX_ITEMS
+from data_pipeline.collection_version import collection_version
+
+@dataclass
+class CachedAnswer:
+    question: str
+    vector: np.ndarray  # unit length
+    answer: str
+    sources: list
+    scope: tuple = ()   # retrieval filters the answer was produced under
+    created_at: float = field(default_factory=time.time)
+
+class AnswerCache:
+    """
+    Semantic cache for RAG answers.
+    A question whose embedding has cosine similarity >= `threshold` with a cached
+    question gets the cached answer. Entries expire after `ttl` seconds, the least
+    recently used go first beyond `max_items`, and everything is dropped when
+    the collection version changes (new or re-ingested documents). An answer is
+    only stored under the version its lookup saw: one generated from the old
+    collection while an ingest committed is not cached.
+    """
+    def __init__(
+        self,
+        threshold: float = ANSWER_CACHE_THRESHOLD,
+        ttl: float = ANSWER_CACHE_TTL,
+        max_items: int = ANSWER_CACHE_MAX_ITEMS,
+        version_fn=collection_version,
+    ):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_items = max_items
+        self.version_fn = version_fn
+        self.version = version_fn()
+        self.entries: OrderedDict[int, CachedAnswer] = OrderedDict()
+        self.matrix = None  # stacked vectors, rebuilt lazily after changes
+        self.keys = []
+        self.next_key = 0
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+    def lookup(self, vector, scope: tuple = ()) -> tuple[CachedAnswer | None, int]:
+        """(closest answer or None, collection version now): pass the version on to store()."""
+        with self.lock:
+            self._check_version()
+            self._expire()
+            if not self.entries:
+                self.counts["misses"] += 1
+                return None, self.version
+
+            if self.matrix is None:
+                self.keys = list(self.entries)
+                self.matrix = np.stack([self.entries[k].vector for k in self.keys])
+            scores = self.matrix @ _unit(vector)
+            # An answer only counts for questions asked under the same filters
+            scores[[self.entries[k].scope != scope for k in self.keys]] = -1.0
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.counts["misses"] += 1
+                return None, self.version
+
+            key = self.keys[best]
+            self.entries.move_to_end(key)
+            self.counts["hits"] += 1
+            return self.entries[key], self.version
+
+    def store(self, question: str, vector, answer: str, sources: list, scope: tuple = (),
+              version: int | None = None):
+        """Caches the answer, unless the collection changed since the lookup that returned `version`."""
+        with self.lock:
+            self._check_version()
+            if version is not None and version != self.version:
+                self.counts["stale_stores"] += 1
+                return
+            self.entries[self.next_key] = CachedAnswer(question, _unit(vector), answer, sources, scope)
+            self.next_key += 1
+            while len(self.entries) > self.max_items:
+                self.entries.popitem(last=False)
+            self.matrix = None
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.matrix = None
+
+    def stats(self) -> dict:
+        lookups = self.counts["hits"] + self.counts["misses"]
+        return {
+            "hits": self.counts["hits"],
+            "misses": self.counts["misses"],
+            "hit_rate": round(self.counts["hits"] / lookups, 4) if lookups else 0.0,
+            "items": len(self.entries),
+        }
+
+    def _check_version(self):
+        version = self.version_fn()
+        if version != self.version:
+            self.version = version
+            self.entries.clear()
+            self.matrix = None
+            self.counts["invalidations"] += 1
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl
+        expired = [k for k, e in self.entries.items() if e.created_at < cutoff]
+        for k in expired:
+            del self.entries[k]
+        if expired:
+            self.matrix = None
+
+def _unit(vector) -> np.ndarray:
+    v = np.asarray(vector, dtype=np.float32)
+    norm = np.linalg.norm(v)
+    return v / norm if norm else v
+
+# --- Shared instance ---
+_default_cache = None
+
+def get_answer_cache() -> AnswerCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = AnswerCache()
+    return _default_cache
+
+def _reset_after_fork():
+    # Its lock may have been held at fork time
+    global _default_cache
+    _default_cache = None
+
+os.register_at_fork(after_in_child=_reset_after_fork)
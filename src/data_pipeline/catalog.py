@@ -0,0 +1,345 @@
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable
+from config import CATALOG_PATH, SHARD_BY, SHARD_QUERY_WORKERS
+
+# --- Document catalog ---
+# One row per indexed document: who filed it, for which period, and which shard
+# (collection) holds its chunks. Small enough to read on every scoped question.
+
+# EDGAR-style file names: "tsla-20241231.pdf", "aapl-20240928-gen.pdf", "msft_2024q4.pdf"
+FILING_NAME = re.compile(r"^(?P<issuer>[a-z][a-z0-9.]*)[-_](?P<period>\d{8}|\d{4}(?:q[1-4])?)", re.IGNORECASE)
+
+def describe(source: str) -> tuple[str | None, str | None]:
+    """(issuer, period) guessed from the file name; None where it doesn't follow the pattern."""
+    match = FILING_NAME.match(Path(source).name)
+    if not match:
+        return None, None
+    return match["issuer"].lower(), match["period"].lower()
+
+def document_key(filename: str, file_hash: str, document_id: str | None = None) -> str:
+    """
+    The name a document is indexed under (manifest, catalog, chunk ids, facts): the same
+    for every version of one filing, different between filings. An explicit id wins; then
+    issuer and period from an EDGAR-style file name ("tsla-20241231"); else the file name
+    plus the start of its hash, so two unrelated "10-K.pdf" uploads never replace each other.
+    """
+    if document_id and document_id.strip():
+        return document_id.strip()
+    issuer, period = describe(filename)
+    if issuer and period:
+        return f"{issuer}-{period}"
+    return f"{Path(filename).name}@{file_hash[:12]}"
+
+def doc_key(source: str) -> str:
+    """The prefix every chunk id of this document starts with (see chunking.make_chunk_id)."""
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()[:12]
+
+def shard_name(source: str, issuer: str | None, period: str | None, by: str = SHARD_BY) -> str | None:
+    """Shard for a new document; None is the single, unsharded collection."""
+    if by == "none":
+        return None
+    if by == "document":
+        return f"doc_{doc_key(source)}"
+    key = issuer or "unknown"
+    if by == "issuer_period":
+        key += f"_{period or 'unknown'}"
+    elif by != "issuer":
+        raise ValueError(f"Unknown SHARD_BY: {by}")
+    return re.sub(r"[^a-z0-9]+", "_", key.lower()).strip("_")[:40] or "unknown"
+
+class Catalog:
+    """SQLite table of documents -> (issuer, period, shard, chunk count), shared by API and workers."""
+    def __init__(self, path: Path = CATALOG_PATH, by: str = SHARD_BY):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.by = by
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(str(path), check_same_thread=False, timeout=30)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        with self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                " source TEXT PRIMARY KEY, doc_key TEXT, issuer TEXT, period TEXT, shard TEXT,"
+                " chunks INTEGER, updated_at REAL)"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS documents_key ON documents(doc_key)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS documents_issuer ON documents(issuer, period)")
+
+    def register(self, source: str, issuer: str | None = None, period: str | None = None) -> dict:
+        """
+        The document's entry, created on first sight. A document keeps its shard
+        for good (changing SHARD_BY only affects new documents; see --reshard).
+        """
+        if entry := self.entry(source):
+            return entry
+        guessed_issuer, guessed_period = describe(source)
+        issuer, period = issuer or guessed_issuer, period or guessed_period
+        shard = shard_name(source, issuer, period, self.by)
+        with self.lock, self.db:
+            self.db.execute(
+                "INSERT OR IGNORE INTO documents VALUES (?, ?, ?, ?, ?, 0, ?)",
+                (source, doc_key(source), issuer, period, shard, time.time()),
+            )
+        return self.entry(source)
+
+    def entry(self, source: str) -> dict | None:
+        with self.lock:
+            row = self.db.execute("SELECT * FROM documents WHERE source = ?", (source,)).fetchone()
+        return dict(row) if row else None
+
+    def set_chunks(self, source: str, chunks: int):
+        with self.lock, self.db:
+            self.db.execute("UPDATE documents SET chunks = ?, updated_at = ? WHERE source = ?",
+                            (chunks, time.time(), source))
+
+    def move(self, source: str, shard: str | None):
+        with self.lock, self.db:
+            self.db.execute("UPDATE documents SET shard = ?, updated_at = ? WHERE source = ?",
+                            (shard, time.time(), source))
+
+    def find(self, issuer: str | None = None, period: str | None = None) -> list[dict]:
+        sql, params = "SELECT * FROM documents WHERE 1 = 1", []
+        for name, value in (("issuer", issuer), ("period", period)):
+            if value is not None:
+                sql += f" AND {name} = ?"
+                params.append(value.lower())
+        with self.lock:
+            return [dict(row) for row in self.db.execute(sql + " ORDER BY source", params)]
+
+    def shards_for(self, sources: list[str] | None = None) -> list[str | None]:
+        """Shards holding these documents (every shard when None)."""
+        with self.lock:
+            if sources is None:
+                rows = self.db.execute("SELECT DISTINCT shard FROM documents").fetchall()
+            else:
+                rows = []
+                for i in range(0, len(sources), 500):
+                    part = sources[i:i + 500]
+                    rows += self.db.execute(
+                        f"SELECT DISTINCT shard FROM documents WHERE source IN ({','.join('?' * len(part))})", part
+                    ).fetchall()
+        return sorted({row[0] for row in rows}, key=lambda s: s or "")
+
+    def shards_for_ids(self, ids: list[str]) -> dict[str | None, list[str]]:
+        """Groups chunk ids by the shard of their document (via the id's document prefix)."""
+        keys = sorted({cid.split("_", 1)[0] for cid in ids})
+        with self.lock:
+            shard_of = dict(self.db.execute(
+                f"SELECT doc_key, shard FROM documents WHERE doc_key IN ({','.join('?' * len(keys))})", keys
+            ).fetchall()) if keys else {}
+        groups = {}
+        for cid in ids:
+            groups.setdefault(shard_of.get(cid.split("_", 1)[0], None), []).append(cid)
+        return groups
+
+    def summary(self) -> list[dict]:
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT shard, COUNT(*) AS documents, SUM(chunks) AS chunks,"
+                " GROUP_CONCAT(DISTINCT issuer) AS issuers, GROUP_CONCAT(DISTINCT period) AS periods"
+                " FROM documents GROUP BY shard ORDER BY shard"
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+def scope_sources(catalog: Catalog, source: str | None, issuer: str | None, period: str | None) -> list[str] | None:
+    """Documents a question may search: None = all, [] = none match."""
+    if issuer is None and period is None:
+        return None if source is None else [source]
+    sources = [entry["source"] for entry in catalog.find(issuer, period)]
+    return [s for s in sources if s == source] if source is not None else sources
+
+def sources_in(where: dict | None) -> list[str] | None:
+    """The documents a `where` clause restricts to (source equality or $in), None if unrestricted."""
+    for clause in (where or {}).get("$and", [where] if where else []):
+        value = clause.get("source")
+        if isinstance(value, str):
+            return [value]
+        if isinstance(value, dict) and "$in" in value:
+            return list(value["$in"])
+    return None
+
+# --- Sharded store ---
+class ShardedVectorStore:
+    """
+    VectorStore over one collection per shard. Upserts are routed by each chunk's
+    source, deletes by the chunk id's document prefix. A query only searches the
+    shards holding the documents its `where` names (all shards otherwise), in
+    parallel, and merges the hits by distance.
+    """
+    def __init__(self, open_shard: Callable, catalog: Catalog, workers: int = SHARD_QUERY_WORKERS):
+        self.open_shard = open_shard
+        self.catalog = catalog
+        self.stores = {}
+        self.lock = threading.Lock()
+        self.pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="shard")
+
+    def shard(self, name: str | None):
+        with self.lock:
+            if name not in self.stores:
+                self.stores[name] = self.open_shard(name)
+            return self.stores[name]
+
+    def all_shards(self) -> list[str | None]:
+        # The unsharded collection always takes part: documents indexed before the catalog live there
+        return sorted(set(self.catalog.shards_for()) | {None}, key=lambda s: s or "")
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        shard_of, groups = {}, {}
+        for i, meta in enumerate(metadatas):
+            if meta["source"] not in shard_of:
+                shard_of[meta["source"]] = self.catalog.register(meta["source"])["shard"]
+            groups.setdefault(shard_of[meta["source"]], []).append(i)
+        for shard, rows in groups.items():
+            self.shard(shard).upsert(
+                ids=[ids[i] for i in rows], embeddings=[embeddings[i] for i in rows],
+                documents=[documents[i] for i in rows], metadatas=[metadatas[i] for i in rows],
+            )
+
+    def delete(self, ids):
+        for shard, part in self.catalog.shards_for_ids(list(ids)).items():
+            self.shard(shard).delete(part)
+
+    def query(self, query_embeddings, n_results, where=None):
+        sources = sources_in(where)
+        shards = self.all_shards() if sources is None else self.catalog.shards_for(sources) or [None]
+        if len(shards) == 1:
+            return self.shard(shards[0]).query(query_embeddings, n_results=n_results, where=where)
+        parts = list(self.pool.map(
+            lambda name: self.shard(name).query(query_embeddings, n_results=n_results, where=where), shards))
+        return merge_results(parts, len(query_embeddings), n_results)
+
+    def get(self, limit=None, offset=0, include=("documents", "metadatas")):
+        """Pages through the shards in name order, as if they were one collection."""
+        result = {"ids": [], **{name: [] for name in include}}
+        for name in self.all_shards():
+            store = self.shard(name)
+            size = store.count()
+            if offset >= size:
+                offset -= size
+                continue
+            want = None if limit is None else limit - len(result["ids"])
+            part = store.get(limit=want, offset=offset, include=include)
+            offset = 0
+            for key in result:
+                value = part.get(key)  # Chroma returns embeddings as an array: no truth test
+                result[key].extend([] if value is None else value)
+            if limit is not None and len(result["ids"]) >= limit:
+                break
+        return result
+
+    def count(self):
+        return sum(self.shard(name).count() for name in self.all_shards())
+
+def merge_results(parts: list[dict], n_queries: int, n_results: int) -> dict:
+    """Per query, the `n_results` smallest distances across every shard's result."""
+    fields = ["ids", "documents", "metadatas", "distances"]
+    merged = {name: [] for name in fields}
+    for q in range(n_queries):
+        hits = [
+            (part["distances"][q][j], *(part[name][q][j] if part.get(name) else None for name in fields))
+            for part in parts for j in range(len(part["ids"][q]))
+        ]
+        hits.sort(key=lambda hit: hit[0])
+        for i, name in enumerate(fields):
+            merged[name].append([hit[i + 1] for hit in hits[:n_results]])
+    return merged
+
+# --- Shared instance ---
+_default_catalog = None
+
+def get_catalog() -> Catalog:
+    global _default_catalog
+    if _default_catalog is None:
+        _default_catalog = Catalog()
+    return _default_catalog
+
+def _reset_after_fork():
+    # SQLite connections must not cross a fork; the child reopens on first use
+    global _default_catalog
+    _default_catalog = None
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+# --- CLI: python -m data_pipeline.catalog [--backfill] [--reshard] ---
+def backfill(catalog: Catalog, store, page_size: int = 1000) -> int:
+    """Registers the documents already in the unsharded collection (indexed before the catalog)."""
+    chunks, offset = {}, 0
+    while True:
+        batch = store.get(limit=page_size, offset=offset, include=["metadatas"])
+        if not batch["ids"]:
+            break
+        for meta in batch["metadatas"]:
+            chunks[meta["source"]] = chunks.get(meta["source"], 0) + 1
+        offset += len(batch["ids"])
+    new = [source for source in chunks if catalog.entry(source) is None]
+    for source in new:
+        catalog.register(source)
+        catalog.move(source, None)  # that's where its chunks are
+        catalog.set_chunks(source, chunks[source])
+    return len(new)
+
+def reshard(catalog: Catalog, open_shard: Callable, page_size: int = 1000) -> int:
+    """
+    Moves documents from the unsharded collection into their SHARD_BY shards.
+    Stored vectors are copied as they are: no embedding calls.
+    """
+    default = open_shard(None)
+    targets = {
+        entry["source"]: shard_name(entry["source"], entry["issuer"], entry["period"], catalog.by)
+        for entry in catalog.find() if entry["shard"] is None
+    }
+    moved, offset = {}, 0
+    while True:
+        batch = default.get(limit=page_size, offset=offset, include=["embeddings", "documents", "metadatas"])
+        if not batch["ids"]:
+            break
+        offset += len(batch["ids"])
+        groups = {}
+        for i, meta in enumerate(batch["metadatas"]):
+            if targets.get(meta["source"]):
+                groups.setdefault(targets[meta["source"]], []).append(i)
+        for shard, rows in groups.items():
+            open_shard(shard).upsert(
+                ids=[batch["ids"][i] for i in rows], embeddings=[batch["embeddings"][i] for i in rows],
+                documents=[batch["documents"][i] for i in rows], metadatas=[batch["metadatas"][i] for i in rows],
+            )
+            for i in rows:
+                moved.setdefault(batch["metadatas"][i]["source"], []).append(batch["ids"][i])
+
+    # Only now: deleting while paging would shift the offsets
+    for source, ids in moved.items():
+        catalog.move(source, targets[source])
+        default.delete(ids)
+    return len(moved)
+
+def main():
+    from data_pipeline.vector_store import open_vector_store
+    from config import EMBED_STORE_DIM
+
+    parser = argparse.ArgumentParser(description="Show the shard catalog; register or move unsharded documents.")
+    parser.add_argument("--backfill", action="store_true", help="register documents indexed before the catalog")
+    parser.add_argument("--reshard", action="store_true", help=f"move unsharded documents into shards by {SHARD_BY}")
+    args = parser.parse_args()
+
+    catalog = get_catalog()
+    open_shard = lambda shard: open_vector_store(dim=EMBED_STORE_DIM, shard=shard)
+    if args.backfill:
+        print(f"📇 Registered {backfill(catalog, open_shard(None))} documents")
+    if args.reshard:
+        if catalog.by == "none":
+            raise SystemExit("❌ Set SHARD_BY (document, issuer or issuer_period) first")
+        print(f"🧩 Moved {reshard(catalog, open_shard)} documents into shards")
+    for row in catalog.summary():
+        print(f"  {row['shard'] or '(unsharded)':<40} {row['documents']:>5} docs {row['chunks'] or 0:>8} chunks"
+              f"  issuers={row['issuers'] or '-'} periods={row['periods'] or '-'}")
+
+if __name__ == "__main__":
+    main()
@@ -1,26 +1,200 @@
+import hashlib
+import os
+import re
+from collections import Counter, deque
+from dataclasses import dataclass
+from pathlib import Path
 from typing import Iterator
 from langchain_text_splitters import RecursiveCharacterTextSplitter
+from config import CHUNK_TOKENS, CHUNK_OVERLAP_TOKENS, CHUNK_ANCHOR_PAGES, TIKTOKEN_CACHE_DIR
+from data_pipeline.metrics import CHUNK_SPLIT_SECONDS
+
+PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+ENDS_SENTENCE = re.compile(r"[.!?:;]\s*$")
+
+def make_chunk_id(source: str, page: int, text: str, occurrence: int = 0) -> str:
+    """
+    Deterministic id: same document, page and text -> same id.
+    Re-ingesting a file therefore upserts in place instead of duplicating.
+    """
+    doc = hashlib.sha256(source.encode("utf-8")).hexdigest()[:12]
+    content = hashlib.sha256(text.encode("utf-8")).hexdigest()[:16]
+    suffix = f"_{occurrence}" if occurrence else ""
+    return f"{doc}_pg{page}_{content}{suffix}"
+
+# --- Token counting ---
+# tiktoken's cl100k_base is close enough to Gemini's tokenizer for sizing chunks.
+# Its vocabulary is downloaded once into TIKTOKEN_CACHE_DIR (API warmup, WorkerPool.start);
+# ingest workers only read it from there. Without it we use ~4 characters per token.
+_encoding = None  # False once we know tiktoken is unavailable
+
+def load_tokenizer(download: bool = True) -> bool:
+    """Loads cl100k_base once per process; False means chunks are sized at ~4 characters per token."""
+    global _encoding
+    if _encoding is None:
+        os.environ.setdefault("TIKTOKEN_CACHE_DIR", str(TIKTOKEN_CACHE_DIR))
+        cache = Path(os.environ["TIKTOKEN_CACHE_DIR"])
+        try:
+            if not download and not (cache.is_dir() and any(cache.iterdir())):
+                raise RuntimeError(f"no vocabulary in {cache} (run warmup first)")
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            # Token counts (and so chunk boundaries) differ from tiktoken's: say so, once
+            print(f"⚠️ tiktoken unavailable, sizing chunks at ~4 characters per token: {e}")
+            _encoding = False
+    return bool(_encoding)
+
+def count_tokens(text: str) -> int:
+    if _encoding is None:
+        load_tokenizer()
+    if _encoding:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return max(1, (len(text) + 3) // 4)
+
+@dataclass
+class _Piece:
+    text: str
+    page: int
+    tokens: int
+    sep: str  # what joins it to the piece before it
 
 class Chunker:
-    def __init__(self):
+    """
+    Streaming, token-sized chunker.
+    Pages are cut into sentences, and sentences are packed into chunks of up to
+    `chunk_tokens`, carrying a rolling buffer across page breaks. A sentence or
+    table that continues on the next page stays in one chunk, and short pages
+    share a chunk instead of each costing an embedding. Consecutive chunks share
+    about `overlap_tokens` of trailing sentences. Memory is one chunk plus one page.
+
+    Packing restarts (no overlap carried) every `anchor_pages` pages, so an edit
+    only moves the chunk boundaries of its own page group and a re-ingest
+    re-embeds that group instead of everything after the edit.
+    """
+    def __init__(self, chunk_tokens: int = CHUNK_TOKENS, overlap_tokens: int = CHUNK_OVERLAP_TOKENS,
+                 anchor_pages: int = CHUNK_ANCHOR_PAGES):
+        self.chunk_tokens = chunk_tokens
+        self.overlap_tokens = overlap_tokens
+        self.anchor_pages = anchor_pages
+        # Only for single sentences longer than a whole chunk (tables, run-on lines)
         self.splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            separators=["\n\n", "\n", ".", " ", ""]
+            chunk_size=chunk_tokens,
+            chunk_overlap=0,
+            length_function=count_tokens,
+            separators=["\n", " ", ""]
         )
 
-    def process(self, page_stream: Iterator[dict], job_id: str) -> Iterator[dict]:
+    def process(self, page_stream: Iterator[dict], job_id: str, cursor: dict | None = None) -> Iterator[dict]:
         """
         Stream Transformer: Consumes Pages -> Yields Chunks.
+        Chunks carry `start_page` / `end_page`; `page` is the start page.
+        Each chunk also carries a `cursor`: the chunker's state right after it.
+        Passing a chunk's cursor back (with pages from cursor["page"] on) continues
+        exactly where that chunk left off, producing the same chunks and ids.
         """
+        cursor = cursor or {}
+        buffer: deque[_Piece] = deque(_Piece(*p) for p in cursor.get("carry", []))
+        buffered = sum(p.tokens for p in buffer)  # tokens in buffer
+        fresh = False     # buffer holds something not yet emitted (not just overlap)
+        # Identical text at the same start page still needs distinct ids
+        seen = Counter({(page, base_id): n for page, base_id, n in cursor.get("seen", [])})
+        skip = cursor.get("piece", 0)  # pieces of the first page already emitted before the cursor
+        resumed_runs_on = cursor.get("runs_on")  # the carry may no longer hold the sentence that ran on
+        source = None
+        last_page = cursor.get("page", 1) - 1
+
         for page in page_stream:
-            text = page['content']
-            chunks_text = self.splitter.split_text(text)
-            
-            for i, chunk_text in enumerate(chunks_text):
-                yield {
-                    "chunk_id": f"pg{page['page_number']}_chk{i}_{job_id}",
-                    "page": page['page_number'],
-                    "text": chunk_text,
-                    "source": page['source']
-                }
\ No newline at end of file
+            source = page['source']
+            last_page = page['page_number']
+            with CHUNK_SPLIT_SECONDS.time():
+                pieces = self._pieces(page)
+            runs_on = bool(pieces and buffer and not ENDS_SENTENCE.search(buffer[-1].text))
+            if resumed_runs_on is not None:
+                runs_on, resumed_runs_on = bool(pieces) and resumed_runs_on, None
+            if runs_on:
+                pieces[0].sep = " "  # the sentence runs on across the page break
+            # Page-group start: cut after the run-on sentence (if any) ends, carrying nothing over
+            anchor = 1 if runs_on else 0
+            if not (self.anchor_pages and (last_page - 1) % self.anchor_pages == 0):
+                anchor = None
+
+            start, skip = skip, 0
+            for i in range(start, len(pieces)):
+                piece = pieces[i]
+                if i == anchor and buffer:
+                    if fresh:
+                        chunk = self._chunk(buffer, source, job_id, seen)
+                        chunk["cursor"] = self._cursor(last_page, i, deque(), seen, runs_on)
+                        yield chunk
+                    buffer.clear()
+                    buffered, fresh = 0, False
+                if fresh and buffered + piece.tokens > self.chunk_tokens:
+                    chunk = self._chunk(buffer, source, job_id, seen)
+                    fresh = False
+                    while buffer and buffered > self.overlap_tokens:
+                        buffered -= buffer.popleft().tokens
+                    chunk["cursor"] = self._cursor(last_page, i, buffer, seen, runs_on)
+                    yield chunk
+                if not fresh:
+                    # Only overlap left: drop as much of it as the next piece needs
+                    while buffer and buffered + piece.tokens > self.chunk_tokens:
+                        buffered -= buffer.popleft().tokens
+                buffer.append(piece)
+                buffered += piece.tokens
+                fresh = True
+
+        if fresh:
+            chunk = self._chunk(buffer, source, job_id, seen)
+            chunk["cursor"] = self._cursor(last_page + 1, 0, deque(), Counter())
+            yield chunk
+
+    @staticmethod
+    def _cursor(page: int, piece: int, buffer: deque, seen: Counter, runs_on: bool = False) -> dict:
+        """
+        JSON-able state: next page/piece to read, the overlap carried into the next chunk,
+        ids used, and whether that page's first sentence continues the previous page.
+        """
+        # Later chunks start at the carried overlap (or the current page) at the earliest
+        first = buffer[0].page if buffer else page
+        return {
+            "page": page,
+            "piece": piece,
+            "carry": [[p.text, p.page, p.tokens, p.sep] for p in buffer],
+            "seen": [[pg, base_id, n] for (pg, base_id), n in seen.items() if pg >= first],
+            "runs_on": runs_on,
+        }
+
+    def _pieces(self, page: dict) -> list[_Piece]:
+        pieces = []
+        for paragraph in PARAGRAPH_BREAK.split(page['content']):
+            sentences = [s for s in SENTENCE_END.split(paragraph.strip()) if s]
+            for i, sentence in enumerate(sentences):
+                tokens = count_tokens(sentence)
+                parts = [sentence] if tokens <= self.chunk_tokens else self.splitter.split_text(sentence)
+                for j, part in enumerate(parts):
+                    pieces.append(_Piece(
+                        text=part,
+                        page=page['page_number'],
+                        tokens=tokens if len(parts) == 1 else count_tokens(part),
+                        sep="\n\n" if i == 0 and j == 0 else " ",
+                    ))
+        return pieces
+
+    def _chunk(self, buffer: deque, source: str, job_id: str, seen: Counter) -> dict:
+        text = buffer[0].text + "".join(p.sep + p.text for p in list(buffer)[1:])
+        start_page, end_page = buffer[0].page, buffer[-1].page
+        base_id = make_chunk_id(source, start_page, text)
+        occurrence = seen[start_page, base_id]
+        seen[start_page, base_id] += 1
+        return {
+            "chunk_id": make_chunk_id(source, start_page, text, occurrence),
+            "job_id": job_id,
+            "page": start_page,
+            "start_page": start_page,
+            "end_page": end_page,
+            "tokens": sum(p.tokens for p in buffer),
+            "text": text,
+            "source": source
+        }
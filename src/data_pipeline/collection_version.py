@@ -0,0 +1,26 @@
+import fcntl
+import os
+from pathlib import Path
+from config import COLLECTION_VERSION_PATH
+
+# A cross-process "the collection changed" signal.
+# Writers (ingest workers) bump it after every upsert/delete; readers (the API)
+# compare it with the version their caches were built against. The file holds a
+# counter (a timestamp can repeat on coarse filesystems); one small read per check.
+
+def bump_collection_version(path: Path = COLLECTION_VERSION_PATH) -> int:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path.with_suffix(".lock"), "a") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)  # concurrent bumps from several workers each count
+        version = collection_version(path) + 1
+        tmp = path.with_suffix(f".{os.getpid()}.tmp")
+        tmp.write_text(str(version))
+        os.replace(tmp, path)  # atomic, readers never see a half-written file
+    return version
+
+def collection_version(path: Path = COLLECTION_VERSION_PATH) -> int:
+    try:
+        return int(Path(path).read_text() or 0)
+    except (FileNotFoundError, ValueError):
+        return 0
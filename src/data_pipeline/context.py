@@ -0,0 +1,113 @@
+from dataclasses import dataclass, field
+from config import CONTEXT_TOKENS
+from data_pipeline.chunking import count_tokens
+
+MIN_OVERLAP = 20  # characters; shorter suffix/prefix matches are coincidence, not chunk overlap
+GAP = "\n…\n"     # joins two excerpts of the same page that don't touch
+
+@dataclass
+class Passage:
+    """One or more retrieved chunks of the same document, merged into a single excerpt."""
+    source: str
+    start_page: int
+    end_page: int
+    text: str
+    rank: int  # best (lowest) retrieval rank among its chunks
+    chunk_ids: list[str] = field(default_factory=list)
+
+    def touches(self, start_page: int, end_page: int) -> bool:
+        return start_page <= self.end_page and end_page >= self.start_page
+
+@dataclass
+class Context:
+    text: str              # numbered excerpts, ready for the prompt
+    citations: list[dict]  # [{"n", "source", "page", "start_page", "end_page", "ids"}], in [n] order
+    tokens: int
+    dropped: int           # passages that didn't fit the budget
+
+def overlap(a: str, b: str) -> int:
+    """Length of the longest suffix of `a` that is also a prefix of `b` (0 if under MIN_OVERLAP)."""
+    probe = b[:MIN_OVERLAP]
+    start = a.find(probe, max(0, len(a) - len(b)))
+    while start != -1:
+        if b.startswith(a[start:]):
+            return len(a) - start
+        start = a.find(probe, start + 1)
+    return 0
+
+def merge_text(first: str, second: str) -> str:
+    """Joins two excerpts in reading order, keeping their shared text once."""
+    if second in first:
+        return first
+    if first in second:
+        return second
+    shared = overlap(first, second)
+    if shared:
+        return first + second[shared:]
+    shared = overlap(second, first)
+    if shared:
+        return second + first[shared:]
+    return first + GAP + second
+
+def merge_passages(results: dict) -> list[Passage]:
+    """
+    Chunks of the same source whose pages touch become one passage, in reading order,
+    with the overlap between neighbouring chunks removed. Passages keep the best rank they got.
+    """
+    passages: list[Passage] = []
+    for rank, (chunk_id, text, meta) in enumerate(zip(
+        results["ids"][0], results["documents"][0], results["metadatas"][0]
+    )):
+        start = meta.get("start_page", meta.get("page"))
+        end = meta.get("end_page", meta.get("page"))
+        target = next(
+            (p for p in passages if p.source == meta.get("source") and p.touches(start, end)), None
+        )
+        if target is None:
+            passages.append(Passage(meta.get("source"), start, end, text, rank, [chunk_id]))
+            continue
+        # Earlier pages first; on the same page merge_text finds the order from the overlap
+        if start < target.start_page:
+            target.text = merge_text(text, target.text)
+        else:
+            target.text = merge_text(target.text, text)
+        target.start_page = min(target.start_page, start)
+        target.end_page = max(target.end_page, end)
+        target.chunk_ids.append(chunk_id)
+    return passages
+
+def build_context(results: dict, budget: int = CONTEXT_TOKENS) -> Context:
+    """
+    Packs merged passages, most relevant first, into at most `budget` tokens.
+    A passage that doesn't fit is skipped in favour of later, smaller ones;
+    only a top passage larger than the whole budget is truncated.
+    """
+    parts, citations, used, dropped = [], [], 0, 0
+    for passage in sorted(merge_passages(results), key=lambda p: p.rank):
+        pages = f"p. {passage.start_page}" if passage.start_page == passage.end_page \
+            else f"pp. {passage.start_page}-{passage.end_page}"
+        block = f"[{len(citations) + 1}] {passage.source}, {pages}\n{passage.text}"
+        tokens = count_tokens(block)
+        if used + tokens > budget:
+            if citations:
+                dropped += 1
+                continue
+            block = _truncate(block, budget)
+            tokens = count_tokens(block)
+        parts.append(block)
+        used += tokens
+        citations.append({
+            "n": len(citations) + 1,
+            "source": passage.source,
+            "page": passage.start_page,
+            "start_page": passage.start_page,
+            "end_page": passage.end_page,
+            "ids": passage.chunk_ids,
+        })
+    return Context("\n\n".join(parts), citations, used, dropped)
+
+def _truncate(text: str, budget: int) -> str:
+    # Token counts are roughly proportional to length: shrink until it fits
+    while count_tokens(text) > budget and len(text) > 1:
+        text = text[:max(1, int(len(text) * budget / count_tokens(text) * 0.95))]
+    return text
@@ -0,0 +1,120 @@
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Sequence
+from config import (
+    get_client, EMBEDDING_MODEL,
+    EMBED_BATCH_SIZE, EMBED_CONCURRENCY,
+    EMBED_MAX_RETRIES, EMBED_BACKOFF_BASE, EMBED_BACKOFF_MAX,
+)
+from data_pipeline.embedding_cache import EmbeddingCache, get_embedding_cache
+from data_pipeline.scheduler import BULK, GeminiScheduler, get_scheduler, is_rate_limited
+from data_pipeline.metrics import EMBED_CALL_SECONDS, EMBED_TEXTS, EMBED_RETRIES
+
+class EmbeddingEngine:
+    """
+    Batched, concurrent embedder.
+    Splits texts into requests of `batch_size`, keeps up to `concurrency`
+    requests in flight and retries rate-limited requests with backoff.
+    With a `cache`, only texts it has never seen are sent to the API.
+    Every request waits for its turn at the `scheduler` (shared Gemini quota);
+    ingest calls are bulk, the lowest class.
+    Any object exposing `models.embed_content` works as `client`,
+    so a local fake can stand in for Gemini.
+    """
+    def __init__(
+        self,
+        client=None,
+        model: str = EMBEDDING_MODEL,
+        batch_size: int = EMBED_BATCH_SIZE,
+        concurrency: int = EMBED_CONCURRENCY,
+        max_retries: int = EMBED_MAX_RETRIES,
+        backoff_base: float = EMBED_BACKOFF_BASE,
+        backoff_max: float = EMBED_BACKOFF_MAX,
+        sleep=time.sleep,
+        cache: EmbeddingCache | None = None,
+        scheduler: GeminiScheduler | None = None,
+    ):
+        self.client = client if client is not None else get_client()
+        self.scheduler = scheduler or get_scheduler()
+        self.model = model
+        self.cache = cache
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.sleep = sleep
+        self.pool = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="embed")
+
+    def embed(self, texts: Sequence[str], priority: str = BULK) -> list[list[float]]:
+        """
+        Returns one vector per text, in input order. Raises if any batch gives up.
+        `priority` is the scheduler class of the requests (a question is "interactive").
+        """
+        if self.cache is None:
+            return self._embed_uncached(texts, priority)
+
+        vectors = self.cache.get_many(texts)
+        todo = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+        if todo:
+            fresh = dict(zip(todo, self._embed_uncached(todo, priority)))
+            self.cache.put_many(todo, [fresh[t] for t in todo])
+            vectors = [fresh[t] if v is None else v for t, v in zip(texts, vectors)]
+        return vectors
+
+    def _embed_uncached(self, texts: Sequence[str], priority: str = BULK) -> list[list[float]]:
+        batches = [list(texts[i:i + self.batch_size]) for i in range(0, len(texts), self.batch_size)]
+        if len(batches) <= 1:
+            # Nothing to overlap, skip the thread hop
+            return self._embed_batch(batches[0], priority) if batches else []
+
+        # map() keeps results in submission order; the pool size bounds in-flight requests
+        results = self.pool.map(lambda batch: self._embed_batch(batch, priority), batches)
+        return [vector for batch in results for vector in batch]
+
+    def _embed_batch(self, texts: list[str], priority: str = BULK) -> list[list[float]]:
+        attempt = 0
+        # Bulk calls are ingest; the rest are questions (the sync query path comes through here too)
+        path = "ingest" if priority == BULK else "query"
+        EMBED_TEXTS.inc(len(texts), path=path)
+        while True:
+            self.scheduler.acquire(self.model, priority)
+            start = time.perf_counter()
+            try:
+                response = self.client.models.embed_content(model=self.model, contents=texts)
+                EMBED_CALL_SECONDS.observe(time.perf_counter() - start, path=path, outcome="ok")
+                self.scheduler.report(self.model, priority)
+                return [e.values for e in response.embeddings]
+            except Exception as e:
+                self.scheduler.report(self.model, priority, e)
+                limited = is_rate_limited(e)
+                EMBED_CALL_SECONDS.observe(
+                    time.perf_counter() - start, path=path, outcome="rate_limited" if limited else "error")
+                if attempt >= self.max_retries or not limited:
+                    raise
+                EMBED_RETRIES.inc(path=path)
+                # Exponential backoff with jitter so parallel batches don't retry in lockstep
+                delay = min(self.backoff_max, self.backoff_base * (2 ** attempt))
+                attempt += 1
+                print(f"⏳ Rate limited, retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                self.sleep(delay * random.uniform(0.5, 1.0))
+
+    def close(self):
+        self.pool.shutdown(wait=True)
+
+# --- Shared instance (one thread pool per process) ---
+_default_engine = None
+
+def get_default_engine() -> EmbeddingEngine:
+    global _default_engine
+    if _default_engine is None:
+        _default_engine = EmbeddingEngine(cache=get_embedding_cache())
+    return _default_engine
+
+def _reset_after_fork():
+    # The parent's pool threads don't exist in a forked child
+    global _default_engine
+    _default_engine = None
+
+os.register_at_fork(after_in_child=_reset_after_fork)
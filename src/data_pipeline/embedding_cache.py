@@ -0,0 +1,172 @@
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import Counter, OrderedDict
+from pathlib import Path
+from typing import Sequence
+from config import EMBEDDING_MODEL, EMBED_CACHE_PATH, EMBED_CACHE_MEMORY_ITEMS, EMBED_CACHE_MAX_ROWS
+
+class EmbeddingCache:
+    """
+    Two-tier, content-addressed embedding cache.
+    Tier 1: in-memory LRU (per process).
+    Tier 2: SQLite file (shared by the API and ingest workers).
+    Keys are sha256(model + text), and the file is wiped when the model changes.
+    """
+    def __init__(
+        self,
+        path: Path = EMBED_CACHE_PATH,
+        model: str = EMBEDDING_MODEL,
+        memory_items: int = EMBED_CACHE_MEMORY_ITEMS,
+        max_rows: int = EMBED_CACHE_MAX_ROWS,
+    ):
+        self.model = model
+        self.memory_items = memory_items
+        self.max_rows = max_rows
+        self.memory = OrderedDict()
+        self.counts = Counter()
+        self.lock = threading.Lock()
+
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB, last_used REAL)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS embeddings_last_used ON embeddings(last_used)")
+        self._check_model()
+        self.disk_rows = self.db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def _check_model(self):
+        """Drops every stored vector if they were produced by another model."""
+        row = self.db.execute("SELECT value FROM meta WHERE name = 'model'").fetchone()
+        if row and row[0] == self.model:
+            return
+        if row:
+            print(f"♻️ Embedding model changed ({row[0]} -> {self.model}), clearing cache")
+        self.db.execute("DELETE FROM embeddings")
+        self.db.execute("INSERT OR REPLACE INTO meta VALUES ('model', ?)", (self.model,))
+
+    def key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model}\0{text}".encode("utf-8")).hexdigest()
+
+    # --- Lookups ---
+    def get_many(self, texts: Sequence[str]) -> list[list[float] | None]:
+        """One slot per text: the cached vector, or None on a miss."""
+        keys = [self.key(t) for t in texts]
+        found = {}
+        missing = []
+
+        with self.lock:
+            for k in keys:
+                if k in self.memory:
+                    self.memory.move_to_end(k)
+                    found[k] = self.memory[k]
+                    self.counts["memory_hits"] += 1
+                elif k not in missing:
+                    missing.append(k)
+
+            if missing:
+                now = time.time()
+                for i in range(0, len(missing), 500):  # stay under SQLite's variable limit
+                    part = missing[i:i + 500]
+                    marks = ",".join("?" * len(part))
+                    rows = self.db.execute(
+                        f"SELECT key, vector FROM embeddings WHERE key IN ({marks})", part
+                    ).fetchall()
+                    for k, blob in rows:
+                        found[k] = self._decode(blob)
+                        self._remember(k, found[k])
+                    if rows:
+                        self.db.execute(
+                            f"UPDATE embeddings SET last_used = ? WHERE key IN ({marks})", [now, *part]
+                        )
+                self.counts["disk_hits"] += sum(1 for k in missing if k in found)
+                self.counts["misses"] += sum(1 for k in missing if k not in found)
+
+        return [found.get(k) for k in keys]
+
+    def put_many(self, texts: Sequence[str], vectors: Sequence[Sequence[float]]):
+        now = time.time()
+        rows = [(self.key(t), self._encode(v), now) for t, v in zip(texts, vectors)]
+        with self.lock:
+            for (k, _, _), v in zip(rows, vectors):
+                self._remember(k, list(v))
+            before = self.db.total_changes
+            self.db.executemany("INSERT OR IGNORE INTO embeddings VALUES (?, ?, ?)", rows)
+            self.disk_rows += self.db.total_changes - before
+            if self.disk_rows > self.max_rows:
+                self._evict_disk()
+
+    # --- Housekeeping ---
+    def _remember(self, key, vector):
+        self.memory[key] = vector
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_items:
+            self.memory.popitem(last=False)
+
+    def _evict_disk(self):
+        # Drop the least recently used 10% so we don't evict on every insert
+        excess = self.disk_rows - int(self.max_rows * 0.9)
+        self.db.execute(
+            "DELETE FROM embeddings WHERE key IN "
+            "(SELECT key FROM embeddings ORDER BY last_used LIMIT ?)", (excess,)
+        )
+        self.disk_rows = self.db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def clear(self):
+        with self.lock:
+            self.memory.clear()
+            self.db.execute("DELETE FROM embeddings")
+            self.disk_rows = 0
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.counts["memory_hits"] + self.counts["disk_hits"] + self.counts["misses"]
+            hits = self.counts["memory_hits"] + self.counts["disk_hits"]
+            return {
+                "model": self.model,
+                "memory_hits": self.counts["memory_hits"],
+                "disk_hits": self.counts["disk_hits"],
+                "misses": self.counts["misses"],
+                "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+                "memory_items": len(self.memory),
+                "disk_rows": self.disk_rows,
+            }
+
+    @staticmethod
+    def _encode(vector) -> bytes:
+        return array("f", vector).tobytes()
+
+    @staticmethod
+    def _decode(blob: bytes) -> list[float]:
+        vector = array("f")
+        vector.frombytes(blob)
+        return vector.tolist()
+
+def stats_diff(before: dict, after: dict) -> dict:
+    """Hits and misses between two stats() snapshots (e.g. one job's); sizes are as of `after`."""
+    counts = {name: after[name] - before.get(name, 0) for name in ("memory_hits", "disk_hits", "misses")}
+    lookups = sum(counts.values())
+    hits = counts["memory_hits"] + counts["disk_hits"]
+    return {**after, **counts, "hit_rate": round(hits / lookups, 4) if lookups else 0.0}
+
+# --- Shared instance (one per process, file shared across processes) ---
+_default_cache = None
+
+def get_embedding_cache() -> EmbeddingCache:
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = EmbeddingCache()
+    return _default_cache
+
+def _reset_after_fork():
+    # SQLite connections must not cross a fork; the child reopens on first use
+    global _default_cache
+    _default_cache = None
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,314 @@
+import argparse
+import os
+import re
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Iterator
+from config import FACTS_PATH, FACT_PROMPT_ROWS
+from data_pipeline.catalog import describe, get_catalog
+from data_pipeline.lexical import tokenize
+
+# --- Financial facts ---
+# Page text flattens statement tables into a jumble of labels and numbers.
+# The ingestor also runs PyMuPDF's table finder (page["tables"]); here each table
+# becomes one row per (line item, period column): "Total revenues", "2024", 97690.
+# A question that names a line item and a period is then a SQLite lookup.
+
+YEAR_RE = re.compile(r"(?<![\d,.])(?:fy\s?'?)?((?:19|20)\d{2})(?![\d,.])", re.IGNORECASE)
+UNIT_RE = re.compile(r"\bin (thousands|millions|billions)\b", re.IGNORECASE)
+EMPTY_CELLS = {"", "-", "—", "–", "−", "n/a", "nm", "*"}
+# Words that say "give me a number" without naming which one
+LOOKUP_WORDS = {"much", "many", "amount", "value", "figure", "number", "report", "reported", "company",
+                "year", "fiscal", "fy", "quarter", "period", "ended", "ending", "tell", "show", "give", "me"}
+# Questions that want an explanation, not a figure: never answered from the table alone
+ANALYSIS_RE = re.compile(r"\b(why|explain|compar|trend|driv|impact|caus|chang|grow|growth|increas|decreas|versus|vs)",
+                         re.IGNORECASE)
+
+def parse_number(cell: str | None) -> float | None:
+    """'$ 1,234.5' -> 1234.5, '(1,234)' -> -1234.0, '—' -> None."""
+    text = re.sub(r"[\s$€£,]", "", cell or "").lower()
+    if text in EMPTY_CELLS:
+        return None
+    negative = (text.startswith("(") and text.endswith(")")) or text.startswith(("-", "−"))
+    try:
+        value = float(text.strip("()-−%"))
+    except ValueError:
+        return None
+    return -value if negative else value
+
+def find_period(text: str) -> str | None:
+    """The fiscal year a header names ('Year Ended December 31, 2024' -> '2024'); None if 0 or 2+."""
+    years = set(YEAR_RE.findall(text or ""))
+    return years.pop() if len(years) == 1 else None
+
+def _stem(token: str) -> str:
+    return token[:-1] if len(token) > 3 and token.endswith("s") and not token.endswith("ss") else token
+
+def item_key(label: str) -> str:
+    """Normalized line item: 'Total Revenues' and 'Total revenue' -> 'total revenue'."""
+    return " ".join(_stem(t) for t in tokenize(label) if len(t) > 1)
+
+def _is_year(cell: str) -> bool:
+    return bool(re.fullmatch(r"(?:fy\s?)?(?:19|20)\d{2}", (cell or "").strip(), re.IGNORECASE))
+
+def _has_values(row: list[str]) -> bool:
+    return any(parse_number(cell) is not None and not _is_year(cell) for cell in row[1:])
+
+def _clean(cell: str | None) -> str:
+    return " ".join((cell or "").split())
+
+def _spread(row: list[str]) -> list[str]:
+    """A header cell without a year ("Year Ended December 31,") spans the empty cells to its right."""
+    spread = list(row)
+    for j in range(2, len(spread)):
+        if not spread[j] and spread[j - 1] and not find_period(spread[j - 1]):
+            spread[j] = spread[j - 1]
+    return spread
+
+def normalize_table(rows: list[list[str]], page_text: str = "") -> list[dict]:
+    """
+    Facts of one extracted table. Leading rows without values are the header
+    (spanning titles included); a column whose header names one year is a period column. Values may sit a
+    cell or two right of their header ("$" columns), so each period column
+    reads up to the next one. Rows with a label but no values are section titles.
+    """
+    rows = [[_clean(cell) for cell in row] for row in rows if row]
+    body = next((i for i, row in enumerate(rows) if _has_values(row)), None)
+    if body is None:
+        return []
+    width = max(len(row) for row in rows)
+    header_rows = [_spread(row + [""] * (width - len(row))) for row in rows[:body]]
+    headers = [" ".join(row[j] for row in header_rows if row[j]) for j in range(width)]
+    columns = [j for j in range(1, width) if find_period(headers[j])]
+    if not columns:
+        return []
+    unit = UNIT_RE.search(" ".join(headers)) or UNIT_RE.search(page_text)
+    unit = unit[1].lower() if unit else None
+
+    facts, section = [], None
+    for r, row in enumerate(rows[body:], start=body):
+        label = row[0] if row else ""
+        if not _has_values(row):
+            section = label or section
+            continue
+        if not item_key(label):
+            continue
+        for n, j in enumerate(columns):
+            stop = columns[n + 1] if n + 1 < len(columns) else width
+            value = next((v for v in map(parse_number, row[j:stop]) if v is not None), None)
+            if value is not None:
+                facts.append({
+                    "row": r, "label": label, "item": item_key(label), "section": section,
+                    "period": find_period(headers[j]), "column": headers[j], "value": value, "unit": unit,
+                })
+    return facts
+
+def page_facts(page: dict) -> list[dict]:
+    """Every table's facts for one extracted page (see PDFIngestor), numbered by table."""
+    return [
+        {**fact, "table": t}
+        for t, rows in enumerate(page.get("tables") or [])
+        for fact in normalize_table(rows, page.get("content", ""))
+    ]
+
+class FactStore:
+    """
+    SQLite table of line-item values keyed by (document, period, line item),
+    written page by page during ingest; reads are index lookups.
+    """
+    def __init__(self, path: Path = FACTS_PATH):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(str(path), check_same_thread=False, timeout=30)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        with self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS facts ("
+                " source TEXT, page INTEGER, tbl INTEGER, row INTEGER, item TEXT, label TEXT, section TEXT,"
+                " period TEXT, column_label TEXT, value REAL, unit TEXT)"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS facts_item ON facts(item, period)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS facts_source ON facts(source, page)")
+
+    def pages(self, source: str) -> set[int]:
+        """Pages of this document that have facts."""
+        with self.lock:
+            return {row[0] for row in self.db.execute("SELECT DISTINCT page FROM facts WHERE source = ?", (source,))}
+
+    def put_page(self, source: str, page: int, facts: list[dict]):
+        """Replaces the page's facts (idempotent: a resumed run may extract a page twice)."""
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM facts WHERE source = ? AND page = ?", (source, page))
+            self.db.executemany(
+                "INSERT INTO facts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                [(source, page, f["table"], f["row"], f["item"], f["label"], f["section"],
+                  f["period"], f["column"], f["value"], f["unit"]) for f in facts],
+            )
+
+    def prune(self, source: str, total_pages: int):
+        """Drops facts of pages a new version of the document no longer has."""
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM facts WHERE source = ? AND page > ?", (source, total_pages))
+
+    def delete(self, source: str):
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM facts WHERE source = ?", (source,))
+
+    def count(self) -> int:
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM facts").fetchone()[0]
+
+    def lookup(self, question: str, sources: list[str] | None = None, page: int | None = None) -> list[dict]:
+        """
+        Facts for the line item the question names, in the periods it names (any
+        period if none). The item whose words are all in the question, and the
+        most of them, wins; it must cover at least half of the question's own words.
+        These are candidate rows for the prompt: fact_answer decides whether they settle it.
+        """
+        words, periods = question_terms(question)
+        if not words:
+            return []
+        scope, params = "1 = 1", []
+        if sources is not None:
+            if not sources:
+                return []
+            scope += f" AND source IN ({','.join('?' * len(sources))})"
+            params += sources
+        if page is not None:
+            scope += " AND page = ?"
+            params.append(page)
+        with self.lock:
+            items = [row[0] for row in self.db.execute(f"SELECT DISTINCT item FROM facts WHERE {scope}", params)]
+        matches = [(len(item.split()), item) for item in items if set(item.split()) <= words]
+        best = max((size for size, _ in matches), default=0)
+        if not best or best * 2 < len(words):
+            return []
+        names = [item for size, item in matches if size == best]
+        sql = f"SELECT * FROM facts WHERE {scope} AND item IN ({','.join('?' * len(names))})"
+        params += names
+        if periods:
+            sql += f" AND period IN ({','.join('?' * len(periods))})"
+            params += sorted(periods)
+        with self.lock:
+            rows = self.db.execute(sql + " ORDER BY period DESC, source, page, tbl, row", params).fetchall()
+        return [dict(row) for row in rows]
+
+def question_terms(question: str) -> tuple[set[str], set[str]]:
+    """(line-item words, years) of a question."""
+    periods = set(YEAR_RE.findall(question))
+    words = {
+        _stem(t) for t in tokenize(YEAR_RE.sub(" ", question))
+        if len(t) > 1 and not t.isdigit() and t not in LOOKUP_WORDS
+    }
+    return words, periods
+
+def _format(value: float) -> str:
+    return f"{value:,.0f}" if value == int(value) else f"{value:,.2f}"
+
+def scope_terms(sources, catalog=None) -> set[str]:
+    """Words that name these documents: issuer and period (catalog, else the file name) and the file name itself."""
+    terms = set()
+    for source in sources:
+        entry = catalog.entry(source) if catalog is not None else None
+        issuer, period = (entry["issuer"], entry["period"]) if entry else describe(source)
+        terms.update(tokenize(" ".join(filter(None, (issuer, period, Path(source).stem)))))
+    return {_stem(t) for t in terms}
+
+def fact_answer(question: str, facts: list[dict], catalog=None) -> dict | None:
+    """
+    {"answer", "sources"} straight from the table, when that is unambiguous:
+    the question names its years, only one line item matched, each year has
+    one value (the same figure repeated in several filings is fine), and every
+    other word of the question names the line item or the documents (issuer,
+    period: "Tesla's net sales" over an Apple table is not an answer). Else None.
+    """
+    words, periods = question_terms(question)
+    if not facts or not periods or ANALYSIS_RE.search(question):
+        return None
+    if len({fact["item"] for fact in facts}) != 1:
+        return None
+    unexplained = words - set(facts[0]["item"].split())
+    if unexplained and unexplained - scope_terms({fact["source"] for fact in facts}, catalog):
+        return None
+    by_period = {}
+    for fact in facts:
+        by_period.setdefault(fact["period"], []).append(fact)
+    if set(by_period) != periods or any(len({f["value"] for f in rows}) != 1 for rows in by_period.values()):
+        return None
+
+    cited, parts = {}, []
+    for period in sorted(by_period, reverse=True):
+        fact = by_period[period][0]
+        n = cited.setdefault((fact["source"], fact["page"]), len(cited) + 1)
+        parts.append(f"{_format(fact['value'])} for {fact['column_label'] or period} [{n}]")
+    unit = facts[0]["unit"]
+    label = facts[0]["label"] + (f" (in {unit})" if unit else "")
+    # Same citation shape as data_pipeline.context, so clients show them alike
+    sources = [{"n": n, "source": source, "page": page, "start_page": page, "end_page": page, "ids": []}
+               for (source, page), n in cited.items()]
+    return {"answer": f"{label}: " + "; ".join(parts) + ".", "sources": sources}
+
+def facts_block(facts: list[dict], limit: int = FACT_PROMPT_ROWS) -> str:
+    """Matching table rows as prompt lines: exact figures next to the retrieved text."""
+    return "\n".join(
+        f"- {fact['label']} | {fact['column_label'] or fact['period']} | {_format(fact['value'])}"
+        f"{' (in ' + fact['unit'] + ')' if fact['unit'] else ''} | {fact['source']}, p. {fact['page']}"
+        for fact in facts[:limit]
+    )
+
+def record_facts(page_stream: Iterator[dict], store: "FactStore", source: str) -> Iterator[dict]:
+    """
+    Ingest stage: stores each page's table facts and passes the page on without
+    its tables. Pages that had facts in an earlier version are rewritten too.
+    """
+    known = store.pages(source)
+    for page in page_stream:
+        facts = page_facts(page)
+        page.pop("tables", None)
+        if facts or page["page_number"] in known:
+            store.put_page(source, page["page_number"], facts)
+        yield page
+
+# --- Shared instance ---
+_default_store = None
+
+def get_fact_store() -> FactStore:
+    global _default_store
+    if _default_store is None:
+        _default_store = FactStore()
+    return _default_store
+
+def _reset_after_fork():
+    # SQLite connections must not cross a fork; the child reopens on first use
+    global _default_store
+    _default_store = None
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+# --- CLI: python -m data_pipeline.facts report.pdf | --ask "total revenue in 2024" ---
+def main():
+    from data_pipeline.ingest import PDFIngestor
+
+    parser = argparse.ArgumentParser(description="Extract table facts from PDFs (no embedding calls), or query them.")
+    parser.add_argument("pdfs", nargs="*")
+    parser.add_argument("--ask", help="look a question up in the fact store")
+    args = parser.parse_args()
+
+    store = get_fact_store()
+    for path in args.pdfs:
+        source = os.path.basename(path)
+        pages = 0
+        for page in record_facts(PDFIngestor(tables=True).extract(None, path, source), store, source):
+            pages = page["total_pages"]
+        store.prune(source, pages)
+        print(f"📊 {source}: facts on {len(store.pages(source))} of {pages} pages")
+    if args.ask:
+        facts = store.lookup(args.ask)
+        direct = fact_answer(args.ask, facts, get_catalog())
+        print(direct["answer"] if direct else facts_block(facts) or "No matching line item")
+    print(f"📊 {store.count()} facts stored")
+
+if __name__ == "__main__":
+    main()
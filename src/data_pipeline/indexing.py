@@ -1,52 +1,111 @@
-import chromadb
-from typing import Iterator
-# Import the centralized client we created earlier
-from config import client, EMBEDDING_MODEL, chroma_client, collection
+from typing import Callable, Iterator
+from config import INDEX_BATCH_SIZE
+from data_pipeline.embedding import EmbeddingEngine, get_default_engine
+from data_pipeline.collection_version import bump_collection_version
+from data_pipeline.lexical import BM25Index, get_lexical_index
+from data_pipeline.vector_store import VectorStore, get_vector_store
+from data_pipeline.metrics import VECTOR_UPSERT_SECONDS
 
 class Indexer:
+    def __init__(
+        self,
+        engine: EmbeddingEngine | None = None,
+        lexical: BM25Index | None = None,
+        store: VectorStore | None = None,
+        on_flush: Callable[[list[dict], list[dict], list[dict], str | None], None] | None = None,
+    ):
+        self.engine = engine or get_default_engine()
+        self.store = store or get_vector_store()
+        self.lexical = lexical or get_lexical_index()
+        self.failed_ids = set()  # chunks that never made it into the collection
+        # Called after every flush with (batch, indexed, failed, error), in stream order
+        self.on_flush = on_flush
+
     def get_embedding(self, text):
-        return client.models.embed_content(
-            model=EMBEDDING_MODEL,
-            contents=text
-        ).embeddings[0].values
+        return self.engine.embed([text])[0]
 
     def index(self, chunk_stream: Iterator[dict]):
         """
         Sink: Consumes the stream and writes to DB in batches.
         """
-        batch_size = 10
+        batch_size = INDEX_BATCH_SIZE
         batch = []
-        
+
         for chunk in chunk_stream:
             batch.append(chunk)
-            
+
             if len(batch) >= batch_size:
                 self._flush(batch)
                 batch = [] # Reset
-        
+
         # Flush leftovers
         if batch:
             self._flush(batch)
 
     def _flush(self, batch):
-        ids = [item["chunk_id"] for item in batch]
-        documents = [item["text"] for item in batch]
-        metadatas = [{"page": item["page"], "source": item["source"]} for item in batch]
-        embeddings = []
-        
+        indexed, embeddings, failed, error = self._embed(batch)
+        if indexed:
+            try:
+                self._write(indexed, embeddings)
+            except Exception as e:
+                print(f"Upsert failed: {e}")
+                indexed, failed, error = [], failed + indexed, str(e)
+
+        self.failed_ids.update(item["chunk_id"] for item in failed)
+        if self.on_flush:
+            self.on_flush(batch, indexed, failed, error)
+
+    def _embed(self, batch) -> tuple[list[dict], list, list[dict], str | None]:
+        """(indexable chunks, their embeddings, failed chunks, last error), always aligned."""
         # This is where we pay the Time Cost (Network Latency)
-        # TODO: use batch api to request for embeddings
-        for item in batch:
+        # The engine sends many texts per request and keeps several requests in flight.
+        try:
+            return batch, self.engine.embed([item["text"] for item in batch]), [], None
+        except Exception as e:
+            error = str(e)
+            print(f"Embedding failed: {e}")
+        if len(batch) <= self.engine.batch_size:
+            return [], [], batch, error
+
+        # One request gave up: redo the batch one request-sized slice at a time,
+        # so only the slices that fail again are left for the retry queue
+        indexed, embeddings, failed = [], [], []
+        for i in range(0, len(batch), self.engine.batch_size):
+            part = batch[i:i + self.engine.batch_size]
             try:
-                embeddings.append(self.get_embedding(item["text"]))
+                embeddings += self.engine.embed([item["text"] for item in part])
+                indexed += part
             except Exception as e:
-                print(f"Embedding failed: {e}")
-                continue
+                failed += part
+                error = str(e)
+        return indexed, embeddings, failed, error
 
-        if embeddings:
-            collection.add(
+    def _write(self, batch, embeddings):
+        ids = [item["chunk_id"] for item in batch]
+        metadatas = [
+            {
+                "page": item["page"],
+                "start_page": item.get("start_page", item["page"]),
+                "end_page": item.get("end_page", item["page"]),
+                "source": item["source"],
+            }
+            for item in batch
+        ]
+        # Upsert: chunk ids are content hashes, so re-ingesting never duplicates
+        with VECTOR_UPSERT_SECONDS.time():
+            self.store.upsert(
                 ids=ids,
-                documents=documents,
+                documents=[item["text"] for item in batch],
                 embeddings=embeddings,
                 metadatas=metadatas
-            )
\ No newline at end of file
+            )
+        # Keep the BM25 index in step with the vectors (same ids, same chunks)
+        self.lexical.add(batch)
+        bump_collection_version()  # answers cached against the old collection are now stale
+
+    def delete(self, ids: list[str]):
+        """Removes chunks that disappeared from a re-ingested document."""
+        if ids:
+            self.store.delete(ids)
+            self.lexical.delete(ids)
+            bump_collection_version()
@@ -1,21 +1,119 @@
 import fitz  # PyMuPDF
+import multiprocessing
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from typing import Iterator
+from config import INGEST_WORKERS, INGEST_PAGES_PER_TASK, EXTRACT_TABLES
+from data_pipeline.metrics import PDF_PARSE_SECONDS, PDF_TABLE_SECONDS
+
+def _extract_range(pdf_path: str, start: int, stop: int, tables: bool = False) -> list[tuple[str, float, list, float]]:
+    """
+    Worker: extracts pages [start, stop) as (text, seconds, tables, seconds) tuples.
+    Each worker opens the PDF itself, fitz documents can't be pickled.
+    The timings travel back with the text; the child's own metrics would be lost.
+    """
+    with fitz.open(pdf_path) as doc:
+        return [(*_timed_text(doc[i]), *_timed_tables(doc[i], tables)) for i in range(start, stop)]
+
+def _timed_text(page) -> tuple[str, float]:
+    start = time.perf_counter()
+    text = page.get_text("text").strip()
+    return text, time.perf_counter() - start
+
+def _timed_tables(page, enabled: bool = True) -> tuple[list[list[list[str]]], float]:
+    """Cell text of every table PyMuPDF finds on the page, header row first (see data_pipeline.facts)."""
+    if not enabled:
+        return [], 0.0
+    start = time.perf_counter()
+    found = []
+    try:
+        for table in page.find_tables().tables:
+            rows = table.extract()
+            if table.header.external:  # header line sits above the detected grid
+                rows = [table.header.names, *rows]
+            found.append([[cell or "" for cell in row] for row in rows])
+    except Exception as e:
+        # A page the finder chokes on still has its text
+        print(f"⚠️ Table detection failed on page {page.number + 1}: {e}")
+    return found, time.perf_counter() - start
 
 class PDFIngestor:
-    def extract(self, job_id, pdf_path: str) -> Iterator[dict]:
+    def __init__(self, workers: int = INGEST_WORKERS, pages_per_task: int = INGEST_PAGES_PER_TASK,
+                 tables: bool = EXTRACT_TABLES):
+        self.workers = workers
+        self.pages_per_task = pages_per_task
+        self.tables = tables
+
+    def extract(self, job_id, pdf_path: str, source: str | None = None, first_page: int = 1) -> Iterator[dict]:
         """
         Generator: Yields one page at a time.
+        `source` names the document in metadata (defaults to the path).
+        `first_page` (1-based) skips the pages before it, e.g. when resuming from a checkpoint.
+        With `tables`, pages that have tables also carry them as "tables" (rows of cell text).
         Memory: O(1) (Only holds one page text in RAM).
+        Parallel mode (workers > 1): pages still come out in order,
+        memory is O(workers * pages_per_task).
         """
+        source = source or pdf_path
         doc = fitz.open(pdf_path)
         total_pages = len(doc)
-        
-        for page_num, page in enumerate(doc):
-            text = page.get_text("text")
-            yield {
-                "job_id": job_id,
-                "page_number": page_num + 1,
-                "total_pages": total_pages,
-                "content": text.strip(),
-                "source": pdf_path
-            }
\ No newline at end of file
+        start = max(0, first_page - 1)
+
+        if self.workers > 1 and total_pages - start > self.pages_per_task:
+            doc.close()
+            yield from self._extract_parallel(job_id, pdf_path, source, total_pages, start)
+            return
+
+        for page_num in range(start, total_pages):
+            text, seconds = _timed_text(doc[page_num])
+            tables, table_seconds = _timed_tables(doc[page_num], self.tables)
+            PDF_PARSE_SECONDS.observe(seconds)
+            if self.tables:
+                PDF_TABLE_SECONDS.observe(table_seconds)
+            yield self._page(job_id, source, page_num, total_pages, text, tables)
+
+    def _extract_parallel(self, job_id, pdf_path: str, source: str, total_pages: int, first: int = 0) -> Iterator[dict]:
+        ranges = iter(
+            (start, min(start + self.pages_per_task, total_pages))
+            for start in range(first, total_pages, self.pages_per_task)
+        )
+        # 'spawn', like WorkerPool: this runs in a job worker with live threads (heartbeat, pipeline
+        # stages, scheduler dispatcher), and a forked child could inherit a lock one of them held
+        pool = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+        pending = deque()
+
+        def submit_next():
+            page_range = next(ranges, None)
+            if page_range:
+                pending.append((page_range[0], pool.submit(_extract_range, pdf_path, *page_range, self.tables)))
+
+        try:
+            # Backpressure: at most two ranges per worker are queued or waiting to be consumed
+            for _ in range(self.workers * 2):
+                submit_next()
+
+            while pending:
+                start, future = pending.popleft()
+                texts = future.result()
+                submit_next()
+                for offset, (text, seconds, tables, table_seconds) in enumerate(texts):
+                    PDF_PARSE_SECONDS.observe(seconds)
+                    if self.tables:
+                        PDF_TABLE_SECONDS.observe(table_seconds)
+                    yield self._page(job_id, source, start + offset, total_pages, text, tables)
+        finally:
+            # Consumer stopped early (or failed): don't finish work nobody will read
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def _page(self, job_id, source, page_num, total_pages, text, tables=None) -> dict:
+        page = {
+            "job_id": job_id,
+            "page_number": page_num + 1,
+            "total_pages": total_pages,
+            "content": text,
+            "source": source
+        }
+        if tables:
+            page["tables"] = tables
+        return page
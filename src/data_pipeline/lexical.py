@@ -0,0 +1,194 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+from collections import Counter
+from pathlib import Path
+from config import LEXICAL_INDEX_PATH, RRF_K
+
+# Keeps "10-k", "3.5", "fy2024" and tickers as single tokens
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[.\-/][a-z0-9]+)*")
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "by", "did", "do", "does", "for", "from", "has", "have",
+    "how", "in", "is", "it", "its", "of", "on", "or", "that", "the", "their", "they", "this", "to",
+    "was", "were", "what", "when", "which", "who", "why", "will", "with",
+}
+
+def tokenize(text: str) -> list[str]:
+    return [t for t in TOKEN_RE.findall(text.lower()) if t not in STOPWORDS]
+
+class BM25Index:
+    """
+    Inverted index over chunk text in SQLite, updated incrementally by the Indexer.
+    Exact-term questions ("Note 14", "Level 3", tickers) hit here even when
+    the embedding doesn't rank them high. No network calls.
+    """
+    def __init__(self, path: Path = LEXICAL_INDEX_PATH, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(str(path), check_same_thread=False, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        with self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS docs ("
+                " chunk_id TEXT PRIMARY KEY, source TEXT, page INTEGER, length INTEGER, text TEXT)"
+            )
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS postings ("
+                " term TEXT, chunk_id TEXT, tf INTEGER, PRIMARY KEY (term, chunk_id)) WITHOUT ROWID"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS postings_chunk ON postings(chunk_id)")
+            self.db.execute("CREATE INDEX IF NOT EXISTS docs_source_page ON docs(source, page)")
+            # Corpus totals for BM25, kept up to date so searches never scan `docs`
+            self.db.execute("CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY, docs INTEGER, length INTEGER)")
+            self.db.execute(
+                "INSERT OR IGNORE INTO totals SELECT 0, COUNT(*), COALESCE(SUM(length), 0) FROM docs"
+            )
+
+    # --- Writes (from the Indexer) ---
+    def add(self, chunks: list[dict]):
+        """Adds or replaces chunks ({chunk_id, text, source, page})."""
+        with self.lock, self.db:
+            self._delete([c["chunk_id"] for c in chunks])
+            for chunk in chunks:
+                terms = Counter(tokenize(chunk["text"]))
+                self.db.execute(
+                    "INSERT INTO docs VALUES (?, ?, ?, ?, ?)",
+                    (chunk["chunk_id"], chunk["source"], chunk["page"], sum(terms.values()), chunk["text"]),
+                )
+                self.db.executemany(
+                    "INSERT INTO postings VALUES (?, ?, ?)",
+                    [(term, chunk["chunk_id"], tf) for term, tf in terms.items()],
+                )
+                self.db.execute(
+                    "UPDATE totals SET docs = docs + 1, length = length + ? WHERE id = 0", (sum(terms.values()),)
+                )
+
+    def delete(self, ids: list[str]):
+        with self.lock, self.db:
+            self._delete(ids)
+
+    def _delete(self, ids: list[str]):
+        for i in range(0, len(ids), 500):
+            part = ids[i:i + 500]
+            marks = ",".join("?" * len(part))
+            self.db.execute(
+                "UPDATE totals SET (docs, length) = (SELECT totals.docs - COUNT(*), totals.length - COALESCE(SUM(length), 0)"
+                f" FROM docs WHERE chunk_id IN ({marks})) WHERE id = 0",
+                part,
+            )
+            self.db.execute(f"DELETE FROM postings WHERE chunk_id IN ({marks})", part)
+            self.db.execute(f"DELETE FROM docs WHERE chunk_id IN ({marks})", part)
+
+    # --- Reads ---
+    def search(self, query: str, k: int = 20, source: str | list[str] | None = None, page: int | None = None) -> list[dict]:
+        """Top-k chunks by BM25: [{id, score, text, source, page}], best first. `source` may list several."""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        marks = ",".join("?" * len(terms))
+        filters, params = "", []
+        if isinstance(source, list):
+            filters += f" AND d.source IN ({','.join('?' * len(source))})"
+            params.extend(source)
+        elif source is not None:
+            filters += " AND d.source = ?"
+            params.append(source)
+        if page is not None:
+            filters += " AND d.page = ?"
+            params.append(page)
+
+        with self.lock:
+            n_docs, total_length = self.db.execute("SELECT docs, length FROM totals WHERE id = 0").fetchone()
+            if not n_docs:
+                return []
+            df = self.db.execute(
+                f"SELECT term, COUNT(*) FROM postings WHERE term IN ({marks}) GROUP BY term", terms
+            ).fetchall()
+            if not df:
+                return []
+            # Scoring and top-k run inside SQLite: only k rows come back, however long the posting lists
+            idf = [(term, math.log(1 + (n_docs - n + 0.5) / (n + 0.5))) for term, n in df]
+            rows = self.db.execute(
+                f"WITH q(term, idf) AS (VALUES {','.join(['(?, ?)'] * len(idf))})"
+                " SELECT p.chunk_id, SUM(q.idf * p.tf * (? + 1) / (p.tf + ? * (1 - ? + ? * d.length / ?))) AS score,"
+                " d.text, d.source, d.page"
+                " FROM q JOIN postings p ON p.term = q.term JOIN docs d ON d.chunk_id = p.chunk_id"
+                f" WHERE 1 = 1{filters} GROUP BY p.chunk_id ORDER BY score DESC, p.chunk_id LIMIT ?",
+                [*(value for pair in idf for value in pair),
+                 self.k1, self.k1, self.b, self.b, total_length / n_docs, *params, k],
+            ).fetchall()
+        return [
+            {"id": cid, "score": score, "text": text, "source": source, "page": page}
+            for cid, score, text, source, page in rows
+        ]
+
+# --- Rank Fusion ---
+def fuse_results(vector_results: dict, lexical_hits: list[dict], n_results: int, k: int = RRF_K) -> dict:
+    """
+    Reciprocal rank fusion of one collection.query result and one BM25 hit list.
+    Returns the same shape as collection.query (one query), plus fused "scores".
+    """
+    scores = Counter()
+    docs = {}
+    for rank, (cid, text, meta) in enumerate(zip(
+        vector_results["ids"][0], vector_results["documents"][0], vector_results["metadatas"][0]
+    )):
+        scores[cid] += 1 / (k + rank + 1)
+        docs[cid] = (text, meta)
+    for rank, hit in enumerate(lexical_hits):
+        scores[hit["id"]] += 1 / (k + rank + 1)
+        docs.setdefault(hit["id"], (hit["text"], {"source": hit["source"], "page": hit["page"]}))
+
+    top = scores.most_common(n_results)
+    return {
+        "ids": [[cid for cid, _ in top]],
+        "documents": [[docs[cid][0] for cid, _ in top]],
+        "metadatas": [[docs[cid][1] for cid, _ in top]],
+        "scores": [[score for _, score in top]],
+    }
+
+def metadata_filter(source: str | list[str] | None = None, page: int | None = None) -> dict | None:
+    """Chroma `where` clause for the optional source (one or several) / page filters."""
+    if isinstance(source, list):
+        source = source[0] if len(source) == 1 else {"$in": source}
+    clauses = [{name: value} for name, value in (("source", source), ("page", page)) if value is not None]
+    if not clauses:
+        return None
+    return clauses[0] if len(clauses) == 1 else {"$and": clauses}
+
+# --- Shared instance ---
+_default_index = None
+
+def get_lexical_index() -> BM25Index:
+    global _default_index
+    if _default_index is None:
+        _default_index = BM25Index()
+    return _default_index
+
+def _reset_after_fork():
+    # SQLite connections must not cross a fork; the child reopens on first use
+    global _default_index
+    _default_index = None
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def backfill(index: BM25Index, store, page_size: int = 1000) -> int:
+    """Builds the BM25 index from chunks already in the vector store (indexed before it existed)."""
+    offset = 0
+    while True:
+        batch = store.get(include=["documents", "metadatas"], limit=page_size, offset=offset)
+        if not batch["ids"]:
+            return offset
+        index.add([
+            {"chunk_id": cid, "text": text, "source": meta.get("source"), "page": meta.get("page")}
+            for cid, text, meta in zip(batch["ids"], batch["documents"], batch["metadatas"])
+        ])
+        offset += len(batch["ids"])
+
+if __name__ == "__main__":
+    from data_pipeline.vector_store import get_vector_store
+    print(f"📚 Indexed {backfill(get_lexical_index(), get_vector_store())} chunks for BM25")
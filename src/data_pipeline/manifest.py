@@ -0,0 +1,329 @@
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Iterator
+from config import MANIFEST_PATH, RETRY_MAX_ATTEMPTS, RETRY_BACKOFF_BASE
+from data_pipeline.metrics import RETRY_DEAD_LETTERS
+
+def fingerprint(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+def file_fingerprint(path: str, block_size: int = 1024 * 1024) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while block := f.read(block_size):
+            digest.update(block)
+    return digest.hexdigest()
+
+class ManifestStore:
+    """
+    What we last indexed for each document (keyed by source name):
+    the file hash, and per page its text fingerprint and the ids of the chunks starting on it.
+    Also the ingest run in progress (its checkpoint) and the chunks waiting to be retried.
+    """
+    def __init__(self, path: Path = MANIFEST_PATH):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(str(path), check_same_thread=False, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        with self.db:
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS documents (source TEXT PRIMARY KEY, file_hash TEXT, updated_at REAL)"
+            )
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS pages ("
+                " source TEXT, page INTEGER, fingerprint TEXT, chunk_ids TEXT,"
+                " PRIMARY KEY (source, page))"
+            )
+            # One in-flight run per source: where to resume, valid only for the same file
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS checkpoints ("
+                " source TEXT PRIMARY KEY, file_hash TEXT, state TEXT, updated_at REAL)"
+            )
+            # Chunks whose embedding/upsert failed, kept whole so a retry needs no PDF.
+            # Out of attempts, a chunk is a dead letter (dead_at set): never claimed, not pending.
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS retry_chunks ("
+                " chunk_id TEXT PRIMARY KEY, source TEXT, file_hash TEXT, chunk TEXT,"
+                " attempts INTEGER, error TEXT, next_at REAL, dead_at REAL)"
+            )
+            columns = {row[1] for row in self.db.execute("PRAGMA table_info(retry_chunks)")}
+            if "dead_at" not in columns:  # queues created before dead letters
+                self.db.execute("ALTER TABLE retry_chunks ADD COLUMN dead_at REAL")
+                self.db.execute("UPDATE retry_chunks SET dead_at = ? WHERE attempts >= ?",
+                                (time.time(), RETRY_MAX_ATTEMPTS))
+
+    def file_hash(self, source: str) -> str | None:
+        with self.lock:
+            row = self.db.execute("SELECT file_hash FROM documents WHERE source = ?", (source,)).fetchone()
+        return row[0] if row else None
+
+    def pages(self, source: str) -> dict[int, tuple[str | None, list[str]]]:
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT page, fingerprint, chunk_ids FROM pages WHERE source = ?", (source,)
+            ).fetchall()
+        return {page: (fp, json.loads(ids)) for page, fp, ids in rows}
+
+    def save(self, source: str, file_hash: str | None, pages: dict[int, tuple[str | None, list[str]]]):
+        """Replaces the document's manifest in one transaction."""
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM pages WHERE source = ?", (source,))
+            self.db.executemany(
+                "INSERT INTO pages VALUES (?, ?, ?, ?)",
+                [(source, page, fp, json.dumps(ids)) for page, (fp, ids) in pages.items()],
+            )
+            self.db.execute(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?)", (source, file_hash, time.time())
+            )
+
+    def add_chunk_ids(self, source: str, ids_by_page: dict[int, list[str]]):
+        """Records chunks indexed after the document's run (retries) on their pages."""
+        current = self.pages(source)
+        with self.lock, self.db:
+            for page, ids in ids_by_page.items():
+                fp, known = current.get(page, (None, []))
+                merged = known + [cid for cid in ids if cid not in known]
+                self.db.execute("INSERT OR REPLACE INTO pages VALUES (?, ?, ?, ?)",
+                                (source, page, fp, json.dumps(merged)))
+
+    def mark_complete(self, source: str, file_hash: str):
+        """The last failed chunks of this version were retried: the file counts as fully indexed."""
+        with self.lock, self.db:
+            self.db.execute(
+                "UPDATE documents SET file_hash = ?, updated_at = ? WHERE source = ? AND file_hash IS NULL",
+                (file_hash, time.time(), source),
+            )
+
+    # --- Checkpoints ---
+    def checkpoint(self, source: str, file_hash: str) -> dict | None:
+        """The saved state of an unfinished run of this exact file, if any."""
+        with self.lock:
+            row = self.db.execute(
+                "SELECT state FROM checkpoints WHERE source = ? AND file_hash = ?", (source, file_hash)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save_checkpoint(self, source: str, file_hash: str, state: dict,
+                        failed: list[dict] = (), error: str | None = None, indexed_ids: list[str] = ()):
+        """
+        One transaction per index flush: the batch's failures are queued, its successes
+        leave the queue, and the run's position moves past it. A crash leaves either
+        all of that or none of it, so no chunk is lost between the index and the queue.
+        """
+        with self.lock, self.db:
+            self._queue_retry(failed, file_hash, error)
+            self._remove_retries(indexed_ids)
+            self.db.execute("INSERT OR REPLACE INTO checkpoints VALUES (?, ?, ?, ?)",
+                            (source, file_hash, json.dumps(state), time.time()))
+
+    def clear_checkpoint(self, source: str):
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM checkpoints WHERE source = ?", (source,))
+
+    # --- Retry queue ---
+    def queue_retry(self, chunks: list[dict], file_hash: str, error: str | None):
+        """Queues (or re-queues, one attempt later) chunks that failed to index."""
+        with self.lock, self.db:
+            self._queue_retry(chunks, file_hash, error)
+
+    def _queue_retry(self, chunks, file_hash, error):
+        now = time.time()
+        for chunk in chunks:
+            row = self.db.execute(
+                "SELECT attempts FROM retry_chunks WHERE chunk_id = ?", (chunk["chunk_id"],)
+            ).fetchone()
+            attempts = row[0] + 1 if row else 1
+            dead_at = now if attempts >= RETRY_MAX_ATTEMPTS else None
+            if dead_at:
+                RETRY_DEAD_LETTERS.inc()
+                print(f"☠️ Chunk {chunk['chunk_id']} of {chunk['source']} failed {attempts} times, giving up: {error}")
+            stored = {k: v for k, v in chunk.items() if k != "cursor"}
+            self.db.execute(
+                "INSERT OR REPLACE INTO retry_chunks VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (chunk["chunk_id"], chunk["source"], file_hash, json.dumps(stored), attempts, error,
+                 now + RETRY_BACKOFF_BASE * (2 ** (attempts - 1)), dead_at),
+            )
+
+    def claim_retries(self, limit: int, lease: float = 600.0) -> list[tuple[dict, str]]:
+        """
+        (chunk, file_hash) pairs whose backoff has passed, dead letters excepted.
+        Claimed rows are pushed `lease` seconds out in the same (write-locked)
+        transaction, so two workers never retry the same chunk. Sources with a run in
+        progress are left to that run (it re-creates and re-indexes its own failures on resume).
+        """
+        now = time.time()
+        with self.lock, self.db:
+            self.db.execute("BEGIN IMMEDIATE")
+            rows = self.db.execute(
+                "SELECT chunk_id, chunk, file_hash FROM retry_chunks WHERE next_at <= ? AND dead_at IS NULL"
+                " AND source NOT IN (SELECT source FROM checkpoints) ORDER BY next_at LIMIT ?",
+                (now, limit),
+            ).fetchall()
+            self.db.executemany("UPDATE retry_chunks SET next_at = ? WHERE chunk_id = ?",
+                                [(now + lease, chunk_id) for chunk_id, _, _ in rows])
+        return [(json.loads(chunk), file_hash) for _, chunk, file_hash in rows]
+
+    def remove_retries(self, ids: list[str]):
+        with self.lock, self.db:
+            self._remove_retries(ids)
+
+    def _remove_retries(self, ids):
+        self.db.executemany("DELETE FROM retry_chunks WHERE chunk_id = ?", [(cid,) for cid in ids])
+
+    def pending_retries(self, source: str, file_hash: str | None = None, dead: bool = False) -> set[str]:
+        """Ids still waiting to be retried for a source (with `dead`: the dead letters instead)."""
+        query = f"SELECT chunk_id FROM retry_chunks WHERE source = ? AND dead_at IS {'NOT ' if dead else ''}NULL"
+        args = [source]
+        if file_hash is not None:
+            query, args = query + " AND file_hash = ?", args + [file_hash]
+        with self.lock:
+            return {row[0] for row in self.db.execute(query, args)}
+
+    def dead_letters(self, source: str | None = None) -> list[dict]:
+        """Chunks that ran out of attempts: which document, how often they failed and why."""
+        query, args = "SELECT chunk_id, source, attempts, error, dead_at FROM retry_chunks WHERE dead_at IS NOT NULL", []
+        if source is not None:
+            query, args = query + " AND source = ?", [source]
+        with self.lock:
+            rows = self.db.execute(query + " ORDER BY source, dead_at", args).fetchall()
+        return [dict(zip(("chunk_id", "source", "attempts", "error", "dead_at"), row)) for row in rows]
+
+    def revive_dead_letters(self, source: str | None = None) -> int:
+        """Gives dead letters a fresh set of attempts (e.g. after fixing a quota or an API key)."""
+        query, args = "UPDATE retry_chunks SET attempts = 0, next_at = 0, dead_at = NULL WHERE dead_at IS NOT NULL", []
+        if source is not None:
+            query, args = query + " AND source = ?", [source]
+        with self.lock, self.db:
+            return self.db.execute(query, args).rowcount
+
+    def drop_stale_retries(self, source: str, file_hash: str):
+        """A newer version of the document was indexed: retries for older versions are moot."""
+        with self.lock, self.db:
+            self.db.execute("DELETE FROM retry_chunks WHERE source = ? AND file_hash != ?", (source, file_hash))
+
+class DocumentSync:
+    """
+    Diffs one ingest run against the manifest.
+    Wrap the page stream with filter_pages() and the chunk stream with filter_chunks().
+    Chunks span page breaks, so every page is chunked again (cheap, no network);
+    the diff is per chunk: chunks whose id was indexed before are never embedded again.
+    After indexing, delete removed_ids() and call commit().
+    The filters and checkpoint() run on different pipeline threads, hence the lock.
+    """
+    def __init__(self, store: ManifestStore, source: str, file_hash: str):
+        self.store = store
+        self.source = source
+        self.file_hash = file_hash
+        self.previous = store.pages(source)
+        self.previous_ids = {cid for _, ids in self.previous.values() for cid in ids}
+        self.pages: dict[int, tuple[str | None, list[str]]] = {}
+        self.stats = {"pages_unchanged": 0, "pages_changed": 0, "chunks_unchanged": 0, "chunks_new": 0}
+        self.lock = threading.Lock()
+
+    def is_unchanged_file(self) -> bool:
+        return self.store.file_hash(self.source) == self.file_hash
+
+    def resume(self) -> dict | None:
+        """
+        Restores what an interrupted run of this file had committed and returns its
+        chunker cursor (None: nothing to resume). Pages and chunks before the cursor
+        are neither extracted nor embedded again.
+        """
+        state = self.store.checkpoint(self.source, self.file_hash)
+        if state is None:
+            return None
+        self.pages = {int(page): (fp, ids) for page, (fp, ids) in state["pages"].items()}
+        self.stats = state["stats"]
+        return state["cursor"]
+
+    def checkpoint(self, cursor: dict, indexed: list[dict], failed: list[dict], error: str | None):
+        """
+        Saves progress after an index flush: everything up to `cursor` is now in the
+        index or in the retry queue. Pages/ids recorded past the cursor are harmless:
+        a resumed run produces the same chunks again.
+        """
+        with self.lock:
+            pages = {page: [fp, list(ids)] for page, (fp, ids) in self.pages.items()}
+            state = {"cursor": cursor, "pages": pages, "stats": dict(self.stats)}
+        self.store.save_checkpoint(
+            self.source, self.file_hash, state, failed, error, [c["chunk_id"] for c in indexed])
+
+    def filter_pages(self, page_stream: Iterator[dict]) -> Iterator[dict]:
+        """Passes every page through, recording its fingerprint (and what changed, for stats)."""
+        for page in page_stream:
+            number, fp = page["page_number"], fingerprint(page["content"])
+            old_fp, _ = self.previous.get(number, (None, []))
+            with self.lock:
+                self.stats["pages_unchanged" if old_fp == fp else "pages_changed"] += 1
+                self.pages[number] = (fp, self.pages.get(number, (None, []))[1])
+            yield page
+
+    def filter_chunks(self, chunk_stream: Iterator[dict]) -> Iterator[dict]:
+        for chunk in chunk_stream:
+            with self.lock:
+                ids = self.pages.setdefault(chunk["page"], (None, []))[1]
+                # After a resume, chunks between the checkpoint and the crash come around again
+                if chunk["chunk_id"] not in ids:
+                    ids.append(chunk["chunk_id"])
+                    self.stats["chunks_unchanged" if chunk["chunk_id"] in self.previous_ids else "chunks_new"] += 1
+            if chunk["chunk_id"] in self.previous_ids:
+                continue
+            yield chunk
+
+    def removed_ids(self) -> list[str]:
+        current = {cid for _, ids in self.pages.values() for cid in ids}
+        return sorted(self.previous_ids - current)
+
+    def commit(self, failed_ids: set[str] = frozenset(), dead_ids: set[str] = frozenset()):
+        """
+        Chunks that failed to index are left out, and their pages lose their
+        fingerprint; the retry queue adds them back once they are indexed.
+        While retries are pending the file doesn't count as indexed; dead letters
+        alone don't hold it back (see ManifestStore.dead_letters).
+        Ends the run: its checkpoint is no longer needed.
+        """
+        pages = {}
+        for number, (fp, ids) in self.pages.items():
+            kept = [cid for cid in ids if cid not in failed_ids and cid not in dead_ids]
+            pages[number] = (fp if len(kept) == len(ids) else None, kept)
+        self.store.save(self.source, None if failed_ids else self.file_hash, pages)
+        self.store.drop_stale_retries(self.source, self.file_hash)
+        self.store.clear_checkpoint(self.source)
+
+# --- Shared instance ---
+_default_store = None
+
+def get_manifest_store() -> ManifestStore:
+    global _default_store
+    if _default_store is None:
+        _default_store = ManifestStore()
+    return _default_store
+
+def _reset_after_fork():
+    # SQLite connections must not cross a fork; the child reopens on first use
+    global _default_store
+    _default_store = None
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+# --- CLI: python -m data_pipeline.manifest [--revive] [source] ---
+def main():
+    parser = argparse.ArgumentParser(description="List chunks that ran out of retry attempts, or retry them again.")
+    parser.add_argument("source", nargs="?")
+    parser.add_argument("--revive", action="store_true", help="give dead letters a fresh set of attempts")
+    args = parser.parse_args()
+
+    store = get_manifest_store()
+    for letter in store.dead_letters(args.source):
+        print(f"☠️ {letter['source']} {letter['chunk_id']} ({letter['attempts']} attempts): {letter['error']}")
+    if args.revive:
+        print(f"🔁 {store.revive_dead_letters(args.source)} chunks queued for retry again")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,239 @@
+import bisect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from config import METRICS_DIR
+
+# Seconds: from a cache-hit SQLite read to a slow Gemini generation
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.series: dict[tuple, float] = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self.lock:
+            self.series[key] = self.series.get(key, 0) + amount
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {"series": [[list(k), v] for k, v in self.series.items()]}
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self.lock:
+            self.series[key] = value
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # key -> [per-bucket counts (last one is +Inf), sum, count]
+        self.series: dict[tuple, list] = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def snapshot(self) -> dict:
+        with self.lock:
+            return {
+                "buckets": list(self.buckets),
+                "series": [[list(k), list(counts), total, count] for k, (counts, total, count) in self.series.items()],
+            }
+
+# --- Registry ---
+# One per process. Ingest workers are separate processes, so they dump their
+# registry to METRICS_DIR after each job and /metrics merges those files in.
+REGISTRY: dict[str, Counter | Histogram] = {}
+
+def _register(metric):
+    return REGISTRY.setdefault(metric.name, metric)
+
+def counter(name: str, help: str, labels: tuple[str, ...] = ()) -> Counter:
+    return _register(Counter(name, help, labels))
+
+def gauge(name: str, help: str, labels: tuple[str, ...] = ()) -> Gauge:
+    return _register(Gauge(name, help, labels))
+
+def histogram(name: str, help: str, labels: tuple[str, ...] = (), buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+    return _register(Histogram(name, help, labels, buckets))
+
+def snapshot() -> dict:
+    return {
+        name: {"kind": m.kind, "help": m.help, "labels": list(m.labels), **m.snapshot()}
+        for name, m in REGISTRY.items()
+    }
+
+def span_totals() -> dict[str, dict]:
+    """{histogram: {"count", "seconds"}} over all labels. Diff two of these to time one job."""
+    totals = {}
+    for name, metric in snapshot().items():
+        if metric["kind"] == "histogram":
+            totals[name] = {
+                "count": sum(s[3] for s in metric["series"]),
+                "seconds": sum(s[2] for s in metric["series"]),
+            }
+    return totals
+
+def span_diff(before: dict, after: dict) -> dict:
+    diff = {}
+    for name, total in after.items():
+        count = total["count"] - before.get(name, {}).get("count", 0)
+        if count:
+            seconds = total["seconds"] - before.get(name, {}).get("seconds", 0.0)
+            diff[name] = {"count": count, "seconds": round(seconds, 3)}
+    return diff
+
+# --- Cross-process ---
+def dump(directory: Path = METRICS_DIR):
+    """Writes this process's registry where the API process can read it (atomic replace)."""
+    directory.mkdir(parents=True, exist_ok=True)
+    path = directory / f"{os.getpid()}.json"
+    tmp = path.with_suffix(".tmp")
+    tmp.write_text(json.dumps(snapshot()))
+    os.replace(tmp, path)
+
+def _reset_after_fork():
+    # A forked child counts from zero; what came before stays with (and is reported by) the parent
+    for metric in REGISTRY.values():
+        metric.series = {}
+        metric.lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
+
+def remove_stale_dumps(directory: Path = METRICS_DIR):
+    """Drops dumps of processes that no longer exist (their counters restart from zero)."""
+    for path in directory.glob("*.json"):
+        try:
+            os.kill(int(path.stem), 0)
+        except ProcessLookupError:
+            path.unlink(missing_ok=True)
+        except (ValueError, PermissionError):
+            pass
+
+def _merge(into: dict, other: dict):
+    for name, metric in other.items():
+        target = into.setdefault(name, {**metric, "series": []})
+        index = {tuple(s[0]): s for s in target["series"]}
+        for series in metric["series"]:
+            existing = index.get(tuple(series[0]))
+            if existing is None:
+                target["series"].append(series)
+                index[tuple(series[0])] = series
+            elif metric["kind"] == "counter":
+                existing[1] += series[1]
+            elif metric["kind"] == "gauge":
+                continue  # per-process values; the first one read (this process) wins
+            else:
+                existing[1] = [a + b for a, b in zip(existing[1], series[1])]
+                existing[2] += series[2]
+                existing[3] += series[3]
+
+# --- Prometheus text format (exposition format 0.0.4) ---
+def render(directory: Path = METRICS_DIR) -> str:
+    merged = json.loads(json.dumps(snapshot()))  # deep copy, merged series are mutated
+    for path in sorted(directory.glob("*.json")) if directory.exists() else []:
+        if path.stem == str(os.getpid()):
+            continue
+        try:
+            _merge(merged, json.loads(path.read_text()))
+        except (OSError, ValueError):
+            continue  # mid-replace or gone; next scrape picks it up
+
+    lines = []
+    for name, metric in sorted(merged.items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        for series in metric["series"]:
+            labels = dict(zip(metric["labels"], series[0]))
+            if metric["kind"] in ("counter", "gauge"):
+                lines.append(f"{name}{_labels(labels)} {series[1]}")
+                continue
+            cumulative = 0
+            for bound, count in zip([*metric["buckets"], "+Inf"], series[1]):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels({**labels, 'le': bound})} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {series[2]}")
+            lines.append(f"{name}_count{_labels(labels)} {series[3]}")
+    return "\n".join(lines) + "\n"
+
+def _labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for v in labels.values())
+    return "{" + ",".join(f'{k}="{v}"' for k, v in zip(labels, escaped)) + "}"
+
+# --- The spans we track ---
+PDF_PARSE_SECONDS = histogram("rag_pdf_parse_seconds", "Text extraction time per PDF page.")
+CHUNK_SPLIT_SECONDS = histogram("rag_chunk_split_seconds", "Splitting time per page.")
+EMBED_CALL_SECONDS = histogram(
+    "rag_embed_call_seconds", "One embed_content API call (including failed attempts).", ("path", "outcome"))
+EMBED_TEXTS = counter("rag_embed_texts_total", "Texts sent to embed_content.", ("path",))
+EMBED_RETRIES = counter("rag_embed_retries_total", "Rate-limited embed_content attempts that were retried.", ("path",))
+VECTOR_UPSERT_SECONDS = histogram("rag_vector_upsert_seconds", "Vector store upsert per index batch.")
+VECTOR_QUERY_SECONDS = histogram("rag_vector_query_seconds", "Vector store query (one call, may hold many vectors).")
+GENERATE_SECONDS = histogram(
+    "rag_generate_seconds", "Gemini generation, request to last token.", ("mode",),
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0, 60.0, 120.0))
+TTFT_SECONDS = histogram(
+    "rag_time_to_first_token_seconds", "Question received to first streamed token.",
+    buckets=(0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 15.0, 30.0))
+PIPELINE_ITEMS = counter("rag_pipeline_items_total", "Items that passed through each ingest stage.", ("stage",))
+PIPELINE_STAGE_SECONDS = counter(
+    "rag_pipeline_stage_seconds_total", "Ingest stage thread time by state (busy / idle_input / idle_output).",
+    ("stage", "state"))
+INGEST_SECONDS = histogram(
+    "rag_ingest_seconds", "DocumentProcessor.run per document.", ("outcome",),
+    buckets=(1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0))
+STARTUP_SECONDS = gauge(
+    "rag_startup_seconds", "Import, warmup steps and time to ready of this process.", ("phase",))
+CONTEXT_TOKENS_USED = histogram(
+    "rag_context_tokens", "Evidence tokens packed into one prompt.",
+    buckets=(250, 500, 1000, 1500, 2000, 3000, 4000, 6000, 8000, 16000))
+PDF_TABLE_SECONDS = histogram("rag_pdf_table_seconds", "Table detection and cell extraction per PDF page.")
+FACT_LOOKUPS = counter(
+    "rag_fact_lookups_total", "Questions checked against the fact store, by outcome (answered / injected / none).",
+    ("outcome",))
+GEMINI_QUEUE_DEPTH = gauge(
+    "rag_gemini_queue_depth", "Gemini calls waiting for a rate-limit token in this process.", ("model", "priority"))
+GEMINI_WAIT_SECONDS = histogram(
+    "rag_gemini_wait_seconds", "Time a Gemini call waited for its token.", ("model", "priority"),
+    buckets=(0.001, 0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0))
+GEMINI_CALLS = counter("rag_gemini_calls_total", "Gemini calls by class and outcome.", ("model", "priority", "outcome"))
+GEMINI_RATE_FACTOR = gauge("rag_gemini_rate_factor", "Adaptive throttle: share of the configured rate in use.", ("model",))
+RETRY_DEAD_LETTERS = counter(
+    "rag_retry_dead_letters_total", "Chunks that failed to index RETRY_MAX_ATTEMPTS times and were given up on.")
@@ -0,0 +1,335 @@
+import argparse
+import fcntl
+import json
+import sqlite3
+import threading
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Sequence
+import numpy as np
+from config import MMAP_STORE_PATH, MMAP_DTYPE, MMAP_IVF_NPROBE, MMAP_IVF_AUTO_ROWS, MMAP_IVF_NLIST
+
+BLOCK_ROWS = 65_536  # rows decoded per step during a scan (bounds scratch memory)
+
+class MmapVectorStore:
+    """
+    Local vector store: an append-only matrix on disk, read through np.memmap.
+      vectors.bin  rows of `dim` float16 (or int8) values, unit-normalized
+      scales.f32   per-row dequantization scale (int8 only)
+      lists.i32    IVF list of each row (only after train_ivf)
+      ivf.npy      IVF centroids
+      meta.sqlite  row -> chunk id, document, metadata, alive flag
+    Opening maps the files instead of loading them, and worker processes mapping
+    the same files share the OS page cache. Upserts append a new row and retire
+    the old one; search is brute-force top-k in NumPy, or IVF once trained.
+    Distances are cosine distances (1 - cosine similarity).
+    """
+    def __init__(self, path: Path = MMAP_STORE_PATH, dtype: str = MMAP_DTYPE, nprobe: int = MMAP_IVF_NPROBE,
+                 ivf_auto_rows: int = MMAP_IVF_AUTO_ROWS, ivf_nlist: int = MMAP_IVF_NLIST):
+        self.path = Path(path)
+        self.ivf_auto_rows = ivf_auto_rows
+        self.ivf_nlist = ivf_nlist
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.nprobe = nprobe
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(str(self.path / "meta.sqlite"), check_same_thread=False, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        with self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS settings (name TEXT PRIMARY KEY, value TEXT)")
+            self.db.execute(
+                "CREATE TABLE IF NOT EXISTS rows ("
+                " row INTEGER PRIMARY KEY, chunk_id TEXT, source TEXT, page INTEGER,"
+                " document TEXT, metadata TEXT, alive INTEGER)"
+            )
+            self.db.execute("CREATE INDEX IF NOT EXISTS rows_chunk ON rows(chunk_id) WHERE alive = 1")
+            self.db.execute("CREATE INDEX IF NOT EXISTS rows_source_page ON rows(source, page) WHERE alive = 1")
+            # The on-disk format wins over the constructor argument
+            self.db.execute("INSERT OR IGNORE INTO settings VALUES ('dtype', ?)", (dtype,))
+        self.dtype = np.dtype(self._setting("dtype"))
+        self.dim = int(self._setting("dim") or 0)
+
+        self.n_rows = -1
+        self.data_version = None
+        self.matrix = self.scales = self.lists = self.centroids = None
+        self.alive = np.zeros(0, dtype=bool)
+
+    # --- Writes ---
+    def upsert(self, ids: list[str], embeddings, documents: list[str], metadatas: list[dict]):
+        vectors = _normalize(np.asarray(embeddings, dtype=np.float32))
+        with self.lock, self._file_lock():
+            self._ensure_dim(vectors.shape[1])
+            start = self._rows_on_disk()
+            encoded, scales = self._encode(vectors)
+            with open(self.path / "vectors.bin", "ab") as f:
+                f.write(encoded.tobytes())
+            if scales is not None:
+                with open(self.path / "scales.f32", "ab") as f:
+                    f.write(scales.tobytes())
+            centroids = self._load_centroids()
+            if centroids is not None:
+                with open(self.path / "lists.i32", "ab") as f:
+                    f.write(np.argmax(vectors @ centroids.T, axis=1).astype(np.int32).tobytes())
+
+            # Rows only become visible once this commits; a crash before it leaves dead bytes, not bad rows
+            with self.db:
+                self._retire(ids)
+                self.db.executemany(
+                    "INSERT INTO rows VALUES (?, ?, ?, ?, ?, ?, 1)",
+                    [
+                        (start + i, cid, (meta or {}).get("source"), (meta or {}).get("page"), doc, json.dumps(meta or {}))
+                        for i, (cid, doc, meta) in enumerate(zip(ids, documents, metadatas))
+                    ],
+                )
+            self.data_version = None  # our own commits don't bump PRAGMA data_version
+            untrained = centroids is None and self.ivf_auto_rows and start + len(ids) >= self.ivf_auto_rows
+        if untrained and self.count() >= self.ivf_auto_rows:
+            print(f"🧭 {self.path.name} reached {self.ivf_auto_rows} vectors, training its IVF index")
+            self.train_ivf(nlist=self.ivf_nlist, retrain=False)
+
+    def delete(self, ids: list[str]):
+        with self.lock, self.db:
+            self._retire(ids)
+            self.data_version = None
+
+    def _retire(self, ids: list[str]):
+        for i in range(0, len(ids), 500):
+            part = ids[i:i + 500]
+            self.db.execute(
+                f"UPDATE rows SET alive = 0 WHERE alive = 1 AND chunk_id IN ({','.join('?' * len(part))})", part
+            )
+
+    # --- Reads ---
+    def query(self, query_embeddings: Sequence, n_results: int, where: dict | None = None) -> dict:
+        queries = _normalize(np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1))
+        with self.lock:
+            self._refresh()
+            candidates = self._filter_rows(where) if where else None
+            if candidates is None and self.lists is not None:
+                top = [self._search_ivf(q, n_results) for q in queries]
+            elif candidates is not None:
+                top = [self._search_rows(q, candidates, n_results) for q in queries]
+            else:
+                top = self._search_all(queries, n_results)
+            return self._results(top)
+
+    def get(self, limit: int | None = None, offset: int = 0, include: Sequence[str] = ("documents", "metadatas")) -> dict:
+        with self.lock:
+            self._refresh()
+            rows = self.db.execute(
+                "SELECT row, chunk_id, document, metadata FROM rows WHERE alive = 1 ORDER BY row LIMIT ? OFFSET ?",
+                (-1 if limit is None else limit, offset),
+            ).fetchall()
+            result = {"ids": [r[1] for r in rows]}
+            if "documents" in include:
+                result["documents"] = [r[2] for r in rows]
+            if "metadatas" in include:
+                result["metadatas"] = [json.loads(r[3]) for r in rows]
+            if "embeddings" in include:
+                result["embeddings"] = self._decode(np.array([r[0] for r in rows], dtype=np.int64)).tolist() if rows else []
+            return result
+
+    def count(self) -> int:
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM rows WHERE alive = 1").fetchone()[0]
+
+    # --- IVF coarse index ---
+    def train_ivf(self, nlist: int = MMAP_IVF_NLIST, iterations: int = 10, sample: int = 100_000, seed: int = 0,
+                  retrain: bool = True):
+        """
+        k-means over (a sample of) the live vectors, then assigns every row to its nearest centroid.
+        Queries then scan only the `nprobe` closest lists. Rows added later are assigned on append
+        (to the old centroids: retrain once the corpus has grown a lot).
+        With retrain=False a store that already has an index (e.g. another worker trained it) is left alone.
+        """
+        with self.lock, self._file_lock():
+            if not retrain and self._load_centroids() is not None:
+                return
+            self._refresh()
+            live = np.flatnonzero(self.alive)
+            if len(live) < nlist:
+                raise ValueError(f"Need at least {nlist} vectors to train {nlist} lists, have {len(live)}")
+            rng = np.random.default_rng(seed)
+            train = self._decode(np.sort(rng.choice(live, size=min(sample, len(live)), replace=False)))
+            centroids = train[rng.choice(len(train), size=nlist, replace=False)]
+            for _ in range(iterations):
+                assignment = np.argmax(train @ centroids.T, axis=1)
+                for c in range(nlist):
+                    members = train[assignment == c]
+                    if len(members):
+                        centroids[c] = members.mean(axis=0)
+                centroids = _normalize(centroids)
+
+            lists = np.empty(self.n_rows, dtype=np.int32)
+            for start in range(0, self.n_rows, BLOCK_ROWS):
+                rows = np.arange(start, min(start + BLOCK_ROWS, self.n_rows))
+                lists[rows] = np.argmax(self._decode(rows) @ centroids.T, axis=1)
+            np.save(self.path / "ivf.npy", centroids)
+            lists.tofile(self.path / "lists.i32")
+            self.n_rows = -1  # remap everything on next read
+
+    # --- Internals ---
+    def _search_all(self, queries: np.ndarray, k: int) -> list[tuple[np.ndarray, np.ndarray]]:
+        """Brute force over every row, block by block, keeping a running top-k per query."""
+        best_rows = np.empty((len(queries), 0), dtype=np.int64)
+        best_scores = np.empty((len(queries), 0), dtype=np.float32)
+        for start in range(0, self.n_rows, BLOCK_ROWS):
+            rows = np.arange(start, min(start + BLOCK_ROWS, self.n_rows))
+            rows = rows[self.alive[rows]]
+            if not len(rows):
+                continue
+            scores = queries @ self._decode(rows).T
+            best_rows = np.concatenate([best_rows, np.broadcast_to(rows, scores.shape)], axis=1)
+            best_scores = np.concatenate([best_scores, scores], axis=1)
+            if best_scores.shape[1] > k:
+                keep = np.argpartition(-best_scores, k - 1, axis=1)[:, :k]
+                best_rows = np.take_along_axis(best_rows, keep, axis=1)
+                best_scores = np.take_along_axis(best_scores, keep, axis=1)
+        return [_sorted(r, s, k) for r, s in zip(best_rows, best_scores)]
+
+    def _search_rows(self, query: np.ndarray, rows: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        if not len(rows):
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        scores = self._decode(rows) @ query
+        return _sorted(rows, scores, k)
+
+    def _search_ivf(self, query: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+        probes = np.argsort(-(self.centroids @ query))[:self.nprobe]
+        in_lists = np.flatnonzero(np.isin(self.lists, probes))
+        unassigned = np.arange(len(self.lists), self.n_rows)  # appended by a writer without the index loaded
+        rows = np.concatenate([in_lists, unassigned])
+        return self._search_rows(query, rows[self.alive[rows]], k)
+
+    def _filter_rows(self, where: dict) -> np.ndarray:
+        clauses = where.get("$and", [where])
+        sql, params = "SELECT row FROM rows WHERE alive = 1", []
+        for clause in clauses:
+            for name, value in clause.items():
+                if name not in ("source", "page"):
+                    raise ValueError(f"mmap store can only filter on source/page, got {name!r}")
+                if isinstance(value, dict) and "$in" in value:
+                    sql += f" AND {name} IN ({','.join('?' * len(value['$in']))})"
+                    params.extend(value["$in"])
+                else:
+                    sql += f" AND {name} = ?"
+                    params.append(value)
+        rows = np.array([r[0] for r in self.db.execute(sql, params)], dtype=np.int64)
+        return rows[rows < self.n_rows]
+
+    def _results(self, top: list[tuple[np.ndarray, np.ndarray]]) -> dict:
+        wanted = sorted({int(r) for rows, _ in top for r in rows})
+        info = {}
+        for i in range(0, len(wanted), 500):
+            part = wanted[i:i + 500]
+            for row, cid, doc, meta in self.db.execute(
+                f"SELECT row, chunk_id, document, metadata FROM rows WHERE row IN ({','.join('?' * len(part))})", part
+            ):
+                info[row] = (cid, doc, json.loads(meta))
+        return {
+            "ids": [[info[int(r)][0] for r in rows] for rows, _ in top],
+            "documents": [[info[int(r)][1] for r in rows] for rows, _ in top],
+            "metadatas": [[info[int(r)][2] for r in rows] for rows, _ in top],
+            "distances": [[float(1 - s) for s in scores] for _, scores in top],
+        }
+
+    def _refresh(self):
+        """Remaps the files if another writer appended, reloads the alive mask if rows changed."""
+        n_rows = self._rows_on_disk()
+        if n_rows != self.n_rows:
+            self.n_rows = n_rows
+            self.matrix = self._map("vectors.bin", self.dtype, (n_rows, self.dim))
+            self.scales = self._map("scales.f32", np.float32, (n_rows,)) if self.dtype == np.int8 else None
+            self.centroids = self._load_centroids()
+            lists = self._map("lists.i32", np.int32, None) if self.centroids is not None else None
+            self.lists = lists[:n_rows] if lists is not None else None
+            self.data_version = None
+
+        data_version = self.db.execute("PRAGMA data_version").fetchone()[0]
+        if data_version != self.data_version:
+            self.data_version = data_version
+            self.alive = np.zeros(self.n_rows, dtype=bool)
+            live = np.array([r[0] for r in self.db.execute("SELECT row FROM rows WHERE alive = 1")], dtype=np.int64)
+            self.alive[live[live < self.n_rows]] = True
+
+    def _map(self, name: str, dtype, shape):
+        file = self.path / name
+        if not file.exists() or file.stat().st_size == 0 or (shape and 0 in shape):
+            return np.zeros(shape or 0, dtype=dtype)
+        return np.memmap(file, dtype=dtype, mode="r", shape=shape)
+
+    def _decode(self, rows: np.ndarray) -> np.ndarray:
+        block = np.asarray(self.matrix[rows], dtype=np.float32)
+        if self.dtype == np.int8:
+            block *= self.scales[rows][:, None]
+        return block
+
+    def _encode(self, vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray | None]:
+        if self.dtype == np.int8:
+            scales = (np.abs(vectors).max(axis=1) / 127).astype(np.float32)
+            scales[scales == 0] = 1.0
+            return np.round(vectors / scales[:, None]).astype(np.int8), scales
+        return vectors.astype(self.dtype), None
+
+    def _ensure_dim(self, dim: int):
+        if not self.dim:
+            with self.db:
+                self.db.execute("INSERT OR IGNORE INTO settings VALUES ('dim', ?)", (str(dim),))
+            self.dim = int(self._setting("dim"))
+        if dim != self.dim:
+            raise ValueError(f"Vector dimension {dim} does not match store dimension {self.dim}")
+
+    def _rows_on_disk(self) -> int:
+        if not self.dim:
+            self.dim = int(self._setting("dim") or 0)
+            if not self.dim:
+                return 0
+        file = self.path / "vectors.bin"
+        return file.stat().st_size // (self.dim * self.dtype.itemsize) if file.exists() else 0
+
+    def _load_centroids(self) -> np.ndarray | None:
+        file = self.path / "ivf.npy"
+        return np.load(file) if file.exists() else None
+
+    def _setting(self, name: str) -> str | None:
+        row = self.db.execute("SELECT value FROM settings WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+    @contextmanager
+    def _file_lock(self):
+        """Serializes appends across processes (ingest workers)."""
+        with open(self.path / "write.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32)
+
+def _sorted(rows: np.ndarray, scores: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    order = np.argsort(-scores)[:k]
+    return rows[order], scores[order]
+
+# --- CLI ---
+# python -m data_pipeline.mmap_store --train-ivf [--nlist 256]
+# (Re)trains the IVF index of every mmap store under STATE_DIR: the main one, reduced-dimension and shard ones.
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--train-ivf", action="store_true", help="(re)train the IVF index of every store")
+    parser.add_argument("--nlist", type=int, default=MMAP_IVF_NLIST)
+    args = parser.parse_args()
+
+    stores = sorted(p for p in MMAP_STORE_PATH.parent.glob(MMAP_STORE_PATH.name + "*") if (p / "meta.sqlite").exists())
+    for path in stores:
+        store = MmapVectorStore(path)
+        if not args.train_ivf:
+            print(f"📦 {path.name}: {store.count()} vectors, IVF {'trained' if store._load_centroids() is not None else 'not trained'}")
+            continue
+        count = store.count()
+        if count < args.nlist:
+            print(f"⏭️ {path.name}: {count} vectors, too few for {args.nlist} lists")
+            continue
+        store.train_ivf(nlist=args.nlist)
+        print(f"🧭 {path.name}: trained {args.nlist} lists over {count} vectors")
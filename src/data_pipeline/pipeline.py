@@ -0,0 +1,125 @@
+import queue
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Iterator, Optional
+
+# A stage turns the previous stage's stream into its own stream.
+# The first stage gets None, the last one is a sink (its return value is drained).
+StageFn = Callable[[Optional[Iterator]], Optional[Iterator]]
+
+_DONE = object()  # End-of-stream marker
+
+class PipelineCancelled(Exception):
+    """Raised inside a stage when another stage failed, or by a stage when the whole run is called off."""
+
+@dataclass
+class StageStats:
+    name: str
+    items: int = 0            # produced by the first stage, consumed by the others
+    wall: float = 0.0
+    wait_input: float = 0.0   # starved: upstream too slow
+    wait_output: float = 0.0  # blocked: downstream too slow
+
+    @property
+    def busy(self) -> float:
+        return max(0.0, self.wall - self.wait_input - self.wait_output)
+
+    def as_dict(self) -> dict:
+        return {
+            "items": self.items,
+            "busy_s": round(self.busy, 3),
+            "idle_input_s": round(self.wait_input, 3),
+            "idle_output_s": round(self.wait_output, 3),
+            "utilization": round(self.busy / self.wall, 3) if self.wall else 0.0,
+        }
+
+class ThreadedPipeline:
+    """
+    Runs every stage on its own thread, linked by bounded queues.
+    A full queue blocks the producer (backpressure), the first error
+    cancels every stage and is re-raised from run().
+    """
+    def __init__(self, queue_size: int = 64, poll_interval: float = 0.1):
+        self.queue_size = queue_size
+        self.poll_interval = poll_interval
+        self.stages: list[tuple[str, StageFn]] = []
+        self.stats: dict[str, StageStats] = {}
+
+    def add_stage(self, name: str, fn: StageFn) -> "ThreadedPipeline":
+        self.stages.append((name, fn))
+        return self
+
+    def run(self) -> dict[str, StageStats]:
+        cancel = threading.Event()
+        errors = []
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in self.stages[:-1]]
+        self.stats = {name: StageStats(name) for name, _ in self.stages}
+
+        def worker(index, name, fn):
+            stats = self.stats[name]
+            inbox = queues[index - 1] if index > 0 else None
+            outbox = queues[index] if index < len(queues) else None
+            started = time.perf_counter()
+            try:
+                stream = fn(self._read(inbox, stats, cancel) if inbox else None)
+                if stream is None:
+                    return
+                for item in stream:
+                    if inbox is None:
+                        stats.items += 1
+                    if outbox:
+                        self._put(outbox, item, stats, cancel)
+                if outbox:
+                    self._put(outbox, _DONE, stats, cancel)
+            except PipelineCancelled as e:
+                if not cancel.is_set():  # raised by the stage itself (the run was cancelled): stop the rest
+                    errors.append(e)
+                    cancel.set()
+            except BaseException as e:
+                errors.append(e)
+                cancel.set()
+            finally:
+                stats.wall = time.perf_counter() - started
+
+        threads = [
+            threading.Thread(target=worker, args=(i, name, fn), name=f"stage-{name}", daemon=True)
+            for i, (name, fn) in enumerate(self.stages)
+        ]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        if errors:
+            raise errors[0]
+        return self.stats
+
+    def _read(self, inbox: queue.Queue, stats: StageStats, cancel: threading.Event) -> Iterator:
+        while True:
+            waited = time.perf_counter()
+            while True:
+                if cancel.is_set():
+                    raise PipelineCancelled()
+                try:
+                    item = inbox.get(timeout=self.poll_interval)
+                    break
+                except queue.Empty:
+                    continue
+            stats.wait_input += time.perf_counter() - waited
+            if item is _DONE:
+                return
+            stats.items += 1
+            yield item
+
+    def _put(self, outbox: queue.Queue, item, stats: StageStats, cancel: threading.Event):
+        waited = time.perf_counter()
+        while True:
+            if cancel.is_set():
+                raise PipelineCancelled()
+            try:
+                outbox.put(item, timeout=self.poll_interval)
+                break
+            except queue.Full:
+                continue
+        stats.wait_output += time.perf_counter() - waited
@@ -0,0 +1,198 @@
+import asyncio
+import json
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Hashable
+from config import (
+    get_client, EMBEDDING_MODEL, EMBED_BATCH_SIZE,
+    QUERY_BATCH_WINDOW_MS, QUERY_BATCH_MAX, CHROMA_EXECUTOR_WORKERS,
+    EMBED_MAX_RETRIES, EMBED_BACKOFF_BASE, EMBED_BACKOFF_MAX,
+)
+from data_pipeline.scheduler import INTERACTIVE, BATCH, GeminiScheduler, get_scheduler, is_rate_limited
+from data_pipeline.embedding_cache import get_embedding_cache
+from data_pipeline.vector_store import get_vector_store
+from data_pipeline.metrics import EMBED_CALL_SECONDS, EMBED_TEXTS, EMBED_RETRIES, VECTOR_QUERY_SECONDS
+
+class MicroBatcher:
+    """
+    Gathers items submitted within `window_ms` (or until `max_batch`) into one call of
+    `run_batch(key, items) -> results`. Items only share a batch when their key matches.
+    Must be used from a single event loop.
+    """
+    def __init__(self, run_batch: Callable[[Hashable, list], Awaitable[list]], window_ms: float, max_batch: int):
+        self.run_batch = run_batch
+        self.window = window_ms / 1000
+        self.max_batch = max_batch
+        self.pending: dict[Hashable, list] = {}
+        self.timers: dict[Hashable, asyncio.TimerHandle] = {}
+        self.tasks = set()  # keep running batches referenced until they finish
+
+    async def submit(self, item, key: Hashable = None):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        batch = self.pending.setdefault(key, [])
+        batch.append((item, future))
+        if len(batch) >= self.max_batch:
+            self._flush(key)
+        elif len(batch) == 1:
+            self.timers[key] = loop.call_later(self.window, self._flush, key)
+        return await future
+
+    def _flush(self, key):
+        timer = self.timers.pop(key, None)
+        if timer:
+            timer.cancel()
+        batch = self.pending.pop(key, [])
+        if batch:
+            task = asyncio.get_running_loop().create_task(self._run(key, batch))
+            self.tasks.add(task)
+            task.add_done_callback(self.tasks.discard)
+
+    async def _run(self, key, batch):
+        try:
+            results = await self.run_batch(key, [item for item, _ in batch])
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, future), result in zip(batch, results):
+            if not future.done():  # the caller may have been cancelled meanwhile
+                future.set_result(result)
+
+# --- Chroma (and the local stores next to it) get their own, sized pool instead of the default executor ---
+_chroma_executor = None
+
+def get_chroma_executor() -> ThreadPoolExecutor:
+    global _chroma_executor
+    if _chroma_executor is None:
+        _chroma_executor = ThreadPoolExecutor(max_workers=CHROMA_EXECUTOR_WORKERS, thread_name_prefix="chroma")
+    return _chroma_executor
+
+async def run_in_chroma_executor(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(get_chroma_executor(), fn, *args)
+
+# Fields of a query result with one entry per query vector; the rest (e.g. "included") are shared
+PER_QUERY_FIELDS = {"ids", "embeddings", "documents", "uris", "data", "metadatas", "distances"}
+
+def split_query_results(results: dict, count: int) -> list[dict]:
+    """Turns one multi-vector collection.query result into `count` single-query results."""
+    per_query = []
+    for i in range(count):
+        single = {}
+        for name, value in results.items():
+            single[name] = [value[i]] if name in PER_QUERY_FIELDS and value is not None else value
+        per_query.append(single)
+    return per_query
+
+class QueryBatcher:
+    """
+    The async query path: native async embeddings and one multi-vector
+    collection.query for all the questions that arrive together.
+    Embed calls wait for the scheduler as "interactive" (/chat) or "batch" (embed_many).
+    """
+    def __init__(
+        self,
+        client=None,
+        model: str = EMBEDDING_MODEL,
+        window_ms: float = QUERY_BATCH_WINDOW_MS,
+        max_batch: int = QUERY_BATCH_MAX,
+        cache=None,
+        scheduler: GeminiScheduler | None = None,
+    ):
+        self.client = client if client is not None else get_client()
+        self.scheduler = scheduler or get_scheduler()
+        self.model = model
+        self.cache = cache
+        self.embeddings = MicroBatcher(self._embed_batch, window_ms, max_batch)
+        self.queries = MicroBatcher(self._query_batch, window_ms, max_batch)
+
+    async def embed(self, text: str) -> list[float]:
+        # The embedding cache is SQLite behind a lock: read it on the store executor, never the loop
+        if self.cache is not None:
+            cached = (await run_in_chroma_executor(self.cache.get_many, [text]))[0]
+            if cached is not None:
+                return cached
+        return await self.embeddings.submit(text, key=INTERACTIVE)
+
+    async def query(self, vector, n_results: int = 5, where: dict | None = None) -> dict:
+        # Only queries asking for the same k and filter can share a collection.query call
+        return await self.queries.submit(vector, key=(n_results, json.dumps(where, sort_keys=True)))
+
+    async def embed_many(self, texts: list[str]) -> list[list[float]]:
+        """
+        A known set of questions (/chat/batch): cache hits first, the rest in as few
+        embed_content calls as the API allows (EMBED_BATCH_SIZE texts each), sent together.
+        """
+        if self.cache is not None:
+            vectors = await run_in_chroma_executor(self.cache.get_many, texts)
+        else:
+            vectors = [None] * len(texts)
+        todo = list(dict.fromkeys(t for t, v in zip(texts, vectors) if v is None))
+        slices = [todo[i:i + EMBED_BATCH_SIZE] for i in range(0, len(todo), EMBED_BATCH_SIZE)]
+        embedded = await asyncio.gather(*(self._embed_batch(BATCH, part) for part in slices))
+        fresh = dict(zip(todo, (v for part in embedded for v in part)))
+        return [fresh[t] if v is None else v for t, v in zip(texts, vectors)]
+
+    async def query_many(self, vectors: list, n_results: int = 5, where: dict | None = None) -> list[dict]:
+        """One multi-vector collection.query for a known set of vectors; one result per vector."""
+        if not vectors:
+            return []
+        return await self._query_batch((n_results, json.dumps(where, sort_keys=True)), vectors)
+
+    async def _embed_batch(self, priority: str, texts: list[str]) -> list[list[float]]:
+        # The micro-batch key is the scheduler class
+        unique = list(dict.fromkeys(texts))
+        attempt = 0
+        EMBED_TEXTS.inc(len(unique), path="query")
+        while True:
+            await self.scheduler.acquire_async(self.model, priority)
+            start = time.perf_counter()
+            try:
+                response = await self.client.aio.models.embed_content(model=self.model, contents=unique)
+                EMBED_CALL_SECONDS.observe(time.perf_counter() - start, path="query", outcome="ok")
+                self.scheduler.report_nowait(self.model, priority)
+                break
+            except Exception as e:
+                self.scheduler.report_nowait(self.model, priority, e)
+                limited = is_rate_limited(e)
+                EMBED_CALL_SECONDS.observe(
+                    time.perf_counter() - start, path="query", outcome="rate_limited" if limited else "error")
+                if attempt >= EMBED_MAX_RETRIES or not limited:
+                    raise
+                EMBED_RETRIES.inc(path="query")
+                delay = min(EMBED_BACKOFF_MAX, EMBED_BACKOFF_BASE * (2 ** attempt))
+                attempt += 1
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+
+        vectors = dict(zip(unique, (e.values for e in response.embeddings)))
+        if self.cache is not None:
+            await run_in_chroma_executor(self.cache.put_many, unique, [vectors[t] for t in unique])
+        return [vectors[t] for t in texts]
+
+    async def _query_batch(self, key: tuple, vectors: list) -> list[dict]:
+        n_results, where = key[0], json.loads(key[1])
+        def run():
+            with VECTOR_QUERY_SECONDS.time():
+                return get_vector_store().query(query_embeddings=vectors, n_results=n_results, where=where)
+        results = await run_in_chroma_executor(run)
+        return split_query_results(results, len(vectors))
+
+# --- Shared instance (lives on the server's event loop) ---
+_default_batcher = None
+
+def get_query_batcher() -> QueryBatcher:
+    global _default_batcher
+    if _default_batcher is None:
+        _default_batcher = QueryBatcher(cache=get_embedding_cache())
+    return _default_batcher
+
+def _reset_after_fork():
+    # Executor threads and the event loop the batcher was bound to stay in the parent
+    global _default_batcher, _chroma_executor
+    _default_batcher = None
+    _chroma_executor = None
+
+os.register_at_fork(after_in_child=_reset_after_fork)
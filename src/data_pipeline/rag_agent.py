@@ -1,93 +1,321 @@
 import asyncio
-import chromadb
-import os
-from google import genai
-from google.genai import types
-from config import REASONING_MODEL, client, EMBEDDING_MODEL, chroma_client, collection
+import time
+from config import (
+    REASONING_MODEL, get_client, HYBRID_CANDIDATES, CONTEXT_CANDIDATES, CHAT_BATCH_CONCURRENCY,
+    FACT_ANSWERS,
+)
+from data_pipeline.embedding import get_default_engine
+from data_pipeline.answer_cache import get_answer_cache
+from data_pipeline.query_batcher import get_query_batcher, run_in_chroma_executor
+from data_pipeline.lexical import get_lexical_index, fuse_results, metadata_filter
+from data_pipeline.vector_store import get_vector_store
+from data_pipeline.context import build_context
+from data_pipeline.catalog import get_catalog, scope_sources
+from data_pipeline.facts import get_fact_store, fact_answer, facts_block
+from data_pipeline.scheduler import INTERACTIVE, BATCH, get_scheduler
+from data_pipeline.metrics import (
+    VECTOR_QUERY_SECONDS, GENERATE_SECONDS, TTFT_SECONDS, CONTEXT_TOKENS_USED, FACT_LOOKUPS,
+)
 
 def get_embedding(text):
-    result = client.models.embed_content(
-        model=EMBEDDING_MODEL,
-        contents=text
-    )
-    return result.embeddings[0].values
+    # Goes through the shared embedding cache, so repeated questions skip the API
+    return get_default_engine().embed([text], priority=INTERACTIVE)[0]
 
 def generate_answer(query):
     print(f"🤔 Analyzing: '{query}'...")
+
+    # --- Step 0: TABLE FACTS (a line item + year the tables answer exactly) ---
+    facts = get_fact_store().lookup(query)
+    if FACT_ANSWERS and (direct := fact_answer(query, facts, get_catalog())):
+        return direct["answer"]
     
     # --- Step 1: RETRIEVAL ---
     query_vector = get_embedding(query)
-    results = collection.query(
-        query_embeddings=[query_vector],
-        n_results=5 # Get top 5 pieces of evidence
-    )
-    
-    # Combine the retrieved text into one big string
-    context_text = "\n\n".join(results['documents'][0])
+    with VECTOR_QUERY_SECONDS.time():
+        vector_results = get_vector_store().query(
+            query_embeddings=[query_vector],
+            n_results=HYBRID_CANDIDATES
+        )
+    lexical_hits = get_lexical_index().search(query, HYBRID_CANDIDATES)
+    results = fuse_results(vector_results, lexical_hits, n_results=CONTEXT_CANDIDATES)
     
     # --- Step 2: AUGMENTATION ---
-    # This is the "Prompt Engineering" part
-    prompt = f"""
-    You are a Senior Financial Analyst. 
-    Answer the user's question based ONLY on the following context. 
-    If the answer is not in the context, say "I don't have that information in the report."
+    # Overlapping chunks are merged and the evidence packed into the token budget
+    prompt = build_prompt(query, assemble_context(results).text, facts_block(facts))
     
-    CONTEXT:
-    {context_text}
-    
-    USER QUESTION:
-    {query}
-    """
-    
-    # --- Step 3: GENERATION ---
-    response = client.models.generate_content(
-        model="gemini-2.5-flash",
-        contents=prompt
-    )
+    # --- Step 3: GENERATION (after its turn at the shared Gemini quota) ---
+    def generate():
+        with GENERATE_SECONDS.time(mode="sync"):
+            return get_client().models.generate_content(
+                model=REASONING_MODEL,
+                contents=prompt
+            )
+    response = get_scheduler().call(REASONING_MODEL, INTERACTIVE, generate)
     
     return response.text
 
 # --- The New Async Version ---
-async def generate_answer_async(query):
-    print(f"🤔 Analyzing (Async): '{query}'...")
-    
-    # --- Step 1: Retrieval (Blocking I/O) ---
-    # ChromaDB is synchronous. If we run it directly here, it blocks the loop.
-    # We offload it to a separate thread so the Event Loop stays free.
-    
-    def run_retrieval():
-        query_vector = get_embedding(query) # This calls Sync embedding
-        return collection.query(
-            query_embeddings=[query_vector],
-            n_results=5
-        )
+async def embed_query_async(query):
+    # Native async embedding; questions arriving within a few ms share one API call
+    return await get_query_batcher().embed(query)
 
-    # await the thread
-    results = await asyncio.to_thread(run_retrieval)
-    
-    # Combine context
-    context_text = "\n\n".join(results['documents'][0])
-    
+def resolve_scope(source=None, issuer=None, period=None):
+    """
+    The documents a question may search: None (all), one source, or a list of sources.
+    Issuer / fiscal period are looked up in the catalog; the vector store then only
+    searches the shards holding those documents.
+    """
+    if issuer is None and period is None:
+        return source
+    return scope_sources(get_catalog(), source, issuer, period)
+
+async def lookup_facts_async(query, source=None, page=None):
+    """
+    (rows, direct answer or None) from the table fact store: local SQLite, milliseconds.
+    The direct answer is only there when the table settles the question (see facts.fact_answer);
+    otherwise the rows go into the prompt as exact figures.
+    """
+    if source == []:
+        return [], None
+    sources = [source] if isinstance(source, str) else source
+
+    def lookup():
+        facts = get_fact_store().lookup(query, sources, page)
+        return facts, fact_answer(query, facts, get_catalog()) if FACT_ANSWERS else None
+
+    facts, direct = await run_in_chroma_executor(lookup)
+    FACT_LOOKUPS.inc(outcome="answered" if direct else "injected" if facts else "none")
+    return facts, direct
+
+def no_results():
+    return {"ids": [[]], "documents": [[]], "metadatas": [[]], "distances": [[]]}
+
+async def retrieve_async(query, n_results=CONTEXT_CANDIDATES, query_vector=None, source=None, page=None,
+                         vector_results=None):
+    # --- Step 1: Retrieval (hybrid: vectors + BM25, fused by rank) ---
+    # ChromaDB is synchronous, so it runs on its own sized thread pool (never the default executor).
+    # Concurrent questions are answered by one multi-vector collection.query.
+    # The BM25 index is local SQLite: exact terms ("Note 14") without another network call.
+    # `vector_results` skips the vector query when the caller already ran it (/chat/batch).
+    # `source` may be a list (see resolve_scope); an empty list means nothing is in scope.
+    if source == []:
+        return fuse_results(no_results(), [], n_results)
+    candidates = max(n_results, HYBRID_CANDIDATES)
+    lexical = run_in_chroma_executor(get_lexical_index().search, query, candidates, source, page)
+    if vector_results is not None:
+        return fuse_results(vector_results, await lexical, n_results)
+    if query_vector is None:
+        query_vector = await embed_query_async(query)
+    vector_results, lexical_hits = await asyncio.gather(
+        get_query_batcher().query(query_vector, n_results=candidates, where=metadata_filter(source, page)),
+        lexical,
+    )
+    return fuse_results(vector_results, lexical_hits, n_results)
+
+def assemble_context(results):
+    """Merged, deduplicated evidence that fits CONTEXT_TOKENS, most relevant first, with citations."""
+    context = build_context(results)
+    CONTEXT_TOKENS_USED.observe(context.tokens)
+    return context
+
+def build_prompt(query, context_text, facts_text=""):
     # --- Step 2: Augmentation ---
-    prompt = f"""
+    tables = f"""
+    TABLE ROWS (exact figures from the reports' financial tables; prefer them over numbers in the excerpts):
+    {facts_text}
+    """ if facts_text else ""
+    return f"""
     You are a Senior Financial Analyst. 
     Answer the user's question based ONLY on the following context. 
+    If the answer is not in the context, say "I don't have that information in the report."
+    Cite the excerpts you use by their number, like [1].
     
     CONTEXT:
     {context_text}
-    
+    {tables}
     USER QUESTION:
     {query}
     """
+
+async def answer_question_async(query, source=None, page=None, issuer=None, period=None):
+    """
+    Answer + sources. A line item + year the financial tables hold is answered from
+    the fact store ("exact": True); near-duplicate questions from the semantic answer cache.
+    `source` / `page` restrict retrieval to one document (and page),
+    `issuer` / `period` to the documents the catalog has for them.
+    """
+    print(f"🤔 Analyzing (Async): '{query}'...")
+    sources = resolve_scope(source, issuer, period)
+    facts, direct = await lookup_facts_async(query, sources, page)
+    if direct:
+        return {**direct, "cached": False, "exact": True}
+
+    query_vector = await embed_query_async(query)
+    scope = (source, page, issuer, period)
+    # The lookup reads the version file and scans the cached vectors: never on the loop
+    hit, version = await run_in_chroma_executor(get_answer_cache().lookup, query_vector, scope)
+    if hit:
+        return {"answer": hit.answer, "sources": hit.sources, "cached": True, "exact": False}
+
+    results = await retrieve_async(query, query_vector=query_vector, source=sources, page=page)
+    return await generate_from_results(query, query_vector, results, scope, facts, version=version)
+
+async def generate_from_results(query, query_vector, results, scope=(), facts=(), priority=INTERACTIVE,
+                                version=None):
+    """
+    Context, prompt and answer for already retrieved `results` (plus matching table
+    `facts`, quoted as exact rows); the answer goes into the cache, unless the
+    collection changed since the cache lookup that returned `version`.
+    `priority` is the scheduler class of the generation call.
+    """
+    context = assemble_context(results)
+    prompt = build_prompt(query, context.text, facts_block(facts))
     
     # --- Step 3: Generation (Native Async) ---
-    # The new google-genai client has an '.aio' accessor for async methods
-    response = await client.aio.models.generate_content(
-        model=REASONING_MODEL,
-        contents=prompt
-    )
-    
-    return response.text
+    # The new google-genai client has an '.aio' accessor for async methods.
+    # The call waits for its turn at the shared quota; the timing starts once it goes out.
+    async def generate():
+        with GENERATE_SECONDS.time(mode="async"):
+            return await get_client().aio.models.generate_content(
+                model=REASONING_MODEL,
+                contents=prompt
+            )
+    response = await get_scheduler().call_async(REASONING_MODEL, priority, generate)
+
+    sources = context.citations
+    await run_in_chroma_executor(get_answer_cache().store, query, query_vector, response.text, sources, scope, version)
+    return {"answer": response.text, "sources": sources, "cached": False, "exact": False}
+
+async def generate_answer_async(query):
+    return (await answer_question_async(query))["answer"]
+
+async def stream_answer_async(query, source=None, page=None, issuer=None, period=None):
+    """
+    Streaming version: yields events as they happen.
+      {"type": "sources", "sources": [...]}   - right after retrieval
+      {"type": "token", "text": "..."}        - each generated fragment
+      {"type": "done", "ttft_ms": .., "total_ms": .., "cached": bool, "exact": bool}
+    Answers from the fact store or the cache come as a single token.
+    Closing the generator (client went away) stops the Gemini stream.
+    """
+    print(f"🤔 Analyzing (Stream): '{query}'...")
+    started = time.perf_counter()
+    in_scope = resolve_scope(source, issuer, period)
+    facts, direct = await lookup_facts_async(query, in_scope, page)
+    hit = None
+    if not direct:
+        query_vector = await embed_query_async(query)
+        scope = (source, page, issuer, period)
+        hit, version = await run_in_chroma_executor(get_answer_cache().lookup, query_vector, scope)
+    if direct or hit:
+        answer = direct or {"answer": hit.answer, "sources": hit.sources}
+        yield {"type": "sources", "sources": answer["sources"]}
+        yield {"type": "token", "text": answer["answer"]}
+        elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+        yield {"type": "done", "ttft_ms": elapsed_ms, "total_ms": elapsed_ms,
+               "cached": hit is not None, "exact": bool(direct)}
+        return
+
+    results = await retrieve_async(query, query_vector=query_vector, source=in_scope, page=page)
+    context = assemble_context(results)
+    sources = context.citations
+    yield {"type": "sources", "sources": sources}
+
+    scheduler = get_scheduler()
+    await scheduler.acquire_async(REASONING_MODEL, INTERACTIVE)
+    generation_started = time.perf_counter()
+    try:
+        stream = await get_client().aio.models.generate_content_stream(
+            model=REASONING_MODEL,
+            contents=build_prompt(query, context.text, facts_block(facts))
+        )
+    except Exception as e:
+        scheduler.report_nowait(REASONING_MODEL, INTERACTIVE, e)
+        raise
+    scheduler.report_nowait(REASONING_MODEL, INTERACTIVE)
+    ttft_ms = None
+    parts = []
+    try:
+        async for chunk in stream:
+            if not chunk.text:
+                continue
+            if ttft_ms is None:
+                ttft_ms = (time.perf_counter() - started) * 1000
+                TTFT_SECONDS.observe(ttft_ms / 1000)
+                print(f"⚡ Time to first token: {ttft_ms:.0f} ms")
+            parts.append(chunk.text)
+            yield {"type": "token", "text": chunk.text}
+    finally:
+        # Runs on normal end, on error and on cancellation: release the upstream stream
+        if hasattr(stream, "aclose"):
+            await stream.aclose()
+
+    GENERATE_SECONDS.observe(time.perf_counter() - generation_started, mode="stream")
+    # Only complete answers are cached (we never get here if the client left)
+    await run_in_chroma_executor(get_answer_cache().store, query, query_vector, "".join(parts), sources, scope, version)
+    yield {
+        "type": "done",
+        "ttft_ms": round(ttft_ms, 1) if ttft_ms is not None else None,
+        "total_ms": round((time.perf_counter() - started) * 1000, 1),
+        "cached": False,
+        "exact": False,
+    }
+
+async def answer_batch_async(questions, source=None, page=None, concurrency=CHAT_BATCH_CONCURRENCY,
+                             issuer=None, period=None):
+    """
+    Many questions about the same scope (the nightly standard questions):
+    one embedding pass and one multi-vector query for all of them, then at most
+    `concurrency` generations at a time, queued behind interactive Gemini calls.
+    Yields each result as soon as it is done:
+      {"index", "question", "answer", "sources", "cached", "exact"}  or  {"index", "question", "error"}
+    A failed question doesn't stop the others. Table lookups are answered before any generation.
+    """
+    print(f"🤔 Analyzing (Batch): {len(questions)} questions...")
+    batcher = get_query_batcher()
+    cache = get_answer_cache()
+    scope = (source, page, issuer, period)
+    sources = resolve_scope(source, issuer, period)
+    vectors = await batcher.embed_many(questions)
+    looked_up = await run_in_chroma_executor(lambda: [cache.lookup(vector, scope) for vector in vectors])
+    hits = [hit for hit, _ in looked_up]
+    versions = [version for _, version in looked_up]  # each answer is cached against what its lookup saw
+    todo = [i for i, hit in enumerate(hits) if hit is None]
+    if sources == []:
+        vector_results = {i: no_results() for i in todo}
+    else:
+        vector_results = dict(zip(todo, await batcher.query_many(
+            [vectors[i] for i in todo],
+            n_results=max(CONTEXT_CANDIDATES, HYBRID_CANDIDATES),
+            where=metadata_filter(sources, page),
+        )))
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def answer(i):
+        question = questions[i]
+        try:
+            facts, direct = await lookup_facts_async(question, sources, page)
+            if direct:
+                return {"index": i, "question": question, **direct, "cached": False, "exact": True}
+            if hits[i] is not None:
+                return {"index": i, "question": question, "answer": hits[i].answer,
+                        "sources": hits[i].sources, "cached": True, "exact": False}
+            results = await retrieve_async(question, source=sources, page=page, vector_results=vector_results[i])
+            async with semaphore:
+                return {"index": i, "question": question,
+                        **await generate_from_results(question, vectors[i], results, scope, facts, BATCH,
+                                                      versions[i])}
+        except Exception as e:
+            return {"index": i, "question": question, "error": str(e)}
+
+    tasks = [asyncio.create_task(answer(i)) for i in range(len(questions))]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        # The client went away (or the caller stopped early): don't keep generating
+        for task in tasks:
+            task.cancel()
 
 if __name__ == "__main__":
     # The moment of truth
@@ -0,0 +1,137 @@
+import os
+import sqlite3
+import threading
+from pathlib import Path
+from typing import Sequence
+import numpy as np
+from config import FULL_VECTORS_PATH, RERANK_CANDIDATES
+
+# --- Reduced-dimension vectors ---
+# gemini-embedding-001 is trained Matryoshka-style: the first N dimensions of a
+# vector, renormalized, are themselves a usable N-dim embedding. So we keep asking
+# the API for full vectors (the embedding cache holds those) and shrink them here,
+# which also lets an existing collection be re-projected without any API call.
+
+def reduce_dim(vectors, dim: int) -> np.ndarray:
+    """First `dim` components of each vector, L2-normalized (float32)."""
+    matrix = np.asarray(vectors, dtype=np.float32)
+    matrix = matrix.reshape(len(matrix), -1)[:, :dim]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+class FullVectorStore:
+    """
+    Side store for full-precision vectors, only read to re-rank a few candidates.
+    Unit-normalized float16 blobs in SQLite keyed by chunk id: half the size of
+    float32 and never scanned, so it can stay on disk.
+    """
+    def __init__(self, path: Path = FULL_VECTORS_PATH):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(str(path), check_same_thread=False, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        with self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS vectors (chunk_id TEXT PRIMARY KEY, vector BLOB)")
+
+    def put(self, ids: list[str], vectors):
+        unit = reduce_dim(vectors, np.asarray(vectors).shape[-1]).astype(np.float16)
+        with self.lock, self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO vectors VALUES (?, ?)", zip(ids, (v.tobytes() for v in unit))
+            )
+
+    def get(self, ids: Sequence[str]) -> dict[str, np.ndarray]:
+        found = {}
+        with self.lock:
+            for i in range(0, len(ids), 500):  # stay under SQLite's variable limit
+                part = list(ids[i:i + 500])
+                rows = self.db.execute(
+                    f"SELECT chunk_id, vector FROM vectors WHERE chunk_id IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                found.update((cid, np.frombuffer(blob, dtype=np.float16).astype(np.float32)) for cid, blob in rows)
+        return found
+
+    def delete(self, ids: list[str]):
+        with self.lock, self.db:
+            self.db.executemany("DELETE FROM vectors WHERE chunk_id = ?", [(cid,) for cid in ids])
+
+    def count(self) -> int:
+        with self.lock:
+            return self.db.execute("SELECT COUNT(*) FROM vectors").fetchone()[0]
+
+class ReducedVectorStore:
+    """
+    VectorStore that keeps `dim`-dimension vectors in the wrapped store (fast
+    first-stage search). With a FullVectorStore it also keeps the full vectors
+    aside and re-ranks the top `candidates` of every query with them.
+    Callers keep passing full-size vectors both ways.
+    """
+    def __init__(self, inner, dim: int, full: FullVectorStore | None = None, candidates: int = RERANK_CANDIDATES):
+        self.inner = inner
+        self.dim = dim
+        self.full = full
+        self.candidates = candidates
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        if self.full is not None:
+            self.full.put(ids, embeddings)
+        self.inner.upsert(ids=ids, embeddings=reduce_dim(embeddings, self.dim).tolist(),
+                          documents=documents, metadatas=metadatas)
+
+    def delete(self, ids):
+        self.inner.delete(ids)
+        if self.full is not None:
+            self.full.delete(ids)
+
+    def query(self, query_embeddings, n_results, where=None):
+        queries = np.asarray(query_embeddings, dtype=np.float32).reshape(len(query_embeddings), -1)
+        first_stage = n_results if self.full is None else max(n_results, self.candidates)
+        results = self.inner.query(reduce_dim(queries, self.dim).tolist(), n_results=first_stage, where=where)
+        if self.full is None:
+            return results
+        return self._rerank(results, reduce_dim(queries, queries.shape[1]), n_results)
+
+    def get(self, limit=None, offset=0, include=("documents", "metadatas")):
+        return self.inner.get(limit=limit, offset=offset, include=include)
+
+    def count(self):
+        return self.inner.count()
+
+    def _rerank(self, results: dict, queries: np.ndarray, k: int) -> dict:
+        """
+        Re-sorts each query's candidates by full-precision cosine; distances become 1 - cosine,
+        the metric every backend already reports, so candidates without a full vector stay comparable.
+        """
+        reranked = {name: list(value) if isinstance(value, list) else value for name, value in results.items()}
+        for i, query in enumerate(queries):
+            ids = results["ids"][i]
+            full = self.full.get(ids)
+            # Candidates without a full vector (indexed before the side store) keep their order, after the rest
+            scores = [float(full[cid] @ query) if cid in full else None for cid in ids]
+            order = sorted(range(len(ids)), key=lambda j: (scores[j] is None, -(scores[j] or 0.0), j))[:k]
+            for name, value in results.items():
+                # Per-query fields hold one list per query; shared ones (e.g. Chroma's "included") don't
+                if isinstance(value, list) and len(value) == len(queries) and value[i] is not None \
+                        and not isinstance(value[i], str):
+                    reranked[name][i] = [value[i][j] for j in order]
+            if isinstance(results.get("distances"), list):
+                reranked["distances"][i] = [
+                    1.0 - scores[j] if scores[j] is not None else results["distances"][i][j] for j in order
+                ]
+        return reranked
+
+# --- Shared side store ---
+_default_full = None
+
+def get_full_vector_store() -> FullVectorStore:
+    global _default_full
+    if _default_full is None:
+        _default_full = FullVectorStore()
+    return _default_full
+
+def _reset_after_fork():
+    # SQLite connections must not cross a fork; the child reopens on first use
+    global _default_full
+    _default_full = None
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,387 @@
+import asyncio
+import heapq
+import itertools
+import os
+from collections import deque
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable
+from config import (
+    EMBEDDING_MODEL, REASONING_MODEL, SCHEDULER_PATH, EMBED_RPM, GENERATE_RPM, RATE_BURST_SECONDS,
+    BULK_RESERVE, THROTTLE_DECREASE, THROTTLE_RECOVERY, THROTTLE_MIN,
+)
+from data_pipeline.metrics import GEMINI_QUEUE_DEPTH, GEMINI_WAIT_SECONDS, GEMINI_CALLS, GEMINI_RATE_FACTOR
+
+# --- Gemini call scheduler ---
+# Ingest workers, /chat and /chat/batch share one quota. Every embed/generate call
+# takes a token from its model's bucket first. The buckets live in SQLite, so the
+# API process and the (spawned) ingest workers draw from the same ones. Within a
+# process, waiting calls are served by class; across processes, bulk calls hold
+# back while a higher class is waiting anywhere. A 429 slows the model down for
+# everyone, and the rate creeps back up with each call that gets through.
+
+INTERACTIVE, BATCH, BULK = "interactive", "batch", "bulk"  # /chat, /chat/batch, ingest
+PRIORITIES = (INTERACTIVE, BATCH, BULK)
+DEMAND_TTL = 5.0       # a process's "calls waiting" row counts for this long without a refresh
+DEMAND_REFRESH = 1.0
+YIELD_POLL = 0.05      # how often a class that is holding back re-checks
+THROTTLE_COOLDOWN = 1.0  # 429s within this many seconds of the last one don't cut the rate again
+
+# HTTP codes Gemini uses for "slow down" (quota exhausted / overloaded)
+RATE_LIMIT_CODES = {429, 503}
+
+def is_rate_limited(error: Exception) -> bool:
+    code = getattr(error, "code", None) or getattr(error, "status_code", None)
+    if code in RATE_LIMIT_CODES:
+        return True
+    return "RESOURCE_EXHAUSTED" in str(error)
+
+def default_limits() -> dict[str, int]:
+    """Requests per minute by model; models not listed use GENERATE_RPM. 0 = no limit."""
+    return {EMBEDDING_MODEL: EMBED_RPM, REASONING_MODEL: GENERATE_RPM}
+
+class SharedBuckets:
+    """
+    Token buckets (one per model) plus each process's count of waiting calls per class,
+    in one SQLite file every process opens. A take is one short write transaction.
+    """
+    def __init__(self, path: Path = SCHEDULER_PATH, burst_seconds: float = RATE_BURST_SECONDS,
+                 bulk_reserve: float = BULK_RESERVE):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.burst_seconds = burst_seconds
+        self.bulk_reserve = bulk_reserve
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None, timeout=30)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")  # losing the last refill on a crash is harmless
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            " model TEXT PRIMARY KEY, tokens REAL, updated REAL, factor REAL, limited_at REAL)"
+        )
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS demand ("
+            " pid INTEGER, model TEXT, priority INTEGER, waiting INTEGER, updated REAL,"
+            " PRIMARY KEY (pid, model, priority))"
+        )
+
+    def take(self, model: str, rpm: float, priority: int, cost: float = 1.0) -> float:
+        """
+        Takes `cost` tokens if this class may have them now: 0.0 if granted, else the
+        seconds until it is worth asking again. Bulk calls leave BULK_RESERVE of the
+        bucket for the others and get nothing while a higher class waits in any process.
+        """
+        now = time.time()
+        rate = rpm / 60.0
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.db.execute("SELECT tokens, updated, factor FROM buckets WHERE model = ?", (model,)).fetchone()
+                tokens, updated, factor = (row["tokens"], row["updated"], row["factor"]) if row else (None, now, 1.0)
+                rate *= factor
+                capacity = max(cost, rate * self.burst_seconds)
+                tokens = capacity if tokens is None else min(capacity, tokens + (now - updated) * rate)
+
+                needed, ahead = cost, 0
+                if priority > 0:
+                    ahead = self.db.execute(
+                        "SELECT COALESCE(SUM(waiting), 0) FROM demand WHERE model = ? AND priority < ? AND updated > ?",
+                        (model, priority, now - DEMAND_TTL),
+                    ).fetchone()[0]
+                if priority == PRIORITIES.index(BULK):
+                    needed = min(capacity, cost + capacity * self.bulk_reserve)  # reachable even in a tiny bucket
+                granted = not ahead and tokens >= needed
+                if granted:
+                    tokens -= cost
+                self.db.execute(
+                    "INSERT INTO buckets (model, tokens, updated, factor) VALUES (?, ?, ?, ?)"
+                    " ON CONFLICT(model) DO UPDATE SET tokens = excluded.tokens, updated = excluded.updated",
+                    (model, tokens, now, factor),
+                )
+            finally:
+                self.db.execute("COMMIT")
+        if granted:
+            return 0.0
+        wait = max((needed - tokens) / rate, 0.001)
+        return max(wait, YIELD_POLL) if ahead else wait
+
+    def report(self, model: str, limited: bool, decrease: float = THROTTLE_DECREASE,
+               recovery: float = THROTTLE_RECOVERY, floor: float = THROTTLE_MIN) -> float:
+        """
+        Adaptive throttling: a rate-limited call cuts the model's rate (and empties its
+        bucket) for every process; each successful call gives some of it back.
+        Returns the rate factor now in use.
+        """
+        now = time.time()
+        with self.lock:
+            row = self.db.execute("SELECT factor, limited_at FROM buckets WHERE model = ?", (model,)).fetchone()
+            factor = row["factor"] if row else 1.0
+            if limited:
+                # The calls that were in flight together fail together: that's one signal, not several
+                if not row or not row["limited_at"] or now - row["limited_at"] > THROTTLE_COOLDOWN:
+                    factor = max(floor, factor * decrease)
+                self.db.execute(
+                    "INSERT INTO buckets VALUES (?, 0, ?, ?, ?)"
+                    " ON CONFLICT(model) DO UPDATE SET tokens = 0, updated = excluded.updated,"
+                    " factor = excluded.factor, limited_at = excluded.limited_at",
+                    (model, now, factor, now),
+                )
+            elif factor < 1.0:  # the common case (full speed) costs no write
+                factor = min(1.0, factor + recovery)
+                self.db.execute("UPDATE buckets SET factor = ? WHERE model = ?", (factor, model))
+        return factor
+
+    def publish_demand(self, waiting: dict[tuple[str, int], int]):
+        """This process's waiting calls per (model, priority); zero rows are removed."""
+        now, pid = time.time(), os.getpid()
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                self.db.execute("DELETE FROM demand WHERE pid = ? OR updated < ?", (pid, now - DEMAND_TTL))
+                self.db.executemany(
+                    "INSERT INTO demand VALUES (?, ?, ?, ?, ?)",
+                    [(pid, model, priority, n, now) for (model, priority), n in waiting.items() if n],
+                )
+            finally:
+                self.db.execute("COMMIT")
+
+    def state(self) -> dict:
+        """Every model's bucket and the calls waiting for it, across processes."""
+        now = time.time()
+        with self.lock:
+            buckets = [dict(row) for row in self.db.execute("SELECT * FROM buckets ORDER BY model")]
+            demand = self.db.execute(
+                "SELECT model, priority, SUM(waiting) AS waiting FROM demand WHERE updated > ? GROUP BY model, priority",
+                (now - DEMAND_TTL,),
+            ).fetchall()
+        for bucket in buckets:
+            bucket["waiting"] = {
+                PRIORITIES[row["priority"]]: row["waiting"] for row in demand if row["model"] == bucket["model"]
+            }
+            bucket["since_rate_limited_s"] = round(now - bucket["limited_at"], 1) if bucket["limited_at"] else None
+        return {"models": buckets}
+
+@dataclass(order=True)
+class _Ticket:
+    priority: int
+    seq: int
+    model: str = field(compare=False)
+    cost: float = field(compare=False)
+    grant: Callable[[], None] = field(compare=False)
+    abandoned: Callable[[], bool] = field(compare=False)
+
+class GeminiScheduler:
+    """
+    The process's gate in front of Gemini: `acquire` (threads) and `acquire_async`
+    (event loop) return once the call may go out, `report` / `report_nowait` feed the
+    outcome back. A thread's call goes straight through when nothing of its model is
+    waiting here and the bucket has a token; otherwise it queues, and one dispatcher
+    thread hands tokens to the queue heads, highest class first, oldest first within
+    a class. The event loop never touches the SQLite file (another process may hold
+    its write lock): async calls always go through the dispatcher.
+    """
+    def __init__(self, buckets: SharedBuckets | None = None, limits: dict[str, int] | None = None,
+                 default_rpm: int = GENERATE_RPM):
+        self.buckets = buckets or SharedBuckets()
+        self.limits = default_limits() if limits is None else limits
+        self.default_rpm = default_rpm
+        self.lock = threading.Lock()
+        self.queues: dict[str, list[_Ticket]] = {}
+        self.seq = itertools.count()
+        self.outcomes = deque()  # (model, rate limited) reported from the loop, written by the dispatcher
+        self.wakeup = threading.Event()
+        self.dispatcher = None
+
+    def rpm(self, model: str) -> float:
+        return self.limits.get(model, self.default_rpm)
+
+    def acquire(self, model: str, priority: str = BULK, cost: float = 1.0) -> float:
+        """Blocks until the call may go out; returns the seconds it waited."""
+        started = time.perf_counter()
+        if not self._take_now(model, priority, cost):
+            granted = threading.Event()
+            self._enqueue(model, priority, cost, granted.set, lambda: False)
+            granted.wait()
+        return self._waited(started, model, priority)
+
+    async def acquire_async(self, model: str, priority: str = INTERACTIVE, cost: float = 1.0) -> float:
+        """
+        Awaits the token without blocking the loop: the dispatcher thread takes it
+        (a wake-up and a thread hop when the bucket is full). A cancelled caller gives up its place.
+        """
+        started = time.perf_counter()
+        if self.rpm(model):
+            loop = asyncio.get_running_loop()
+            granted = loop.create_future()
+
+            def grant():
+                try:
+                    loop.call_soon_threadsafe(lambda: granted.done() or granted.set_result(None))
+                except RuntimeError:
+                    pass  # the loop is closed, nobody is waiting any more
+
+            self._enqueue(model, priority, cost, grant, granted.cancelled)
+            await granted
+        return self._waited(started, model, priority)
+
+    def report(self, model: str, priority: str, error: Exception | None = None):
+        """Outcome of a call that went out: rate-limit errors throttle the model."""
+        if (limited := self._count(model, priority, error)) is not None:
+            self._throttle(model, limited)
+
+    def report_nowait(self, model: str, priority: str, error: Exception | None = None):
+        """report() for the event loop: the shared bucket is updated by the dispatcher thread."""
+        if (limited := self._count(model, priority, error)) is not None:
+            self.outcomes.append((model, limited))
+            with self.lock:
+                self._start_dispatcher()
+            self.wakeup.set()
+
+    def call(self, model: str, priority: str, fn: Callable, cost: float = 1.0):
+        """fn() once a token is granted, reporting how it went."""
+        self.acquire(model, priority, cost)
+        try:
+            result = fn()
+        except Exception as e:
+            self.report(model, priority, e)
+            raise
+        self.report(model, priority)
+        return result
+
+    async def call_async(self, model: str, priority: str, fn: Callable, cost: float = 1.0):
+        """await fn() once a token is granted, reporting how it went."""
+        await self.acquire_async(model, priority, cost)
+        try:
+            result = await fn()
+        except Exception as e:
+            self.report_nowait(model, priority, e)
+            raise
+        self.report_nowait(model, priority)
+        return result
+
+    def stats(self) -> dict:
+        """This process's queues by class, next to the shared buckets."""
+        with self.lock:
+            queued = {
+                model: {name: sum(1 for t in queue if t.priority == rank) for rank, name in enumerate(PRIORITIES)}
+                for model, queue in self.queues.items()
+            }
+        return {"pid": os.getpid(), "queued": queued, "limits_rpm": self.limits, **self.buckets.state()}
+
+    # --- Internals ---
+    def _take_now(self, model: str, priority: str, cost: float) -> bool:
+        if not self.rpm(model):
+            return True
+        with self.lock:
+            if self.queues.get(model):
+                return False  # never overtake calls already waiting here
+        return self.buckets.take(model, self.rpm(model), PRIORITIES.index(priority), cost) == 0.0
+
+    def _count(self, model: str, priority: str, error: Exception | None) -> bool | None:
+        """Counts the outcome; whether it was rate limited, or None when the bucket doesn't care."""
+        limited = error is not None and is_rate_limited(error)
+        outcome = "ok" if error is None else "rate_limited" if limited else "error"
+        GEMINI_CALLS.inc(model=model, priority=priority, outcome=outcome)
+        return limited if self.rpm(model) and outcome != "error" else None
+
+    def _throttle(self, model: str, limited: bool):
+        factor = self.buckets.report(model, limited)
+        GEMINI_RATE_FACTOR.set(factor, model=model)
+        if limited:
+            print(f"🐢 {model} rate limited, throttled to {factor:.0%} of {self.rpm(model):.0f} rpm")
+
+    def _waited(self, started: float, model: str, priority: str) -> float:
+        waited = time.perf_counter() - started
+        GEMINI_WAIT_SECONDS.observe(waited, model=model, priority=priority)
+        return waited
+
+    def _enqueue(self, model, priority, cost, grant, abandoned):
+        ticket = _Ticket(PRIORITIES.index(priority), next(self.seq), model, cost, grant, abandoned)
+        with self.lock:
+            heapq.heappush(self.queues.setdefault(model, []), ticket)
+            self._depth(model)
+            self._start_dispatcher()
+        self.wakeup.set()
+
+    def _start_dispatcher(self):
+        # Caller holds self.lock
+        if self.dispatcher is None:
+            self.dispatcher = threading.Thread(target=self._dispatch, name="gemini-scheduler", daemon=True)
+            self.dispatcher.start()
+
+    def _depth(self, model: str):
+        # Caller holds self.lock
+        for rank, name in enumerate(PRIORITIES):
+            GEMINI_QUEUE_DEPTH.set(sum(1 for t in self.queues[model] if t.priority == rank), model=model, priority=name)
+
+    def _dispatch(self):
+        state = {"published": {}, "at": 0.0}
+        while True:
+            try:
+                self._dispatch_once(state)
+            except Exception as e:
+                # Waiters depend on this thread: log, back off, keep going (e.g. the SQLite file was busy)
+                print(f"❌ Scheduler dispatch failed: {e}")
+                time.sleep(DEMAND_REFRESH)
+
+    def _dispatch_once(self, state: dict):
+        """One pass: record outcomes, publish our demand, grant what the buckets allow, sleep until worth retrying."""
+        self.wakeup.clear()
+        while self.outcomes:
+            self._throttle(*self.outcomes.popleft())
+        with self.lock:
+            heads = {model: queue[0] for model, queue in self.queues.items() if queue}
+            waiting = {}
+            for model, queue in self.queues.items():
+                for ticket in queue:
+                    if ticket.priority < PRIORITIES.index(BULK):  # nobody yields to bulk
+                        waiting[(model, ticket.priority)] = waiting.get((model, ticket.priority), 0) + 1
+
+        # Other processes' bulk calls hold back while calls of a higher class wait here
+        if waiting != state["published"] or (waiting and time.monotonic() - state["at"] > DEMAND_REFRESH):
+            self.buckets.publish_demand(waiting)
+            state.update(published=waiting, at=time.monotonic())
+
+        delay = None
+        for model, ticket in heads.items():
+            wait = 0.0 if ticket.abandoned() else self.buckets.take(model, self.rpm(model), ticket.priority, ticket.cost)
+            if wait:
+                delay = wait if delay is None else min(delay, wait)
+                continue
+            with self.lock:
+                queue = self.queues[model]
+                queue.remove(ticket)
+                heapq.heapify(queue)
+                self._depth(model)
+            if not ticket.abandoned():
+                ticket.grant()
+            delay = 0.0
+
+        if delay is None:
+            self.wakeup.wait()  # nothing queued: sleep until a call has to wait
+        elif delay:
+            # Wake for a new (maybe higher-class) call, the next token, or a demand refresh
+            self.wakeup.wait(min(delay, DEMAND_REFRESH))
+
+# --- Shared instance ---
+_default_scheduler = None
+_default_lock = threading.Lock()
+
+def get_scheduler() -> GeminiScheduler:
+    global _default_scheduler
+    if _default_scheduler is None:
+        with _default_lock:
+            if _default_scheduler is None:
+                _default_scheduler = GeminiScheduler()
+    return _default_scheduler
+
+def _reset_after_fork():
+    # The dispatcher thread and the SQLite connection stay in the parent
+    global _default_scheduler, _default_lock
+    _default_scheduler = None
+    _default_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
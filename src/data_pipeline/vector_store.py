@@ -0,0 +1,114 @@
+import os
+import threading
+from typing import Protocol, Sequence
+from config import (
+    VECTOR_BACKEND, CHROMA_PATH, COLLECTION_NAME, MMAP_STORE_PATH, EMBED_STORE_DIM, RERANK_FULL, SHARD_BY,
+)
+
+# --- Protocol Definition ---
+# Everything that reads or writes vectors (Indexer, rag_agent, retrieval) goes through this.
+# Results use Chroma's shape: one inner list per query vector. Every backend reports
+# cosine distances (1 - cosine similarity), so results from different stores, shards
+# and re-ranking compare and merge directly.
+class VectorStore(Protocol):
+    def upsert(self, ids: list[str], embeddings: list, documents: list[str], metadatas: list[dict]): ...
+    def delete(self, ids: list[str]): ...
+    def query(self, query_embeddings: Sequence, n_results: int, where: dict | None = None) -> dict: ...
+    def get(self, limit: int | None = None, offset: int = 0, include: Sequence[str] = ("documents", "metadatas")) -> dict: ...
+    def count(self) -> int: ...
+
+# --- Chroma Backend ---
+class ChromaStore:
+    """
+    Thin adapter over a Chroma collection. New collections use cosine space; ones created
+    earlier keep Chroma's default squared L2, which for our unit-length embeddings is
+    2 * (1 - cosine), so their distances are halved into the same metric.
+    """
+    def __init__(self, path: str = CHROMA_PATH, name: str = COLLECTION_NAME):
+        import chromadb  # only paid for when this backend is used
+        self.client = chromadb.PersistentClient(path=path)
+        try:
+            self.collection = self.client.get_collection(name=name)
+        except Exception:
+            # A fresh deployment (empty ./chroma_db) starts with an empty collection instead of failing
+            self.collection = self.client.get_or_create_collection(name=name, metadata={"hnsw:space": "cosine"})
+        self.l2 = _space(self.collection) == "l2"
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        self.collection.upsert(ids=ids, embeddings=embeddings, documents=documents, metadatas=metadatas)
+
+    def delete(self, ids):
+        self.collection.delete(ids=ids)
+
+    def query(self, query_embeddings, n_results, where=None):
+        results = self.collection.query(query_embeddings=list(query_embeddings), n_results=n_results, where=where)
+        if self.l2 and results.get("distances"):
+            results["distances"] = [[d / 2 for d in row] for row in results["distances"]]
+        return results
+
+    def get(self, limit=None, offset=0, include=("documents", "metadatas")):
+        return self.collection.get(limit=limit, offset=offset, include=list(include))
+
+    def count(self):
+        return self.collection.count()
+
+def _space(collection) -> str:
+    """The collection's distance function: set in metadata (how we create them) or its configuration."""
+    space = (collection.metadata or {}).get("hnsw:space")
+    if space is None:
+        try:
+            space = (collection.configuration.get("hnsw") or {}).get("space")
+        except Exception:  # older Chroma: no configuration
+            pass
+    return space or "l2"
+
+def open_vector_store(backend: str = VECTOR_BACKEND, dim: int = 0, shard: str | None = None) -> VectorStore:
+    """
+    The raw store: `dim` > 0 names the collection holding vectors reduced to that size,
+    `shard` one shard of it ("<name>_d768__<shard>").
+    """
+    suffix = (f"_d{dim}" if dim else "") + (f"__{shard}" if shard else "")
+    if backend == "chroma":
+        return ChromaStore(name=COLLECTION_NAME + suffix)
+    if backend == "mmap":
+        from data_pipeline.mmap_store import MmapVectorStore
+        return MmapVectorStore(MMAP_STORE_PATH.with_name(MMAP_STORE_PATH.name + suffix))
+    raise ValueError(f"Unknown VECTOR_BACKEND: {backend}")
+
+def open_collection(dim: int = 0, shard_by: str = SHARD_BY) -> VectorStore:
+    """The `dim` collection as stored: one collection, or all its shards routed through the catalog."""
+    if shard_by == "none":
+        return open_vector_store(dim=dim)
+    from data_pipeline.catalog import ShardedVectorStore, get_catalog
+    return ShardedVectorStore(lambda shard: open_vector_store(dim=dim, shard=shard), get_catalog())
+
+def open_configured_store(dim: int = EMBED_STORE_DIM, rerank: bool = RERANK_FULL, shard_by: str = SHARD_BY) -> VectorStore:
+    """
+    The store everything uses: one collection or one per shard (routed through the catalog),
+    holding full vectors or reduced ones (optionally re-ranked).
+    """
+    store = open_collection(dim, shard_by)
+    if not dim:
+        return store
+    from data_pipeline.reduced_store import ReducedVectorStore, get_full_vector_store
+    return ReducedVectorStore(store, dim, get_full_vector_store() if rerank else None)
+
+# --- Shared instance (opened on first use) ---
+_default_store = None
+_store_lock = threading.Lock()
+
+def get_vector_store() -> VectorStore:
+    global _default_store
+    if _default_store is None:
+        with _store_lock:  # opening Chroma is slow; concurrent first callers wait for one open
+            if _default_store is None:
+                _default_store = open_configured_store()
+    return _default_store
+
+def _reset_after_fork():
+    # SQLite/Chroma handles must not cross a fork; the child reopens on first use
+    global _default_store, _store_lock
+    _default_store = None
+    _store_lock = threading.Lock()
+
+os.register_at_fork(after_in_child=_reset_after_fork)
@@ -0,0 +1,264 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from config import JOBS_DB_PATH
+
+# --- Persistent Job Store ---
+# Replaces the in-memory JOBS dict: every API worker and ingest worker
+# opens the same SQLite file, so state survives restarts and is visible everywhere.
+# Job lifecycle: queued -> processing -> completed | failed
+# Log lines are rows in job_events, so clients fetch only what's new (by seq cursor).
+# Bulk uploads group their jobs in a batch (batch_jobs), read back as one aggregated view.
+
+JSON_FIELDS = {"stats"}
+TERMINAL_STATUSES = {"completed", "failed"}
+
+class JobStore:
+    def __init__(self, path: Path = JOBS_DB_PATH):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(str(path), check_same_thread=False, isolation_level=None, timeout=30)
+        self.db.row_factory = sqlite3.Row
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                status TEXT NOT NULL,
+                file TEXT,
+                source TEXT,
+                file_path TEXT,
+                file_hash TEXT,
+                progress INTEGER DEFAULT 0,
+                percent REAL DEFAULT 0,
+                stats TEXT,
+                error TEXT,
+                worker TEXT,
+                created_at REAL,
+                updated_at REAL
+            )"""
+        )
+        columns = {r["name"] for r in self.db.execute("PRAGMA table_info(jobs)")}
+        if "percent" not in columns:  # stores created before progress percentages
+            self.db.execute("ALTER TABLE jobs ADD COLUMN percent REAL DEFAULT 0")
+        self.db.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs(status, created_at)")
+        self.db.execute("CREATE INDEX IF NOT EXISTS jobs_hash ON jobs(file_hash)")
+        self.db.execute(
+            """CREATE TABLE IF NOT EXISTS job_events (
+                seq INTEGER PRIMARY KEY AUTOINCREMENT,
+                job_id TEXT NOT NULL,
+                ts REAL,
+                stage TEXT,
+                message TEXT,
+                percent REAL
+            )"""
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS job_events_job ON job_events(job_id, seq)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS batches (id TEXT PRIMARY KEY, label TEXT, created_at REAL)")
+        # A duplicate file points at the job that already has it (possibly from another batch)
+        self.db.execute(
+            "CREATE TABLE IF NOT EXISTS batch_jobs (batch_id TEXT NOT NULL, job_id TEXT NOT NULL, file TEXT, duplicate INTEGER)"
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS batch_jobs_batch ON batch_jobs(batch_id)")
+
+    def create(self, job_id: str, file_path: str, source: str, file_hash: str,
+               file: str | None = None) -> tuple[str, bool]:
+        """
+        Queues a job, unless the same file is already queued, running or done.
+        `source` is the document key (catalog.document_key), `file` the uploaded name.
+        Returns (job_id, created); on a duplicate, job_id is the existing job.
+        """
+        now = time.time()
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.db.execute(
+                    "SELECT id FROM jobs WHERE file_hash = ? AND status IN ('queued', 'processing', 'completed')"
+                    " ORDER BY created_at DESC LIMIT 1",
+                    (file_hash,),
+                ).fetchone()
+                if row:
+                    return row["id"], False
+                self.db.execute(
+                    "INSERT INTO jobs (id, status, file, source, file_path, file_hash, created_at, updated_at)"
+                    " VALUES (?, 'queued', ?, ?, ?, ?, ?, ?)",
+                    (job_id, file or source, source, file_path, file_hash, now, now),
+                )
+                return job_id, True
+            finally:
+                self.db.execute("COMMIT")
+
+    def get(self, job_id: str) -> dict | None:
+        """The job record plus its latest log line and cursor (never the whole log)."""
+        with self.lock:
+            row = self.db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            last = self.db.execute(
+                "SELECT seq, message FROM job_events WHERE job_id = ? ORDER BY seq DESC LIMIT 1", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        job = dict(row)
+        for field in JSON_FIELDS:
+            job[field] = json.loads(job[field]) if job[field] else None
+        job["latest"] = last["message"] if last else None
+        job["cursor"] = last["seq"] if last else 0
+        return job
+
+    def update(self, job_id: str, **fields):
+        fields["updated_at"] = time.time()
+        values = [json.dumps(v) if k in JSON_FIELDS else v for k, v in fields.items()]
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        with self.lock:
+            self.db.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*values, job_id))
+
+    def append_event(
+        self, job_id: str, message: str, stage: str | None = None, percent: float | None = None,
+        job: dict | None = None,
+    ):
+        """Logs one event and updates the `job` fields (if any) in one transaction."""
+        now = time.time()
+        fields = {**(job or {}), "updated_at": now}
+        values = [json.dumps(v) if k in JSON_FIELDS else v for k, v in fields.items()]
+        assignments = ", ".join(f"{k} = ?" for k in fields)
+        with self.lock:
+            self.db.execute("BEGIN")
+            try:
+                self.db.execute(
+                    "INSERT INTO job_events (job_id, ts, stage, message, percent) VALUES (?, ?, ?, ?, ?)",
+                    (job_id, now, stage, message, percent),
+                )
+                self.db.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*values, job_id))
+            finally:
+                self.db.execute("COMMIT")
+
+    def events(self, job_id: str, after: int = 0, limit: int = 500) -> list[dict]:
+        """Events with seq > `after`, oldest first. Pass the last seq back as the next cursor."""
+        with self.lock:
+            rows = self.db.execute(
+                "SELECT seq, ts, stage, message, percent FROM job_events"
+                " WHERE job_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+                (job_id, after, limit),
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    # --- Batches (bulk ingest) ---
+    def create_batch(self, batch_id: str, label: str | None = None):
+        with self.lock:
+            self.db.execute("INSERT INTO batches VALUES (?, ?, ?)", (batch_id, label, time.time()))
+
+    def add_to_batch(self, batch_id: str, job_id: str, file: str, duplicate: bool):
+        with self.lock:
+            self.db.execute("INSERT INTO batch_jobs VALUES (?, ?, ?, ?)", (batch_id, job_id, file, int(duplicate)))
+
+    def batch(self, batch_id: str) -> dict | None:
+        """
+        One view over every job in the batch: counts per status, overall percent
+        (finished jobs count as 100), totals from the job stats and per-file rows.
+        """
+        with self.lock:
+            batch = self.db.execute("SELECT * FROM batches WHERE id = ?", (batch_id,)).fetchone()
+            rows = self.db.execute(
+                "SELECT b.file, b.duplicate, j.id, j.status, j.percent, j.stats, j.error, j.updated_at"
+                " FROM batch_jobs b JOIN jobs j ON j.id = b.job_id WHERE b.batch_id = ? ORDER BY b.rowid",
+                (batch_id,),
+            ).fetchall()
+        if batch is None:
+            return None
+
+        files, counts, chunks = [], {}, 0
+        for row in rows:
+            stats = json.loads(row["stats"]) if row["stats"] else {}
+            counts[row["status"]] = counts.get(row["status"], 0) + 1
+            if not row["duplicate"]:  # its chunks belong to the job that indexed it first
+                chunks += stats.get("chunks", 0)
+            files.append({
+                "file": row["file"],
+                "job_id": row["id"],
+                "status": row["status"],
+                "percent": 100.0 if row["status"] in TERMINAL_STATUSES else row["percent"],
+                "duplicate": bool(row["duplicate"]),
+                "error": row["error"],
+            })
+        finished = sum(counts.get(s, 0) for s in TERMINAL_STATUSES)
+        last_update = max((row["updated_at"] for row in rows), default=batch["created_at"])
+        return {
+            "batch_id": batch_id,
+            "label": batch["label"],
+            "total": len(files),
+            "duplicates": sum(f["duplicate"] for f in files),
+            "counts": counts,
+            "percent": round(sum(f["percent"] for f in files) / len(files), 1) if files else 100.0,
+            "done": finished == len(files),
+            "chunks": chunks,
+            "elapsed_s": round(last_update - batch["created_at"], 1),
+            "failed": [{"file": f["file"], "error": f["error"]} for f in files if f["status"] == "failed"],
+            "files": files,
+        }
+
+    def claim(self, worker_id: str, max_running: int, stale_after: float) -> dict | None:
+        """
+        Atomically hands the oldest queued job to `worker_id`,
+        unless `max_running` jobs are already processing (a global cap, whatever the pool count).
+        Jobs whose worker went silent for `stale_after` seconds go back to the queue first.
+        """
+        now = time.time()
+        with self.lock:
+            self.db.execute("BEGIN IMMEDIATE")
+            try:
+                self.db.execute(
+                    "UPDATE jobs SET status = 'queued', worker = NULL"
+                    " WHERE status = 'processing' AND updated_at < ?",
+                    (now - stale_after,),
+                )
+                running = self.db.execute("SELECT COUNT(*) FROM jobs WHERE status = 'processing'").fetchone()[0]
+                if running >= max_running:
+                    return None
+                row = self.db.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1"
+                ).fetchone()
+                if row is None:
+                    return None
+                self.db.execute(
+                    "UPDATE jobs SET status = 'processing', worker = ?, updated_at = ? WHERE id = ?",
+                    (worker_id, now, row["id"]),
+                )
+            finally:
+                self.db.execute("COMMIT")
+        return self.get(row["id"])
+
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        """Keeps a running job from looking stale; False once the job is no longer this worker's."""
+        with self.lock:
+            cursor = self.db.execute(
+                "UPDATE jobs SET updated_at = ? WHERE id = ? AND status = 'processing' AND worker = ?",
+                (time.time(), job_id, worker_id),
+            )
+        return cursor.rowcount > 0
+
+    def requeue_worker(self, worker_id: str) -> int:
+        """Puts the jobs of a worker that died back in the queue (without waiting for them to go stale)."""
+        with self.lock:
+            cursor = self.db.execute(
+                "UPDATE jobs SET status = 'queued', worker = NULL, updated_at = ?"
+                " WHERE status = 'processing' AND worker = ?",
+                (time.time(), worker_id),
+            )
+        return cursor.rowcount
+
+# --- Shared instance (one connection per process) ---
+_default_store = None
+
+def get_job_store() -> JobStore:
+    global _default_store
+    if _default_store is None:
+        _default_store = JobStore()
+    return _default_store
+
+def _reset_after_fork():
+    # SQLite connections must not cross a fork; the child reopens on first use
+    global _default_store
+    _default_store = None
+
+os.register_at_fork(after_in_child=_reset_after_fork)
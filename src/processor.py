@@ -1,57 +1,226 @@
 import os
+import threading
+import time
 from typing import Protocol
 from data_pipeline.ingest import PDFIngestor
 from data_pipeline.chunking import Chunker
 from data_pipeline.indexing import Indexer
+from data_pipeline.embedding_cache import get_embedding_cache, stats_diff
+from data_pipeline.pipeline import PipelineCancelled, ThreadedPipeline
+from data_pipeline.manifest import DocumentSync, file_fingerprint, get_manifest_store
+from data_pipeline.catalog import get_catalog
+from data_pipeline.facts import get_fact_store, record_facts
+from data_pipeline import metrics
+from config import PIPELINED, PIPELINE_QUEUE_SIZE, RETRY_BATCH_SIZE
 from collections import Counter
 from uuid import uuid4
 
 # --- Protocol Definition ---
 class PipelineObserver(Protocol):
     def on_start(self, filename: str): ...
-    def on_progress(self, stage: str, count: int, msg: str): ...
+    def on_progress(self, stage: str, count: int, msg: str, percent: float | None = None): ...
     def on_finish(self, filename: str, stats: dict): ...
     def on_error(self, error: str): ...
 
 # --- Default Observer ---
 class ConsoleObserver:
     def on_start(self, filename): print(f"🚀 Processing {filename}...")
-    def on_progress(self, stage, count, msg): print(f"[{stage}] {msg}")
+    def on_progress(self, stage, count, msg, percent=None):
+        print(f"[{stage}] {msg}" + (f" ({percent:.0f}%)" if percent is not None else ""))
     def on_finish(self, filename, stats): print(f"✅ Done! Stats: {stats}")
     def on_error(self, error): print(f"❌ Error: {error}")
 
 # --- The Logic ---
 class DocumentProcessor:
-    def run(self, file_path: str, observer: PipelineObserver = ConsoleObserver()):
+    def __init__(self, pipelined: bool = PIPELINED, queue_size: int = PIPELINE_QUEUE_SIZE):
+        self.pipelined = pipelined
+        self.queue_size = queue_size
+
+    def run(self, file_path: str, observer: PipelineObserver = ConsoleObserver(), source: str | None = None,
+            cancel: threading.Event | None = None):
+        """
+        `source` is the document's stable name (catalog.document_key; the file name when omitted).
+        Re-running the same source only indexes what changed since last time.
+        An interrupted run of the same file resumes from its last checkpoint.
+        Setting `cancel` stops the run at the next item, before anything is committed,
+        and without a final on_finish/on_error (whoever cancelled owns the outcome).
+        """
+        cancel = cancel or threading.Event()
+        started = time.perf_counter()
+        # One job per worker process, so these diffs are this job's (the counters are process-wide)
+        spans_before = metrics.span_totals()
+        cache_before = get_embedding_cache().stats()
         try:
             job_id = uuid4().hex
             filename = os.path.basename(file_path)
+            source = source or filename
             observer.on_start(filename)
+
+            # 0. Diff against what we indexed last time
+            sync = DocumentSync(get_manifest_store(), source, file_fingerprint(file_path))
+            if sync.is_unchanged_file():
+                metrics.INGEST_SECONDS.observe(time.perf_counter() - started, outcome="skipped")
+                observer.on_finish(filename, {"chunks": 0, "skipped": "unchanged"})
+                return
+
+            # Issuer, period and shard of this document (before any chunk is routed to it)
+            catalog = get_catalog()
+            catalog.register(source)
+
+            # A crashed/failed run of this same file: skip what it already committed
+            cursor = sync.resume()
+            if cursor:
+                observer.on_progress("RESUME", 0, f"Resuming from page {cursor['page']}")
             
             # 1. Setup the Lazy Streams (Pipes)
             ingestor = PDFIngestor()
-            page_stream = ingestor.extract(job_id, file_path)
-
-            counter = Counter(['INGESTION', 'CHUNKING', 'INDEXING'])
-            
             chunker = Chunker()
-            chunk_stream = chunker.process(self.observed_stream(page_stream, observer, counter, 'CHUNKING'), job_id)
+            counter = Counter()
+            progress = {}  # total_pages, learned from the first page
 
-            # 3. Pull the trigger (The Sink starts consuming)
-            indexer = Indexer()
-            indexer.index(self.observed_stream(chunk_stream, observer, counter, 'INDEXING'))
-            
-            observer.on_finish(filename, {"chunks": counter["INDEXING"]})
+            def checkpoint(batch, indexed, failed, error):
+                # Failed chunks go to the retry queue in the same transaction that moves the checkpoint
+                sync.checkpoint(batch[-1]["cursor"], indexed, failed, error)
+
+            indexer = Indexer(on_flush=checkpoint)
+
+            def pages(_=None):
+                first_page = cursor["page"] if cursor else 1
+                # Table line items go to the fact store as pages stream past (page by page, so resumable)
+                return sync.filter_pages(record_facts(
+                    ingestor.extract(job_id, file_path, source, first_page), get_fact_store(), source))
+
+            def chunks(page_stream):
+                return sync.filter_chunks(chunker.process(
+                    self.observed_stream(page_stream, observer, counter, 'CHUNKING', progress, cancel), job_id, cursor))
+
+            def index(chunk_stream):
+                indexer.index(self.observed_stream(chunk_stream, observer, counter, 'INDEXING', progress, cancel))
+
+            stats = {}
+            if self.pipelined:
+                # 2a. Every stage on its own thread: the parser keeps working while we wait on the network
+                pipeline = (
+                    ThreadedPipeline(queue_size=self.queue_size)
+                    .add_stage("INGESTION", pages)
+                    .add_stage("CHUNKING", chunks)
+                    .add_stage("INDEXING", index)
+                )
+                stage_stats = pipeline.run()
+                stats["stages"] = {name: s.as_dict() for name, s in stage_stats.items()}
+                for name, s in stage_stats.items():
+                    metrics.PIPELINE_STAGE_SECONDS.inc(s.busy, stage=name, state="busy")
+                    metrics.PIPELINE_STAGE_SECONDS.inc(s.wait_input, stage=name, state="idle_input")
+                    metrics.PIPELINE_STAGE_SECONDS.inc(s.wait_output, stage=name, state="idle_output")
+            else:
+                # 2b. Chained generators on this thread
+                # 3. Pull the trigger (The Sink starts consuming)
+                index(chunks(pages()))
+
+            if cancel.is_set():
+                raise PipelineCancelled("cancelled before commit")
+
+            # 4. Drop chunks that no longer exist, then remember this version
+            # (minus whatever still waits in the retry queue)
+            removed = sync.removed_ids()
+            indexer.delete(removed)
+            queued = get_manifest_store().pending_retries(source, sync.file_hash)
+            dead = get_manifest_store().pending_retries(source, sync.file_hash, dead=True)
+            sync.commit(queued, dead)
+            get_fact_store().prune(source, max(sync.pages, default=0))
+            catalog.set_chunks(source, sum(len(ids) for _, ids in sync.pages.values()) - len(queued) - len(dead))
+
+            elapsed = time.perf_counter() - started
+            metrics.INGEST_SECONDS.observe(elapsed, outcome="completed")
+            observer.on_finish(filename, {
+                "chunks": counter["INDEXING"],
+                "chunks_removed": len(removed),
+                "chunks_failed": len(indexer.failed_ids),
+                "chunks_queued_for_retry": len(queued),
+                "chunks_given_up": len(dead),  # out of retry attempts (python -m data_pipeline.manifest)
+                "resumed_from_page": cursor["page"] if cursor else None,
+                "pages_with_table_facts": len(get_fact_store().pages(source)),
+                **sync.stats,
+                "embedding_cache": stats_diff(cache_before, get_embedding_cache().stats()),
+                **stats,
+                # Where the time went (PDF parsing, splitting, embed calls, upserts), kept with the job
+                "timings": {
+                    "total_s": round(elapsed, 3),
+                    "spans": metrics.span_diff(spans_before, metrics.span_totals()),
+                },
+            })
             
+        except PipelineCancelled as e:
+            # What was indexed is checkpointed: the next owner of the job resumes from there
+            metrics.INGEST_SECONDS.observe(time.perf_counter() - started, outcome="cancelled")
+            print(f"🛑 Run of {source} cancelled: {e}")
         except Exception as e:
+            metrics.INGEST_SECONDS.observe(time.perf_counter() - started, outcome="failed")
             observer.on_error(str(e))
 
-    def observed_stream(self, stream, observer: PipelineObserver, counter: Counter, stage: str):
-        for item in stream:
-            counter[stage] += 1
-            if counter[stage] % 10 == 0:
-                observer.on_progress(stage, counter[stage], f"Processed {counter[stage]} items...")
-            yield item
+    def retry_failed(self, limit: int = RETRY_BATCH_SIZE) -> dict:
+        """
+        Indexes queued chunks whose backoff has passed; the PDFs are not needed.
+        A document with nothing left to retry counts as fully indexed again.
+        """
+        store = get_manifest_store()
+        documents = {}
+        for chunk, file_hash in store.claim_retries(limit):
+            documents.setdefault((chunk["source"], file_hash), []).append(chunk)
+
+        indexed = failed = 0
+        dead_before = len(store.dead_letters())
+        for (source, file_hash), chunks in documents.items():
+            indexer = Indexer(on_flush=self._requeue(store, file_hash))
+            indexer.index(iter(chunks))
+            ids_by_page = {}
+            for chunk in chunks:
+                if chunk["chunk_id"] not in indexer.failed_ids:
+                    ids_by_page.setdefault(chunk["page"], []).append(chunk["chunk_id"])
+            store.add_chunk_ids(source, ids_by_page)
+            if not store.pending_retries(source):
+                store.mark_complete(source, file_hash)
+            failed += len(indexer.failed_ids)
+            indexed += len(chunks) - len(indexer.failed_ids)
+        given_up = len(store.dead_letters()) - dead_before
+        if indexed or failed:
+            print(f"🔁 Retried {indexed + failed} chunks: {indexed} indexed, {failed} still failing"
+                  f" ({given_up} out of attempts)")
+        return {"indexed": indexed, "failed": failed, "given_up": given_up}
+
+    @staticmethod
+    def _requeue(store, file_hash):
+        def on_flush(batch, indexed, failed, error):
+            store.queue_retry(failed, file_hash, error)  # one more attempt, longer backoff
+            store.remove_retries([chunk["chunk_id"] for chunk in indexed])
+        return on_flush
+
+    def observed_stream(self, stream, observer: PipelineObserver, counter: Counter, stage: str, progress: dict,
+                        cancel: threading.Event | None = None):
+        """
+        Counts items and reports every 10th. Percent = page reached / total_pages:
+        pages carry `page_number` and `total_pages` (recorded from the first page), chunks carry `page`.
+        The items metric is bumped on that same every-10th branch, never per item.
+        Raises PipelineCancelled at the first item after `cancel` is set.
+        """
+        try:
+            for item in stream:
+                if cancel is not None and cancel.is_set():
+                    raise PipelineCancelled(f"cancelled during {stage}")
+                counter[stage] += 1
+                if "total_pages" not in progress and "total_pages" in item:
+                    # From the first page on: documents under 10 pages would never get a percent
+                    progress["total_pages"] = item["total_pages"]
+                if counter[stage] % 10 == 0:
+                    metrics.PIPELINE_ITEMS.inc(10, stage=stage)
+                    page = item.get("page_number", item.get("page"))
+                    total = progress.get("total_pages")
+                    # 100% is only reported by on_finish, once everything is flushed
+                    percent = min(99.0, 100.0 * page / total) if page and total else None
+                    observer.on_progress(stage, counter[stage], f"Processed {counter[stage]} items...", percent)
+                yield item
+        finally:
+            metrics.PIPELINE_ITEMS.inc(counter[stage] % 10, stage=stage)
 
 # --- Manual Test ---
 if __name__ == "__main__":
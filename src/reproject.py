@@ -0,0 +1,56 @@
+import argparse
+from config import EMBED_STORE_DIM
+from data_pipeline.vector_store import open_collection
+from data_pipeline.reduced_store import ReducedVectorStore, get_full_vector_store
+
+# --- Re-projection: fill a reduced-dimension collection from the vectors we already have ---
+# No embedding API calls: reduced vectors are prefixes of the full ones (see reduced_store.py).
+#   python reproject.py --dim 768                 # full collection -> "<name>_d768", full vectors kept aside
+#   python reproject.py --dim 256 --from-dim 768  # full vectors come from the side store
+# Then serve with EMBED_STORE_DIM=768 (and RERANK_FULL=1 to re-rank with the full vectors).
+# With SHARD_BY set, every shard is read ("<name>__<shard>") and written to its reduced twin
+# ("<name>_d768__<shard>"), routed through the catalog like an ingest.
+
+def reproject(dim: int, from_dim: int = 0, keep_full: bool = True, page_size: int = 1000) -> int:
+    """Copies every chunk into the `dim` collection; returns how many."""
+    source = open_collection(dim=from_dim)
+    full_store = get_full_vector_store()
+    # From a full collection the side store is filled on the way; from a reduced one it is the input
+    target = ReducedVectorStore(open_collection(dim=dim), dim, full_store if keep_full and not from_dim else None)
+
+    copied = 0
+    while True:
+        batch = source.get(limit=page_size, offset=copied, include=["embeddings", "documents", "metadatas"])
+        ids = list(batch["ids"])
+        if not ids:
+            return copied
+        if from_dim:
+            full = full_store.get(ids)
+            missing = [cid for cid in ids if cid not in full]
+            if missing:
+                raise SystemExit(
+                    f"❌ {len(missing)} chunks have no full vector (e.g. {missing[0]}); "
+                    "re-project from the full collection instead")
+            vectors = [full[cid] for cid in ids]
+        else:
+            vectors = batch["embeddings"]
+            if len(vectors) and len(vectors[0]) <= dim:
+                raise SystemExit(f"❌ Stored vectors have {len(vectors[0])} dims, nothing to reduce to {dim}")
+        target.upsert(ids=ids, embeddings=vectors, documents=batch["documents"], metadatas=batch["metadatas"])
+        copied += len(ids)
+        print(f"📐 {copied} chunks re-projected to {dim} dims", end="\r", flush=True)
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-project indexed vectors to a smaller stored size.")
+    parser.add_argument("--dim", type=int, default=EMBED_STORE_DIM, required=not EMBED_STORE_DIM)
+    parser.add_argument("--from-dim", type=int, default=0, help="read a reduced collection (needs the side store)")
+    parser.add_argument("--no-full", action="store_true", help="don't keep full vectors for re-ranking")
+    parser.add_argument("--page-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    copied = reproject(args.dim, args.from_dim, keep_full=not args.no_full, page_size=args.page_size)
+    print(f"\n✅ {copied} chunks in the {args.dim}-dim collection. Serve it with EMBED_STORE_DIM={args.dim}"
+          + ("" if args.no_full else " (RERANK_FULL=1 to re-rank)"))
+
+if __name__ == "__main__":
+    main()
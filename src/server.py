@@ -1,103 +1,320 @@
-import shutil
+import time
+_IMPORT_STARTED = time.perf_counter()  # import time is part of the startup budget (rag_startup_seconds)
+
 import uuid
 import os
+import hashlib
+import json
+import asyncio
 import uvicorn
 import aiofiles
-from fastapi import FastAPI, UploadFile, File, BackgroundTasks, HTTPException
+import zipfile
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Header, Request
+from fastapi.responses import StreamingResponse, PlainTextResponse, JSONResponse
 from pydantic import BaseModel
 
-# Import your Stateless Engine
-from processor import DocumentProcessor, PipelineObserver
-from data_pipeline.rag_agent import generate_answer, generate_answer_async
+from config import START_JOB_WORKERS, EVENTS_POLL_INTERVAL, EVENTS_HEARTBEAT, WARMUP, CHAT_BATCH_MAX, CHAT_BATCH_CONCURRENCY
+from jobs import get_job_store, TERMINAL_STATUSES
+from worker import WorkerPool
+from data_pipeline import metrics
+from data_pipeline.catalog import get_catalog, document_key
+from data_pipeline.scheduler import get_scheduler
+from data_pipeline.rag_agent import answer_question_async, stream_answer_async, answer_batch_async
+from warmup import warmup
+from bulk import BulkLimitExceeded, enqueue_all, upload_documents, upload_path
 
-# --- 1. Global State (The "In-Memory Database") ---
-# In production, this would be Redis or Postgres.
-# Structure: { "job_id": { "status": "processing", "log": [], "progress": 0 } }
-JOBS = {}
+metrics.STARTUP_SECONDS.set(time.perf_counter() - _IMPORT_STARTED, phase="import")
 
-# --- 2. The Bridge (Web Observer) ---
-# This class translates Pipeline events into Dictionary updates that the API can read.
-class WebObserver:
-    def __init__(self, job_id):
-        self.job_id = job_id
-    
-    def on_start(self, filename):
-        JOBS[self.job_id]["status"] = "processing"
-        JOBS[self.job_id]["file"] = filename
-        JOBS[self.job_id]["log"].append(f"Started processing {filename}")
-        
-    def on_progress(self, stage, count, msg):
-        # Update progress so the UI bar moves
-        JOBS[self.job_id]["progress"] = count
-        JOBS[self.job_id]["log"].append(f"[{stage}] {msg}")
-            
-    def on_finish(self, filename, stats):
-        JOBS[self.job_id]["status"] = "completed"
-        JOBS[self.job_id]["stats"] = stats
-        JOBS[self.job_id]["progress"] = 100
-        JOBS[self.job_id]["log"].append("Done!")
-            
-    def on_error(self, error):
-        JOBS[self.job_id]["status"] = "failed"
-        JOBS[self.job_id]["error"] = str(error)
-
-# --- 3. The Background Task ---
-# This runs in a separate thread pool, keeping the API responsive.
-def run_pipeline_task(job_id: str, file_path: str):
-    observer = WebObserver(job_id)
-    processor = DocumentProcessor()
-    # The processor blocks THIS thread, but not the main Server thread.
-    processor.run(file_path, observer)
-
-# --- 4. The API Routes ---
-app = FastAPI(title="Deep Research API")
+# --- 1. Job State (The Persistent Job Store) ---
+# Jobs live in SQLite (jobs.py), so any API worker can answer /status
+# and nothing is lost on restart. Ingestion itself runs in worker.py processes.
+
+# --- 2. The Worker Pool ---
+# Runs in separate processes with a global concurrency cap, keeping the API responsive.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    pool = WorkerPool() if START_JOB_WORKERS else None
+    if pool:
+        pool.start()
+
+    # Accept connections right away (/healthz); warm up in the background and flip /readyz when done
+    app.state.ready = not WARMUP
+    app.state.warmup = {}
+    app.state.warmup_error = None
+
+    async def warm():
+        try:
+            app.state.warmup = await asyncio.to_thread(warmup)
+            app.state.ready = True
+            metrics.STARTUP_SECONDS.set(time.perf_counter() - _IMPORT_STARTED, phase="ready")
+        except Exception as e:
+            app.state.warmup_error = str(e)
+            print(f"❌ Warmup failed: {e}")
+
+    warm_task = asyncio.create_task(warm()) if WARMUP else None
+    yield
+    if warm_task:
+        warm_task.cancel()
+    if pool:
+        pool.stop()
+
+# --- 3. The API Routes ---
+app = FastAPI(title="Deep Research API", lifespan=lifespan)
 
 class ChatRequest(BaseModel):
     question: str
+    source: str | None = None  # optional: only search this document
+    page: int | None = None    # optional: only search this page
+    issuer: str | None = None  # optional: only this issuer's filings (e.g. "tsla")
+    period: str | None = None  # optional: only this fiscal period (e.g. "20241231")
+
+class BatchChatRequest(BaseModel):
+    questions: list[str]
+    source: str | None = None
+    page: int | None = None
+    issuer: str | None = None
+    period: str | None = None
+    concurrency: int | None = None  # answers generated at once (default CHAT_BATCH_CONCURRENCY)
 
 @app.post("/ingest")
-async def ingest_document(
-    background_tasks: BackgroundTasks, 
-    file: UploadFile = File(...)
-):
+async def ingest_document(file: UploadFile = File(...), document_id: str | None = Form(default=None)):
     """
     Async Ingestion:
-    1. Save file to disk.
-    2. Register background task.
+    1. Save file to disk (hashing it as it streams in).
+    2. Queue a job, unless this exact file is already queued/processed.
     3. Return Job ID immediately.
+    The document is indexed under `document_id` when given (send the same id with a
+    new version to update it incrementally), else under catalog.document_key's name.
     """
     job_id = str(uuid.uuid4())
     
-    # Initialize Job State
-    JOBS[job_id] = {"status": "queued", "log": [], "progress": 0}
-    
     # Save Uploaded File
-    file_location = f"data_pipeline/temp_{job_id}.pdf"
+    file_location = upload_path(job_id)
+    digest = hashlib.sha256()
     try:
         # Open the destination file asynchronously
         async with aiofiles.open(file_location, 'wb') as out_file:
             # Read 1MB chunks from the uploaded file (which is async)
             while content := await file.read(1024 * 1024): 
+                digest.update(content)
                 await out_file.write(content)  # Write async
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"File save failed: {e}")
 
-    # Handoff to Background Worker
-    background_tasks.add_task(run_pipeline_task, job_id, file_location)
+    # Handoff to the Worker Pool (through the job store)
+    filename = os.path.basename(file.filename or "upload.pdf")
+    source = document_key(filename, digest.hexdigest(), document_id)
+    # The job store is sync SQLite: every call goes through a thread, never on the loop
+    store = get_job_store()
+    job_id, created = await asyncio.to_thread(
+        store.create, job_id, file_location, source, digest.hexdigest(), file=filename)
+    if not created:
+        os.remove(file_location)
+        job = await asyncio.to_thread(store.get, job_id)
+        return {"job_id": job_id, "status": job["status"], "source": job["source"], "duplicate": True}
     
-    return {"job_id": job_id, "status": "queued"}
+    return {"job_id": job_id, "status": "queued", "source": source}
+
+@app.post("/ingest/bulk")
+async def ingest_bulk(files: list[UploadFile] = File(...), key_by_path: bool = Form(default=False)):
+    """
+    Many PDFs at once: any mix of PDFs and zips of PDFs.
+    Each document becomes a job (duplicates point at the existing one), all under one batch.
+    With `key_by_path` each is indexed under its upload path ("filings.zip/tsla/10-K.pdf"),
+    so uploading a new version at the same path updates it incrementally.
+    Follow the whole batch with GET /batches/{batch_id}.
+    """
+    batch_id = str(uuid.uuid4())
+    skipped = [f.filename for f in files if not (f.filename or "").lower().endswith((".pdf", ".zip"))]
+
+    def enqueue():
+        # Zip directories are read (and the count checked) before anything is saved or queued
+        documents = upload_documents([(upload.filename or "", upload.file) for upload in files])
+        return enqueue_all(get_job_store(), batch_id, documents, "upload", key_by_path=key_by_path)
+
+    try:
+        # Blocking file/zip IO: off the event loop
+        jobs = await asyncio.to_thread(enqueue)
+    except (zipfile.BadZipFile, BulkLimitExceeded) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    duplicates = sum(j["duplicate"] for j in jobs)
+    return {
+        "batch_id": batch_id,
+        "queued": len(jobs) - duplicates,
+        "duplicates": duplicates,
+        "skipped": skipped,
+        "jobs": jobs,
+    }
+
+@app.get("/batches/{batch_id}")
+async def get_batch(batch_id: str):
+    """Aggregated progress of a bulk ingest: counts per status, overall percent, per-file rows."""
+    batch = await asyncio.to_thread(get_job_store().batch, batch_id)
+    if batch is None:
+        raise HTTPException(status_code=404, detail="Batch not found")
+    return batch
 
 @app.get("/status/{job_id}")
 async def get_status(job_id: str):
-    """Client polls this endpoint to check progress."""
-    if job_id not in JOBS:
+    """Job summary: status, percent, latest log line and the log cursor."""
+    job = await asyncio.to_thread(get_job_store().get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+@app.get("/status/{job_id}/log")
+async def get_log(job_id: str, after: int = 0, limit: int = 100):
+    """Cursor-based log for polling clients: pass back `cursor` as `after` to get only new lines."""
+    store = get_job_store()
+    job = await asyncio.to_thread(store.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    events = await asyncio.to_thread(store.events, job_id, after=after, limit=min(limit, 500))
+    return {
+        "status": job["status"],
+        "percent": job["percent"],
+        "events": events,
+        "cursor": events[-1]["seq"] if events else after,
+    }
+
+@app.get("/status/{job_id}/events")
+async def stream_status(job_id: str, request: Request, last_event_id: int | None = Header(default=None)):
+    """
+    Server-Sent Events: pushes each new observer event once, then an `end` event
+    with the final job record. Reconnecting clients resume via Last-Event-ID.
+    """
+    store = get_job_store()
+    if await asyncio.to_thread(store.get, job_id) is None:
         raise HTTPException(status_code=404, detail="Job not found")
-    return JOBS[job_id]
+
+    def read(cursor: int) -> tuple[dict, list]:
+        # Status *before* events: a job that is finished here has no events left to miss
+        return store.get(job_id), store.events(job_id, after=cursor)
+
+    async def event_stream():
+        cursor = last_event_id or 0
+        last_sent = time.monotonic()
+        while not await request.is_disconnected():
+            # One poll per client per interval: a sync SQLite read, so in a thread
+            job, events = await asyncio.to_thread(read, cursor)
+            for event in events:
+                cursor = event["seq"]
+                yield f"id: {cursor}\nevent: progress\ndata: {json.dumps(event)}\n\n"
+            if events:
+                last_sent = time.monotonic()
+            elif job["status"] in TERMINAL_STATUSES:
+                yield f"event: end\ndata: {json.dumps(job)}\n\n"
+                return
+            elif time.monotonic() - last_sent > EVENTS_HEARTBEAT:
+                yield ": keep-alive\n\n"
+                last_sent = time.monotonic()
+            await asyncio.sleep(EVENTS_POLL_INTERVAL)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and the event loop responds. Never touches the stores."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    """Readiness: 200 once warmup has opened the client and stores, 503 before (or if it failed)."""
+    if app.state.ready:
+        return {"status": "ready", "warmup": app.state.warmup}
+    status = "failed" if app.state.warmup_error else "warming_up"
+    return JSONResponse({"status": status, "error": app.state.warmup_error}, status_code=503)
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text format: this process's query spans plus the ingest workers' last dumps."""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/catalog")
+async def catalog():
+    """Shards with their document/chunk counts, issuers and periods (what /chat scopes can name)."""
+    return {"shards": await asyncio.to_thread(get_catalog().summary)}
+
+@app.get("/scheduler")
+async def scheduler():
+    """Gemini quota: this process's queued calls per class, each model's shared bucket and who waits for it."""
+    return await asyncio.to_thread(get_scheduler().stats)
 
 @app.post("/chat")
 async def chat(request: ChatRequest):
-    """Simple wrapper for RAG Agent."""
-    return {"answer": await generate_answer_async(request.question)}
+    """Simple wrapper for RAG Agent: {"answer", "sources", "cached", "exact"} (exact = from a financial table)."""
+    return await answer_question_async(request.question, request.source, request.page, request.issuer, request.period)
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest, http_request: Request):
+    """
+    Token streaming (NDJSON, one event per line):
+    sources first, then tokens as Gemini produces them, then timings.
+    If the client disconnects, the generation is cancelled.
+    """
+    async def event_stream():
+        events = stream_answer_async(request.question, request.source, request.page, request.issuer, request.period)
+        try:
+            async for event in events:
+                if await http_request.is_disconnected():
+                    print("🔌 Client left, cancelling generation")
+                    break
+                yield json.dumps(event) + "\n"
+        except Exception as e:
+            yield json.dumps({"type": "error", "error": str(e)}) + "\n"
+        finally:
+            await events.aclose()
+
+    return StreamingResponse(event_stream(), media_type="application/x-ndjson")
+
+@app.post("/chat/batch")
+async def chat_batch(request: BatchChatRequest, http_request: Request):
+    """
+    Many questions in one request (NDJSON, one line per question, in completion order):
+      {"type": "answer", "index", "question", "answer", "sources", "cached", "exact"}
+      {"type": "error", "index", "question", "error"}   - only that question failed
+    then {"type": "done", "answered", "failed", "total_ms"}.
+    """
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="No questions")
+    if len(request.questions) > CHAT_BATCH_MAX:
+        raise HTTPException(status_code=400, detail=f"More than {CHAT_BATCH_MAX} questions in one batch")
+    concurrency = min(request.concurrency or CHAT_BATCH_CONCURRENCY, CHAT_BATCH_CONCURRENCY)
+
+    async def result_stream():
+        started = time.perf_counter()
+        answered = failed = 0
+        results = answer_batch_async(
+            request.questions, request.source, request.page, concurrency, request.issuer, request.period)
+        try:
+            async for result in results:
+                if await http_request.is_disconnected():
+                    print("🔌 Client left, cancelling the batch")
+                    return
+                if "error" in result:
+                    failed += 1
+                    yield json.dumps({"type": "error", **result}) + "\n"
+                else:
+                    answered += 1
+                    yield json.dumps({"type": "answer", **result}) + "\n"
+        except Exception as e:
+            # Embedding or the shared vector query failed: no question can be answered
+            failed = len(request.questions) - answered
+            yield json.dumps({"type": "error", "error": str(e)}) + "\n"
+        finally:
+            await results.aclose()
+        yield json.dumps({
+            "type": "done", "answered": answered, "failed": failed,
+            "total_ms": round((time.perf_counter() - started) * 1000, 1),
+        }) + "\n"
+
+    return StreamingResponse(result_stream(), media_type="application/x-ndjson")
 
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
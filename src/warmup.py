@@ -0,0 +1,46 @@
+import time
+from config import get_client, WARMUP_EMBED
+from data_pipeline import metrics
+
+# --- Warmup ---
+# Everything is created lazily, so the first request would otherwise pay for
+# the client, the stores and the thread pools. The API runs this in the
+# background right after startup and only reports ready (/readyz) once it's done.
+
+def _steps(embed: bool):
+    from jobs import get_job_store
+    from data_pipeline.vector_store import get_vector_store
+    from data_pipeline.lexical import get_lexical_index
+    from data_pipeline.embedding_cache import get_embedding_cache
+    from data_pipeline.answer_cache import get_answer_cache
+    from data_pipeline.query_batcher import get_query_batcher, get_chroma_executor
+    from data_pipeline.embedding import get_default_engine
+    from data_pipeline.scheduler import INTERACTIVE, get_scheduler
+    from data_pipeline.chunking import load_tokenizer
+
+    yield "client", get_client
+    yield "vector_store", lambda: get_vector_store().count()
+    yield "lexical_index", get_lexical_index
+    yield "embedding_cache", get_embedding_cache
+    yield "answer_cache", get_answer_cache
+    yield "job_store", get_job_store
+    yield "query_path", lambda: (get_query_batcher(), get_chroma_executor())
+    yield "scheduler", get_scheduler
+    yield "tokenizer", load_tokenizer
+    if embed:
+        # One real round trip (then cached): TLS + auth done before the first user question
+        yield "embed", lambda: get_default_engine().embed(["warmup"], priority=INTERACTIVE)
+
+def warmup(embed: bool = WARMUP_EMBED) -> dict:
+    """Runs every step in order; returns {step: seconds} and records them as startup gauges."""
+    timings = {}
+    for name, step in _steps(embed):
+        start = time.perf_counter()
+        step()
+        timings[name] = round(time.perf_counter() - start, 4)
+        metrics.STARTUP_SECONDS.set(timings[name], phase=f"warmup_{name}")
+        print(f"🔥 Warmed up {name} in {timings[name] * 1000:.0f} ms")
+    return timings
+
+if __name__ == "__main__":
+    print(warmup())
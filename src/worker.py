@@ -0,0 +1,215 @@
+import atexit
+import multiprocessing
+import os
+import signal
+import threading
+import time
+from contextlib import contextmanager
+from config import (
+    JOB_WORKERS, JOB_MAX_CONCURRENT, JOB_POLL_INTERVAL, JOB_STALE_AFTER, JOB_HEARTBEAT_INTERVAL, RETRY_POLL_INTERVAL,
+)
+from jobs import JobStore, get_job_store, TERMINAL_STATUSES
+from data_pipeline import metrics
+
+# --- 1. The Bridge (Job Observer) ---
+# Translates Pipeline events into job-store updates that any API worker can read.
+class JobObserver:
+    """
+    `lost` (set by heartbeat()) means the job was requeued or claimed by another
+    worker: from then on this run writes nothing, the row is the new owner's.
+    """
+    def __init__(self, job_id, store: JobStore, lost: threading.Event | None = None):
+        self.job_id = job_id
+        self.store = store
+        self.lost = lost or threading.Event()
+
+    def on_start(self, filename):
+        # `file` keeps the uploaded name: `filename` here is the temp copy's
+        self.store.append_event(self.job_id, f"Started processing {filename}", job={"status": "processing"})
+
+    def on_progress(self, stage, count, msg, percent=None):
+        # Update progress so the UI bar moves (also acts as the worker heartbeat).
+        # The job is only as far along as what has reached the index.
+        if self.lost.is_set():
+            return
+        job_fields = {"progress": count}
+        if stage == "INDEXING" and percent is not None:
+            job_fields["percent"] = percent
+        self.store.append_event(self.job_id, f"[{stage}] {msg}", stage=stage, percent=percent, job=job_fields)
+
+    def on_finish(self, filename, stats):
+        if self.lost.is_set():
+            return
+        self.store.append_event(
+            self.job_id, "Done!", percent=100, job={"status": "completed", "stats": stats, "percent": 100})
+
+    def on_error(self, error):
+        if self.lost.is_set():
+            return
+        self.store.append_event(
+            self.job_id, f"Failed: {error}", job={"status": "failed", "error": str(error)})
+
+# --- 2. The Worker Loop ---
+@contextmanager
+def heartbeat(store: JobStore, job_id: str, worker_id: str, interval: float = JOB_HEARTBEAT_INTERVAL):
+    """
+    Touches the job every `interval` seconds while it runs, so a slow job (a long
+    embed backoff, a huge page) is never mistaken for a dead worker's and run twice.
+    Yields an event that is set if the job stopped being this worker's anyway
+    (requeued as stale after a stall, then claimed elsewhere): the run must stop.
+    """
+    done, lost = threading.Event(), threading.Event()
+
+    def beat():
+        while not done.wait(interval):
+            if not store.heartbeat(job_id, worker_id):
+                print(f"🛑 Job {job_id} is no longer worker {worker_id}'s, cancelling this run")
+                lost.set()
+                return
+
+    thread = threading.Thread(target=beat, name=f"heartbeat-{job_id}", daemon=True)
+    thread.start()
+    try:
+        yield lost
+    finally:
+        done.set()
+        thread.join()
+
+def run_worker(worker_id: str, stop_event=None, max_concurrent: int = JOB_MAX_CONCURRENT):
+    """Claims queued jobs one at a time until `stop_event` is set."""
+    # Imported here so the parent (API) process doesn't pay for the pipeline imports
+    from processor import DocumentProcessor
+    from data_pipeline.chunking import load_tokenizer
+
+    load_tokenizer(download=False)  # WorkerPool.start fetched it: never download mid-ingest
+    store = get_job_store()
+    processor = DocumentProcessor()
+    print(f"👷 Worker {worker_id} ready")
+    last_retry = 0.0
+
+    while not (stop_event and stop_event.is_set()):
+        job = store.claim(worker_id, max_concurrent, JOB_STALE_AFTER)
+        if job is None:
+            # Idle: work off chunks that failed to index earlier
+            if time.monotonic() - last_retry >= RETRY_POLL_INTERVAL:
+                last_retry = time.monotonic()
+                try:
+                    processor.retry_failed()
+                except Exception as e:
+                    print(f"❌ Retry pass failed: {e}")
+            time.sleep(JOB_POLL_INTERVAL)
+            continue
+
+        with heartbeat(store, job["id"], worker_id) as lost:
+            processor.run(job["file_path"], JobObserver(job["id"], store, lost), source=job["source"], cancel=lost)
+        metrics.dump()  # the API's /metrics reads this process's spans from disk
+        # Indexed or failed, the temp copy is no longer needed (a re-upload brings its own, and
+        # resumes from the checkpoint). A job requeued meanwhile still needs it.
+        if store.get(job["id"])["status"] in TERMINAL_STATUSES and os.path.exists(job["file_path"]):
+            os.remove(job["file_path"])
+
+def _worker_main(worker_id: str, stop_event, max_concurrent: int):
+    # Ctrl+C goes to the whole process group; let the parent coordinate shutdown
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    run_worker(worker_id, stop_event, max_concurrent)
+
+# --- 3. The Pool ---
+RESPAWN_CHECK_INTERVAL = 2.0  # seconds between liveness checks of the worker processes
+RESPAWN_LIMIT = 3              # a slot whose worker dies this often within RESPAWN_WINDOW is given up
+RESPAWN_WINDOW = 60.0
+
+class WorkerPool:
+    """
+    N ingest worker processes, separate from the API's event loop and thread pool.
+    Uses 'spawn' so children never inherit the parent's sqlite/gRPC handles.
+    Workers are not daemonic, so they may start their own processes (INGEST_WORKERS > 1);
+    stop() ends them. A worker that dies is replaced and its job requeued at once.
+    """
+    def __init__(self, size: int = JOB_WORKERS, max_concurrent: int = JOB_MAX_CONCURRENT):
+        self.size = size
+        self.max_concurrent = max_concurrent
+        self.ctx = multiprocessing.get_context("spawn")
+        self.stop_event = self.ctx.Event()
+        self.lock = threading.Lock()
+        self.processes = []
+        self.worker_ids = []
+        self.spawned = 0
+        self.deaths = []  # per slot: when its workers died (crash-loop guard)
+        self.supervisor = None
+
+    def _spawn(self) -> tuple[str, multiprocessing.Process]:
+        worker_id = f"{os.getpid()}-{self.spawned}"
+        self.spawned += 1
+        process = self.ctx.Process(
+            target=_worker_main, args=(worker_id, self.stop_event, self.max_concurrent), name=f"worker-{worker_id}")
+        process.start()
+        return worker_id, process
+
+    def start(self):
+        from data_pipeline.chunking import load_tokenizer
+
+        metrics.remove_stale_dumps()
+        load_tokenizer()  # downloads the vocabulary once, here, for every worker to read
+        with self.lock:
+            for _ in range(self.size):
+                worker_id, process = self._spawn()
+                self.worker_ids.append(worker_id)
+                self.processes.append(process)
+                self.deaths.append([])
+        # Non-daemonic children are joined at interpreter exit: make sure they were told to stop
+        atexit.register(self.stop)
+        self.supervisor = threading.Thread(target=self._supervise, name="worker-supervisor", daemon=True)
+        self.supervisor.start()
+
+    def _supervise(self):
+        while not self.stop_event.wait(RESPAWN_CHECK_INTERVAL):
+            with self.lock:
+                if self.stop_event.is_set():
+                    return
+                for i, process in enumerate(self.processes):
+                    if process.is_alive() or self.worker_ids[i] is None:
+                        continue
+                    requeued = get_job_store().requeue_worker(self.worker_ids[i])
+                    now = time.monotonic()
+                    self.deaths[i] = [t for t in self.deaths[i] if now - t < RESPAWN_WINDOW] + [now]
+                    if len(self.deaths[i]) > RESPAWN_LIMIT:
+                        print(f"❌ Worker {self.worker_ids[i]} keeps exiting (code {process.exitcode}); not restarting it")
+                        self.worker_ids[i] = None
+                        continue
+                    print(f"⚠️ Worker {self.worker_ids[i]} exited (code {process.exitcode}),"
+                          f" {requeued} job(s) requeued; restarting it")
+                    self.worker_ids[i], self.processes[i] = self._spawn()
+
+    def alive(self) -> bool:
+        """Whether any worker is still running (or about to be restarted)."""
+        with self.lock:
+            return any(worker_id is not None for worker_id in self.worker_ids)
+
+    def stop(self, timeout: float = 10):
+        self.stop_event.set()
+        atexit.unregister(self.stop)
+        if self.supervisor is not None:
+            self.supervisor.join()
+            self.supervisor = None
+        with self.lock:
+            deadline = time.monotonic() + timeout
+            for process in self.processes:
+                process.join(max(0.0, deadline - time.monotonic()))
+            for worker_id, process in zip(self.worker_ids, self.processes):
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+                    get_job_store().requeue_worker(worker_id)  # cut off mid-job: the next start picks it up
+            self.processes, self.worker_ids, self.deaths = [], [], []
+
+# --- Standalone: `python worker.py` (pair with START_JOB_WORKERS=0 on the API) ---
+if __name__ == "__main__":
+    pool = WorkerPool()
+    pool.start()
+    try:
+        while pool.alive():
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pool.stop()
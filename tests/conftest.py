@@ -0,0 +1,5 @@
+import os
+import tempfile
+
+# Stores default to STATE_DIR: point it at a throwaway dir before `config` is imported
+os.environ["STATE_DIR"] = tempfile.mkdtemp(prefix="tests_state_")
@@ -0,0 +1,34 @@
+from data_pipeline.answer_cache import AnswerCache
+from data_pipeline.collection_version import bump_collection_version, collection_version
+
+QUESTION = [1.0, 0.0, 0.0]
+
+def test_hit_under_the_same_scope_only():
+    cache = AnswerCache(threshold=0.9, version_fn=lambda: 1)
+    cache.store("Net income?", QUESTION, "93.7B", [], scope=("aapl",), version=1)
+    assert cache.lookup([0.99, 0.1, 0.0], scope=("aapl",))[0].answer == "93.7B"
+    assert cache.lookup(QUESTION, scope=("tsla",))[0] is None
+
+def test_new_version_drops_cached_answers():
+    version = [1]
+    cache = AnswerCache(threshold=0.9, version_fn=lambda: version[0])
+    cache.store("Net income?", QUESTION, "93.7B", [], version=1)
+    version[0] = 2
+    hit, seen = cache.lookup(QUESTION)
+    assert hit is None and seen == 2
+    assert cache.counts["invalidations"] == 1
+
+def test_answer_from_before_an_ingest_is_not_stored():
+    version = [1]
+    cache = AnswerCache(threshold=0.9, version_fn=lambda: version[0])
+    _, seen = cache.lookup(QUESTION)
+    version[0] = 2  # an ingest committed while the answer was generated
+    cache.store("Net income?", QUESTION, "stale", [], version=seen)
+    assert cache.counts["stale_stores"] == 1
+    assert cache.lookup(QUESTION)[0] is None
+
+def test_collection_version_counts_every_bump(tmp_path):
+    path = tmp_path / "collection.version"
+    assert collection_version(path) == 0
+    assert [bump_collection_version(path) for _ in range(3)] == [1, 2, 3]
+    assert collection_version(path) == 3
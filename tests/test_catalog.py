@@ -0,0 +1,29 @@
+from data_pipeline.catalog import merge_results, sources_in
+
+def part(*hits, queries: int = 1) -> dict:
+    """One shard's query result: the same (id, distance) hits for every query."""
+    return {
+        "ids": [[cid for cid, _ in hits] for _ in range(queries)],
+        "documents": [[f"text {cid}" for cid, _ in hits] for _ in range(queries)],
+        "metadatas": [[{"source": cid[0]} for cid, _ in hits] for _ in range(queries)],
+        "distances": [[distance for _, distance in hits] for _ in range(queries)],
+    }
+
+def test_merge_keeps_the_nearest_hits_across_shards():
+    merged = merge_results([part(("a1", 0.1), ("a2", 0.4)), part(("b1", 0.2), ("b2", 0.3))], 1, 3)
+    assert merged["ids"] == [["a1", "b1", "b2"]]
+    assert merged["distances"] == [[0.1, 0.2, 0.3]]
+    assert merged["documents"] == [["text a1", "text b1", "text b2"]]
+    assert merged["metadatas"] == [[{"source": "a"}, {"source": "b"}, {"source": "b"}]]
+
+def test_merge_is_per_query_and_tolerates_empty_shards():
+    empty = {"ids": [[], []], "documents": [[], []], "metadatas": [[], []], "distances": [[], []]}
+    merged = merge_results([part(("a1", 0.5), queries=2), empty, part(("b1", 0.2), queries=2)], 2, 5)
+    assert merged["ids"] == [["b1", "a1"], ["b1", "a1"]]
+
+def test_sources_in():
+    assert sources_in(None) is None
+    assert sources_in({"page": 3}) is None
+    assert sources_in({"source": "a.pdf"}) == ["a.pdf"]
+    assert sources_in({"source": {"$in": ["a.pdf", "b.pdf"]}}) == ["a.pdf", "b.pdf"]
+    assert sources_in({"$and": [{"page": 3}, {"source": "a.pdf"}]}) == ["a.pdf"]
@@ -0,0 +1,38 @@
+import pytest
+
+pytest.importorskip("langchain_text_splitters")
+from data_pipeline.chunking import Chunker
+
+def pages(count: int = 12) -> list[dict]:
+    result = []
+    for n in range(1, count + 1):
+        sentences = [f"Revenue on page {n} line {i} grew {n * i}% over the prior fiscal year." for i in range(14)]
+        text = " ".join(sentences[:7]) + "\n\n" + " ".join(sentences[7:])
+        if n % 3 == 0:
+            text += " The sentence that runs on"  # continues on the next page
+        if n % 3 == 1 and n > 1:
+            text = "across the page break ends here. " + text
+        result.append({"source": "report.pdf", "page_number": n, "content": text})
+    return result
+
+@pytest.mark.parametrize("anchor_pages", [0, 1, 4])
+@pytest.mark.parametrize("overlap", [0, 30])
+def test_resume_from_any_cursor_gives_the_same_chunks(anchor_pages, overlap):
+    chunker = Chunker(chunk_tokens=120, overlap_tokens=overlap, anchor_pages=anchor_pages)
+    document = pages()
+    full = list(chunker.process(iter(document), "job"))
+    assert len(full) > 5
+    for k, chunk in enumerate(full[:-1]):
+        cursor = chunk["cursor"]
+        rest = chunker.process(iter(document[cursor["page"] - 1:]), "job", cursor)
+        assert [c["chunk_id"] for c in rest] == [c["chunk_id"] for c in full[k + 1:]]
+
+def test_edit_only_changes_chunks_of_its_page_group():
+    chunker = Chunker(chunk_tokens=120, overlap_tokens=30, anchor_pages=4)
+    document = pages()
+    edited = [dict(page) for page in document]
+    edited[1]["content"] = "A new sentence was added. " + edited[1]["content"]
+    before = {c["chunk_id"]: c for c in chunker.process(iter(document), "job")}
+    after = list(chunker.process(iter(edited), "job"))
+    changed = [c for c in after if c["chunk_id"] not in before]
+    assert changed and all(c["start_page"] <= 4 for c in changed)
@@ -0,0 +1,88 @@
+import threading
+import pytest
+from benchmarks.fakes import FakeGenAIClient, FakeRateLimitError, fake_vector
+from data_pipeline.embedding import EmbeddingEngine
+from data_pipeline.metrics import EMBED_TEXTS
+from data_pipeline.scheduler import BULK, INTERACTIVE, GeminiScheduler, SharedBuckets
+
+class ServerError(Exception):
+    code = 503
+
+class RecordingClient:
+    """The fake Gemini client, recording batch sizes and calls in flight; fails the first calls with `errors`."""
+    def __init__(self, errors=(), latency: float = 0.0):
+        self.fake = FakeGenAIClient(embed_latency=latency)
+        self.errors = list(errors)
+        self.batches = []
+        self.in_flight = self.max_in_flight = 0
+        self.lock = threading.Lock()
+        self.models = self
+
+    def embed_content(self, model, contents, **kwargs):
+        with self.lock:
+            self.batches.append(len(contents))
+            if self.errors:
+                raise self.errors.pop(0)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            return self.fake.models.embed_content(model, contents, **kwargs)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+@pytest.fixture
+def scheduler(tmp_path):
+    return GeminiScheduler(SharedBuckets(tmp_path / "scheduler.sqlite"), limits={}, default_rpm=0)
+
+def engine(client, scheduler, **kwargs) -> EmbeddingEngine:
+    sleeps = []
+    kwargs = {"batch_size": 4, "concurrency": 2, "backoff_base": 0.25, **kwargs}
+    engine = EmbeddingEngine(client=client, scheduler=scheduler, sleep=sleeps.append, **kwargs)
+    engine.sleeps = sleeps
+    return engine
+
+TEXTS = [f"revenue line {i}" for i in range(10)]
+
+def test_batches_of_batch_size_in_input_order(scheduler):
+    client = RecordingClient()
+    vectors = engine(client, scheduler).embed(TEXTS)
+    assert client.batches == [4, 4, 2]
+    assert vectors == [fake_vector(text) for text in TEXTS]
+
+def test_at_most_concurrency_calls_in_flight(scheduler):
+    client = RecordingClient(latency=0.05)
+    vectors = engine(client, scheduler, batch_size=1, concurrency=3).embed(TEXTS)
+    assert client.max_in_flight == 3
+    assert vectors == [fake_vector(text) for text in TEXTS]
+
+@pytest.mark.parametrize("error", [FakeRateLimitError("429 RESOURCE_EXHAUSTED"), ServerError("503 UNAVAILABLE")])
+def test_rate_limited_calls_retry_with_backoff(scheduler, error):
+    client = RecordingClient(errors=[error, error])
+    embedder = engine(client, scheduler, max_retries=3)
+    assert embedder.embed(TEXTS[:2]) == [fake_vector(text) for text in TEXTS[:2]]
+    assert len(client.batches) == 3
+    # Exponential with jitter: base * 2^attempt, scaled into [0.5, 1)
+    first, second = embedder.sleeps
+    assert 0.125 <= first <= 0.25 and 0.25 <= second <= 0.5
+
+def test_gives_up_after_max_retries(scheduler):
+    client = RecordingClient(errors=[FakeRateLimitError("429")] * 3)
+    with pytest.raises(FakeRateLimitError):
+        engine(client, scheduler, max_retries=2).embed(TEXTS[:2])
+    assert len(client.batches) == 3
+
+def test_other_errors_are_not_retried(scheduler):
+    client = RecordingClient(errors=[ValueError("bad request")])
+    embedder = engine(client, scheduler)
+    with pytest.raises(ValueError):
+        embedder.embed(TEXTS[:2])
+    assert len(client.batches) == 1 and not embedder.sleeps
+
+def test_metrics_split_ingest_from_query_calls(scheduler):
+    before = dict(EMBED_TEXTS.series)
+    embedder = engine(RecordingClient(), scheduler)
+    embedder.embed(TEXTS[:3], priority=BULK)
+    embedder.embed(TEXTS[:1], priority=INTERACTIVE)
+    assert EMBED_TEXTS.series[("ingest",)] - before.get(("ingest",), 0) == 3
+    assert EMBED_TEXTS.series[("query",)] - before.get(("query",), 0) == 1
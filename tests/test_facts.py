@@ -0,0 +1,66 @@
+import pytest
+from data_pipeline.catalog import Catalog
+from data_pipeline.facts import FactStore, fact_answer, normalize_table, page_facts
+
+APPLE = "aapl-20240928.pdf"
+INCOME_STATEMENT = [
+    ["", "Years ended", "", ""],
+    ["", "September 28, 2024", "September 30, 2023", "September 24, 2022"],
+    ["Net sales:", "", "", ""],
+    ["Products", "$ 294,866", "$ 298,085", "$ 316,199"],
+    ["Services", "96,169", "85,200", "78,129"],
+    ["Total net sales", "391,035", "383,285", "394,328"],
+    ["Operating income", "123,216", "114,301", "119,437"],
+    ["Other income/(expense), net", "(269)", "(565)", "(334)"],
+    ["Net income", "$ 93,736", "$ 96,995", "$ 99,803"],
+]
+
+@pytest.fixture
+def store(tmp_path):
+    store = FactStore(tmp_path / "facts.sqlite")
+    page = {"page_number": 28, "content": "(In millions, except per-share amounts)", "tables": [INCOME_STATEMENT]}
+    store.put_page(APPLE, 28, page_facts(page))
+    return store
+
+@pytest.fixture
+def catalog(tmp_path):
+    catalog = Catalog(tmp_path / "catalog.sqlite", by="none")
+    catalog.register(APPLE)
+    return catalog
+
+def ask(store, catalog, question):
+    return fact_answer(question, store.lookup(question), catalog)
+
+def test_normalize_table_reads_periods_units_and_negatives():
+    facts = normalize_table(INCOME_STATEMENT, "(In millions)")
+    by_key = {(f["item"], f["period"]): f for f in facts}
+    assert by_key[("total net sale", "2024")]["value"] == 391035
+    assert by_key[("other income expense net", "2023")]["value"] == -565
+    assert by_key[("product", "2022")]["column"] == "Years ended September 24, 2022"
+    assert {f["unit"] for f in facts} == {"millions"}
+
+def test_direct_answer_for_named_item_and_year(store, catalog):
+    direct = ask(store, catalog, "What was total net sales in 2024?")
+    assert direct["answer"].startswith("Total net sales (in millions): 391,035")
+    assert direct["sources"][0]["page"] == 28
+
+def test_issuer_named_in_question_must_match_the_document(store, catalog):
+    assert ask(store, catalog, "What was AAPL's total net sales in 2024?") is not None
+    # Only an Apple table is stored: a question about Tesla is not answered from it
+    question = "What was Tesla's total net sales in 2024?"
+    assert store.lookup(question)  # the rows still go into the prompt
+    assert ask(store, catalog, question) is None
+
+def test_unmatched_qualifier_is_not_dropped(store, catalog):
+    assert ask(store, catalog, "What was operating net income in 2024?") is None
+    assert ask(store, catalog, "What was net income in 2024?")["answer"].startswith("Net income (in millions): 93,736")
+
+def test_analysis_and_yearless_questions_are_not_answered(store, catalog):
+    assert ask(store, catalog, "Why did total net sales change in 2024?") is None
+    assert ask(store, catalog, "What was total net sales?") is None
+
+def test_lookup_respects_scope(store):
+    question = "total net sales in 2024"
+    assert store.lookup(question, sources=[]) == []
+    assert store.lookup(question, sources=["tsla-20241231.pdf"]) == []
+    assert [f["value"] for f in store.lookup(question, sources=[APPLE], page=28)] == [391035]
@@ -0,0 +1,43 @@
+from benchmarks.fakes import fake_vector
+from data_pipeline.indexing import Indexer
+from data_pipeline.lexical import BM25Index
+
+class FlakyEngine:
+    """Embeds like the fake client, but any request containing "bad" fails."""
+    batch_size = 2
+
+    def embed(self, texts):
+        if any("bad" in text for text in texts):
+            raise RuntimeError("embedding request failed")
+        return [fake_vector(text) for text in texts]
+
+class RecordingStore:
+    def __init__(self):
+        self.rows = {}
+
+    def upsert(self, ids, embeddings, documents, metadatas):
+        assert len(ids) == len(embeddings) == len(documents) == len(metadatas)
+        self.rows.update(zip(ids, zip(embeddings, documents)))
+
+def chunk(n: int, text: str) -> dict:
+    return {"chunk_id": f"c{n}", "text": text, "source": "report.pdf", "page": 1}
+
+def test_partial_failure_keeps_ids_texts_and_vectors_aligned(tmp_path):
+    flushes = []
+    store = RecordingStore()
+    indexer = Indexer(engine=FlakyEngine(), lexical=BM25Index(tmp_path / "lexical.sqlite"), store=store,
+                      on_flush=lambda *args: flushes.append(args))
+    texts = ["net sales grew", "services revenue", "a bad page", "gross margin", "operating income"]
+    indexer.index(iter(chunk(n, text) for n, text in enumerate(texts)))
+
+    # The whole batch failed, then each request-sized slice was retried: only [c2, c3] failed again
+    assert indexer.failed_ids == {"c2", "c3"}
+    assert sorted(store.rows) == ["c0", "c1", "c4"]
+    for cid, (vector, text) in store.rows.items():
+        assert text == texts[int(cid[1:])]
+        assert vector == fake_vector(text)
+
+    (batch, indexed, failed, error), = flushes
+    assert [c["chunk_id"] for c in indexed] == ["c0", "c1", "c4"]
+    assert [c["chunk_id"] for c in failed] == ["c2", "c3"]
+    assert error == "embedding request failed"
@@ -0,0 +1,18 @@
+import numpy as np
+from data_pipeline.mmap_store import MmapVectorStore
+
+def add(store, vectors, first: int = 0):
+    ids = [f"v{i}" for i in range(first, first + len(vectors))]
+    store.upsert(ids, vectors, [""] * len(ids), [{"source": "doc", "page": 1}] * len(ids))
+
+def test_ivf_trains_itself_once_the_store_is_big_enough(tmp_path):
+    vectors = np.random.default_rng(0).normal(size=(300, 16)).astype(np.float32)
+    store = MmapVectorStore(tmp_path / "vectors", ivf_auto_rows=200, ivf_nlist=8)
+    add(store, vectors[:150])
+    assert store._load_centroids() is None
+    add(store, vectors[150:], first=150)
+    assert store._load_centroids() is not None
+
+    result = store.query([vectors[42].tolist()], n_results=1)
+    assert result["ids"] == [["v42"]]
+    assert abs(result["distances"][0][0]) < 1e-3
@@ -0,0 +1,28 @@
+import pytest
+from data_pipeline.scheduler import BULK, INTERACTIVE, PRIORITIES, YIELD_POLL, SharedBuckets
+
+MODEL = "embedding"
+RPM = 6  # 0.1 tokens/s: nothing refills noticeably during a test
+INTERACTIVE_P, BULK_P = PRIORITIES.index(INTERACTIVE), PRIORITIES.index(BULK)
+
+@pytest.fixture
+def buckets(tmp_path):
+    # Capacity: 0.1 tokens/s * 100 s = 10 tokens; bulk must leave 5 of them
+    return SharedBuckets(tmp_path / "scheduler.sqlite", burst_seconds=100, bulk_reserve=0.5)
+
+def test_take_until_empty_then_wait(buckets):
+    assert all(buckets.take(MODEL, RPM, INTERACTIVE_P) == 0.0 for _ in range(10))
+    assert buckets.take(MODEL, RPM, INTERACTIVE_P) == pytest.approx(10.0, rel=0.05)  # one token at 0.1/s
+
+def test_bulk_leaves_the_reserve(buckets):
+    for _ in range(5):
+        assert buckets.take(MODEL, RPM, BULK_P) == 0.0  # 10 -> 5 tokens
+    assert buckets.take(MODEL, RPM, BULK_P) > 0.0      # needs cost + reserve = 6
+    assert buckets.take(MODEL, RPM, INTERACTIVE_P) == 0.0  # the reserve is for the others
+
+def test_bulk_holds_back_while_a_higher_class_waits(buckets):
+    buckets.publish_demand({(MODEL, INTERACTIVE_P): 1})
+    assert buckets.take(MODEL, RPM, BULK_P) >= YIELD_POLL
+    assert buckets.take(MODEL, RPM, INTERACTIVE_P) == 0.0  # waiting doesn't block its own class
+    buckets.publish_demand({})
+    assert buckets.take(MODEL, RPM, BULK_P) == 0.0
@@ -0,0 +1,22 @@
+import time
+from jobs import JobStore
+from worker import JobObserver, heartbeat
+
+def test_a_run_that_lost_its_job_stops_writing(tmp_path):
+    store = JobStore(tmp_path / "jobs.sqlite")
+    store.create("job", "upload.pdf", "doc", "hash")
+    assert store.claim("slow", max_running=1, stale_after=60)["id"] == "job"
+
+    with heartbeat(store, "job", "slow", interval=0.2) as lost:
+        # The worker stalled: its job went stale, back to the queue and on to another worker
+        assert store.claim("other", max_running=1, stale_after=0)["worker"] == "other"
+        assert not lost.is_set()
+        time.sleep(0.3)  # the next beat notices
+        assert lost.is_set()
+
+        observer = JobObserver("job", store, lost)
+        observer.on_progress("INDEXING", 10, "Processed 10 items...", 50.0)
+        observer.on_finish("upload.pdf", {"chunks": 10})
+    job = store.get("job")
+    assert job["status"] == "processing" and job["worker"] == "other"
+    assert store.events("job") == []